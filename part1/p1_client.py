@@ -2,14 +2,25 @@
 """
 Part 1 Client: Reliable UDP File Transfer
 Receives file with sliding window protocol and sends ACKs
+
+SegmentBitmap, BufferPool, FileSink and AckPolicy are copies of those in
+part2/p2_client.py, since each part is submitted and run as standalone
+scripts. Change both copies together; the Part 2 BufferPool also keeps
+each buffer's address for recvmmsg().
 """
 
 import socket
+import errno
 import sys
 import time
 import struct
 import logging
 import os
+import queue
+import threading
+import mmap
+import array
+import hashlib
 
 # Constants
 MAX_PAYLOAD = 1200
@@ -17,11 +28,319 @@ HEADER_SIZE = 20
 DATA_SIZE = MAX_PAYLOAD - HEADER_SIZE
 REQUEST_TIMEOUT = 2.0
 MAX_RETRIES = 5
+DATA_HEADER = struct.Struct('!IIB11x')  # seq_num + TSval + flags + 11 reserved bytes
+ACK_HEADER = struct.Struct('!I4HIH2x')  # ack_num + 2 SACK blocks (offset, length in segments) + TSecr + segments ACKed
+MAX_SACK_BLOCKS = 2
+WORD_MASK = (1 << 64) - 1  # A full word of SegmentBitmap
+ACK_EVERY = 2  # In-order segments per ACK
+ACK_DELAY = 0.01  # Longest an in-order segment waits for its ACK, in seconds
+IDLE_LIMIT = 10.0  # Give up after this long without a packet, in seconds
+POOL_SLAB = 256  # Receive buffers carved out of each slab allocation
+MAP_WINDOW = 8 * 1024 * 1024  # Bytes of the output file per mapping (a multiple of the mmap granularity)
+MAPPED_WINDOWS = 2  # Mappings kept open at once
+WRITE_QUEUE = 1024  # Segments the writer thread may fall behind by
+HASH_CHUNK = 256 * 1024  # In-order bytes fed to the digest at a time
+EOF_FLAG = 0x01  # Header flag: the segment is the EOF marker
+EOF_MARKER = b'EOF'  # EOF payload: the marker followed by the file's MD5 digest
+DIGEST_SIZE = 16
+
+class SegmentBitmap:
+    """Which segments have arrived above the cumulative ACK, one bit each.
+
+    Bit i stands for the segment at i * DATA_SIZE. The bits live in 64-bit
+    words covering a window that slides with the cumulative ACK, dropping
+    words wholly below it. The next hole is found a word at a time, and the
+    runs around the most recent arrivals are reported as SACK blocks,
+    newest first as in RFC 2018.
+    """
+    def __init__(self):
+        self.base = 0  # Cumulative ACK: everything below it has arrived
+        self.first_word = 0  # Word index of words[0]
+        self.words = array.array('Q')
+        self.count = 0  # Segments held above base
+        self.end = None  # End of the short final segment, once it arrives
+        self.recent = []  # Segments that most recently extended a run, newest first
+    
+    def __len__(self):
+        return self.count
+    
+    def add(self, seq_num, length):
+        """Record an arrival; returns False if the segment arrived before. A
+        segment at base slides it past the run it joins"""
+        if seq_num < self.base:
+            return False
+        index = seq_num // DATA_SIZE
+        w = (index >> 6) - self.first_word
+        if w >= len(self.words):
+            self.words.frombytes(bytes(8 * (w + 1 - len(self.words))))
+        bit = 1 << (index & 63)
+        if self.words[w] & bit:
+            return False
+        self.words[w] |= bit
+        if length < DATA_SIZE:
+            self.end = seq_num + length
+        
+        if seq_num == self.base:
+            self.slide(index)
+        else:
+            self.count += 1
+            if self.recent and self.recent[0] == index - 1:
+                self.recent[0] = index  # Extends the newest run
+            else:
+                self.recent = [index] + [i for i in self.recent[:MAX_SACK_BLOCKS + 1] if i != index]
+        return True
+    
+    def slide(self, index):
+        """Move base past the run of arrived segments starting at index"""
+        hole = self.next_hole(index)
+        self.count -= hole - index - 1
+        drop = (hole >> 6) - self.first_word
+        if drop > 0:
+            del self.words[:drop]
+            self.first_word += drop
+        self.base = hole * DATA_SIZE
+        if self.end is not None and self.base > self.end:
+            self.base = self.end
+    
+    def next_hole(self, index):
+        """First segment at or above index that has not arrived"""
+        w = (index >> 6) - self.first_word
+        word = (self.words[w] if w < len(self.words) else 0) | ((1 << (index & 63)) - 1)
+        while word == WORD_MASK:
+            w += 1
+            word = self.words[w] if w < len(self.words) else 0
+        # Lowest clear bit
+        return ((w + self.first_word) << 6) + ((word + 1) & ~word).bit_length() - 1
+    
+    def run_start(self, index):
+        """First segment of the run of arrived segments holding index"""
+        w = (index >> 6) - self.first_word
+        below = (1 << (index & 63)) - 1
+        # The segment at base is always missing, so this stops there at the latest
+        while w >= 0:
+            holes = ~self.words[w] & below
+            if holes:
+                return ((w + self.first_word) << 6) + holes.bit_length()
+            w -= 1
+            below = WORD_MASK
+        return self.first_word << 6
+    
+    def blocks(self):
+        """Up to MAX_SACK_BLOCKS (start, end) runs, most recently extended first"""
+        blocks = []
+        for index in self.recent:
+            if index * DATA_SIZE < self.base:
+                continue
+            end = self.next_hole(index) * DATA_SIZE
+            if self.end is not None:
+                end = min(end, self.end)
+            block = (self.run_start(index) * DATA_SIZE, end)
+            if block not in blocks:
+                blocks.append(block)
+                if len(blocks) == MAX_SACK_BLOCKS:
+                    break
+        return blocks
+
+class BufferPool:
+    """MAX_PAYLOAD-byte receive buffers carved out of large slabs.
+
+    Datagrams are read straight into a free buffer with recv_into() and
+    handed on as memoryviews, so a payload is never copied before it is
+    written out. A buffer whose data is dropped goes back on the free list,
+    one holding stored data stays with it, and a new slab is allocated only
+    when the free list runs dry: one allocation per POOL_SLAB datagrams.
+    """
+    def __init__(self, slab_buffers=POOL_SLAB):
+        self.slab_buffers = slab_buffers
+        self.free = []
+        self.slabs = 0
+    
+    def get(self):
+        """Take a free buffer"""
+        if not self.free:
+            self.grow()
+        return self.free.pop()
+    
+    def put(self, buffer):
+        """Return a buffer whose contents are no longer referenced (None,
+        for a packet read outside the pool, is ignored)"""
+        if buffer is not None:
+            self.free.append(buffer)
+    
+    def grow(self):
+        """Allocate another slab and split it into buffers"""
+        view = memoryview(bytearray(self.slab_buffers * MAX_PAYLOAD))
+        self.free.extend(view[i:i + MAX_PAYLOAD] for i in range(0, len(view), MAX_PAYLOAD))
+        self.slabs += 1
+
+class FileSink:
+    """Copies every segment to its offset in a memory-mapped output file.
+
+    Each payload, in order or not, is copied straight into a mapping of the
+    file and the kernel writes the pages back, so the client holds no file
+    data itself. The size is not known up front: the file grows MAP_WINDOW
+    bytes at a time ahead of the furthest segment, with the space reserved
+    by posix_fallocate() where supported so a full disk fails the write
+    rather than a page fault, and is cut to its real size on close. At most
+    MAPPED_WINDOWS windows stay mapped. With threaded=True the copies run on
+    a writer thread behind a bounded queue, so page faults only stall the
+    receive loop once WRITE_QUEUE segments are waiting. Pool buffers go
+    back to the pool once their segment is copied.
+
+    The bytes delivered in order are fed to an MD5 digest from the mapping,
+    HASH_CHUNK at a time while their pages are still resident, so the file
+    never has to be read back to check it against the server's digest.
+    """
+    def __init__(self, filename, pool=None, threaded=False):
+        self.fd = os.open(filename, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.pool = pool
+        self.size = 0  # End of the furthest segment
+        self.allocated = 0
+        self.windows = {}  # window index -> mmap, least recently used first
+        self.error = None  # First error hit by the writer thread
+        self.digest = hashlib.md5()
+        self.hashed = 0  # Bytes fed to the digest
+        self.delivered = 0  # End of the in-order data
+        self.queue = None
+        if threaded:
+            self.queue = queue.Queue(WRITE_QUEUE)
+            self.thread = threading.Thread(target=self.writer, daemon=True)
+            self.thread.start()
+    
+    def write(self, offset, data, buffer=None, delivered=0):
+        """Copy data to offset, then release its pool buffer; delivered is
+        the end of the in-order data once this segment is in"""
+        self.size = max(self.size, offset + len(data))
+        self.delivered = max(self.delivered, delivered)
+        if self.queue is not None:
+            self.queue.put((offset, data, buffer, delivered))
+        else:
+            self.copy(offset, data, buffer, delivered)
+    
+    def copy(self, offset, data, buffer, delivered=0):
+        """Copy one segment into the mapping, across a window edge if need
+        be, then hash the in-order data once HASH_CHUNK bytes are pending"""
+        end = offset + len(data)
+        if end > self.allocated:
+            self.grow(end)
+        while offset < end:
+            index, start = divmod(offset, MAP_WINDOW)
+            count = min(end - offset, MAP_WINDOW - start)
+            self.window(index)[start:start + count] = data[:count]
+            data = data[count:]
+            offset += count
+        if self.pool is not None:
+            self.pool.put(buffer)
+        if delivered - self.hashed >= HASH_CHUNK:
+            self.hash(delivered)
+    
+    def hash(self, end):
+        """Feed the in-order bytes up to end to the digest"""
+        while self.hashed < end:
+            index, start = divmod(self.hashed, MAP_WINDOW)
+            count = min(end - self.hashed, MAP_WINDOW - start)
+            self.digest.update(self.window(index)[start:start + count])
+            self.hashed += count
+    
+    def grow(self, end):
+        """Extend the file to the next MAP_WINDOW boundary past end"""
+        target = (end // MAP_WINDOW + 1) * MAP_WINDOW
+        try:
+            os.posix_fallocate(self.fd, self.allocated, target - self.allocated)
+        except AttributeError:
+            os.ftruncate(self.fd, target)  # Not available on this platform
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            os.ftruncate(self.fd, target)  # Not supported by the filesystem
+        self.allocated = target
+    
+    def window(self, index):
+        """The mapping of window index, unmapping the least recently used
+        one to make room if needed"""
+        window = self.windows.pop(index, None)
+        if window is None:
+            if len(self.windows) >= MAPPED_WINDOWS:
+                self.windows.pop(next(iter(self.windows))).close()
+            window = mmap.mmap(self.fd, MAP_WINDOW, offset=index * MAP_WINDOW)
+        self.windows[index] = window
+        return window
+    
+    def writer(self):
+        """Writer thread: copy queued segments until close() queues None"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self.copy(*item)
+                except OSError as e:
+                    self.error = e
+    
+    def close(self):
+        """Finish queued copies and the digest, unmap the file, cut it to its
+        size and close it; raises the writer thread's error, if any"""
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+        try:
+            if self.error is None:
+                self.hash(self.delivered)
+            for window in self.windows.values():
+                window.close()
+            self.windows = {}
+            if self.error is not None:
+                raise self.error
+            os.ftruncate(self.fd, self.size)
+        finally:
+            os.close(self.fd)
+
+class AckPolicy:
+    """Delayed ACKs (RFC 5681, section 4.2).
+
+    In-order data is ACKed every ack_every segments, or ACK_DELAY after the
+    first unacknowledged one. Anything else (out-of-order, duplicate or
+    hole-filling segments) is ACKed at once, so the sender's loss detection
+    is not slowed down. Each ACK echoes the TSval of the oldest segment it
+    covers (RFC 7323) and reports how many segments it covers.
+    """
+    def __init__(self, ack_every=ACK_EVERY, delay=ACK_DELAY):
+        self.ack_every = ack_every
+        self.delay = delay
+        self.pending = 0  # Segments received since the last ACK
+        self.tsecr = 0  # TSval to echo
+        self.deadline = None  # When the delayed ACK is due
+        self.acks_sent = 0
+        self.segments = 0
+    
+    def on_segment(self, tsval, in_order):
+        """Count a received segment; returns True if it must be ACKed now"""
+        if self.pending == 0:
+            self.tsecr = tsval
+            self.deadline = time.time() + self.delay
+        self.pending += 1
+        self.segments += 1
+        return not in_order or self.pending >= self.ack_every
+    
+    def due(self):
+        """True if a delayed ACK is pending and its timer has expired"""
+        return self.pending > 0 and time.time() >= self.deadline
+    
+    def on_ack_sent(self):
+        """An ACK covering every pending segment went out; returns
+        (tsecr, segments covered)"""
+        covered = (self.tsecr, self.pending)
+        self.pending = 0
+        self.deadline = None
+        self.acks_sent += 1
+        return covered
 
 class ReliableUDPClient:
-    def __init__(self, server_ip, server_port):
+    def __init__(self, server_ip, server_port, writer_thread=False):
         self.server_ip = server_ip
         self.server_port = server_port
+        self.writer_thread = writer_thread  # Write to disk off the receive loop
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.settimeout(REQUEST_TIMEOUT)
         
@@ -54,18 +373,38 @@ class ReliableUDPClient:
         self.logger.addHandler(file_handler)
     
     def parse_packet(self, packet):
-        """Parse packet to extract chunk index and payload"""
+        """Parse packet to extract chunk index, sender timestamp, header flags
+        and payload; the payload is a view into packet when packet is a
+        memoryview"""
         if len(packet) < HEADER_SIZE:
-            return None, None
+            return None, 0, 0, None
         
-        chunk_idx = struct.unpack('!I', packet[:4])[0]
+        chunk_idx, tsval, flags = DATA_HEADER.unpack_from(packet)
         data = packet[HEADER_SIZE:]
-        return chunk_idx, data
+        return chunk_idx, tsval, flags, data
     
-    def create_ack(self, ack_num):
-        """Create selective ACK packet for a specific chunk index"""
-        # ACK packet: 4 bytes chunk index + 16 bytes reserved (no data)
-        return struct.pack('!I', ack_num) + b'\x00' * 16
+    def create_ack(self, ack_num, sack_blocks=(), tsecr=0, segments=0):
+        """Create ACK packet: cumulative ACK, up to two SACK blocks, TSecr
+        and the number of segments it acknowledges"""
+        # ACK packet: 4 bytes ack_num, then each SACK block as (offset past
+        # ack_num, length) in segments; length 0 marks an unused block.
+        # TSecr echoes the TSval of the packet being acknowledged (0 = none)
+        fields = [0] * (2 * MAX_SACK_BLOCKS)
+        for i, (start, end) in enumerate(sack_blocks):
+            offset = (start - ack_num) // DATA_SIZE
+            length = (end - start + DATA_SIZE - 1) // DATA_SIZE
+            if offset + length > 0xFFFF:
+                break
+            fields[2 * i] = offset
+            fields[2 * i + 1] = length
+        return ACK_HEADER.pack(ack_num, *fields, tsecr, segments)
+    
+    def send_ack(self, ack_num, sack_blocks, acks):
+        """Acknowledge every segment received so far"""
+        tsecr, segments = acks.on_ack_sent()
+        ack = self.create_ack(ack_num, sack_blocks, tsecr, segments)
+        self.sock.sendto(ack, (self.server_ip, self.server_port))
+        self.logger.debug(f"SEND: ACK seq={ack_num} for {segments} segments")
     
     def send_request(self):
         """Send file request to server with retries"""
@@ -106,30 +445,38 @@ class ReliableUDPClient:
         if first_packet is None:
             return False
         
-        # Set socket to non-blocking for receiving
-        self.sock.settimeout(0.5)
+        # Wake up often enough to send delayed ACKs; the timeout is never
+        # changed afterwards, which would cost a syscall per packet
+        self.sock.settimeout(ACK_DELAY)
         
         start_time = time.time()
         expected_chunk = 0
-        pending_chunks = {}
-        ordered_data = []
-        highest_contiguous = -1
+        received = SegmentBitmap()  # Chunks that arrived above expected_chunk, reported as SACK blocks
+        acks = AckPolicy()
+        pool = BufferPool()
+        try:
+            sink = FileSink(output_filename, pool, self.writer_thread)
+        except OSError as e:
+            print(f"Error opening output file: {e}")
+            self.logger.error(f"Error opening output file: {e}")
+            return False
 
         # Process first packet
-        packets_to_process = [first_packet]
+        packets_to_process = [(first_packet, None)]
         last_ack_time = time.time()
-        consecutive_timeouts = 0
+        last_packet_time = time.time()
 
         while True:
             # Process any pending packets
-            for packet in packets_to_process:
-                chunk_idx, data = self.parse_packet(packet)
+            for packet, buffer in packets_to_process:
+                chunk_idx, tsval, flags, data = self.parse_packet(packet)
 
                 if chunk_idx is None:
+                    pool.put(buffer)
                     continue
 
-                # Check for EOF
-                if data == b'EOF':
+                # Check for EOF: flagged in the header, the payload carries the server's digest
+                if flags & EOF_FLAG and len(data) == len(EOF_MARKER) + DIGEST_SIZE:
                     print("Received EOF marker")
                     self.logger.info(f"RECV: EOF marker at seq={chunk_idx}")
                     final_ack = self.create_ack(chunk_idx)
@@ -137,82 +484,104 @@ class ReliableUDPClient:
                         self.sock.sendto(final_ack, (self.server_ip, self.server_port))
                         self.logger.debug(f"SEND: ACK seq={chunk_idx} (for EOF)")
 
-                    # Flush any final in-order chunks before writing
-                    while expected_chunk in pending_chunks:
-                        ordered_data.append(pending_chunks.pop(expected_chunk))
-                        highest_contiguous = expected_chunk
-                        expected_chunk += 1
-
                     try:
-                        with open(output_filename, 'wb') as f:
-                            f.write(b''.join(ordered_data))
+                        sink.close()
 
                         duration = time.time() - start_time
-                        total_bytes = sum(len(d) for d in ordered_data)
+                        total_bytes = sink.size
                         print(f"File received successfully: {total_bytes} bytes in {duration:.2f}s")
                         print(f"Throughput: {(total_bytes * 8 / duration / 1_000_000):.2f} Mbps")
                         self.logger.info(f"File received successfully: {total_bytes} bytes in {duration:.2f}s")
                         self.logger.info(f"Throughput: {(total_bytes * 8 / duration / 1_000_000):.2f} Mbps")
-                        return True
+                        print(f"ACKs sent: {acks.acks_sent} for {acks.segments} segments")
+                        self.logger.info(f"ACKs sent: {acks.acks_sent} for {acks.segments} segments")
+                        return self.check_digest(output_filename, sink.digest.digest(),
+                                                 bytes(data[len(EOF_MARKER):]))
                     except Exception as e:
                         print(f"Error writing file: {e}")
                         self.logger.error(f"Error writing file: {e}")
                         return False
 
                 # Handle data chunk
-                if chunk_idx < expected_chunk:
-                    # Send cumulative ACK for duplicate packet
-                    ack = self.create_ack(expected_chunk)
-                    self.sock.sendto(ack, (self.server_ip, self.server_port))
-                    self.logger.debug(f"RECV: Duplicate data seq={chunk_idx}, SEND: ACK seq={expected_chunk}")
+                prior_expected = expected_chunk
+                had_gap = bool(received)
+                if not received.add(chunk_idx, len(data)):
+                    # Send cumulative ACK for duplicate packet at once
+                    self.logger.debug(f"RECV: Duplicate data seq={chunk_idx}")
+                    pool.put(buffer)
+                    acks.on_segment(tsval, False)
+                    self.send_ack(expected_chunk, received.blocks(), acks)
                     last_ack_time = time.time()
                     continue
 
-                if chunk_idx not in pending_chunks:
-                    pending_chunks[chunk_idx] = data
-                    if data:
-                        self.logger.debug(f"RECV: Data seq={chunk_idx} size={len(data)} bytes")
-                    else:
-                        self.logger.debug(f"RECV: Data seq={chunk_idx} (empty)")
-
-                # Deliver any newly in-order data to the output buffer
-                while expected_chunk in pending_chunks:
-                    ordered_data.append(pending_chunks.pop(expected_chunk))
-                    highest_contiguous = expected_chunk
-                    expected_chunk += DATA_SIZE
-                
-                # Send cumulative ACK with next expected sequence number
-                ack = self.create_ack(expected_chunk)
-                self.sock.sendto(ack, (self.server_ip, self.server_port))
-                self.logger.debug(f"SEND: ACK seq={expected_chunk} (next expected)")
-                last_ack_time = time.time()
+                # Straight to its offset in the file, in order or not; a
+                # chunk filling the hole at expected_chunk moves it past
+                # every chunk that arrived early
+                expected_chunk = received.base
+                sink.write(chunk_idx, data, buffer, expected_chunk)
+                if data:
+                    self.logger.debug(f"RECV: Data seq={chunk_idx} size={len(data)} bytes")
+                else:
+                    self.logger.debug(f"RECV: Data seq={chunk_idx} (empty)")
+
+                # Send cumulative ACK with next expected sequence number: now,
+                # unless this just extended gap-free in-order data
+                in_order = expected_chunk > prior_expected and not had_gap and not received
+                if acks.on_segment(tsval, in_order):
+                    self.send_ack(expected_chunk, received.blocks(), acks)
+                    last_ack_time = time.time()
 
             packets_to_process = []
+            if acks.due():
+                self.send_ack(expected_chunk, received.blocks(), acks)
+                last_ack_time = time.time()
 
-            # Try to receive more packets
+            # Try to receive more packets, straight into a pooled buffer
+            buffer = pool.get()
             try:
-                packet, _ = self.sock.recvfrom(MAX_PAYLOAD)
-                packets_to_process.append(packet)
-                consecutive_timeouts = 0
+                length = self.sock.recv_into(buffer)
+                packets_to_process.append((buffer[:length], buffer))
+                last_packet_time = time.time()
             except socket.timeout:
-                consecutive_timeouts += 1
-                self.logger.debug(f"TIMEOUT: consecutive_timeouts={consecutive_timeouts}")
+                pool.put(buffer)
+                if acks.pending:
+                    # No more data is coming right now: don't hold the ACK back
+                    self.send_ack(expected_chunk, received.blocks(), acks)
+                    last_ack_time = time.time()
 
                 # Re-acknowledge the next expected sequence to prompt retransmission
-                if time.time() - last_ack_time > 0.2:
-                    ack = self.create_ack(expected_chunk)
+                elif time.time() - last_ack_time > 0.2:
+                    ack = self.create_ack(expected_chunk, received.blocks())
                     self.sock.sendto(ack, (self.server_ip, self.server_port))
                     self.logger.debug(f"SEND: Duplicate ACK seq={expected_chunk} (timeout)")
                     last_ack_time = time.time()
 
-                # If too many consecutive timeouts, assume transfer is done
-                if consecutive_timeouts > 20:
+                # If silent for too long, assume transfer is done
+                if time.time() - last_packet_time > IDLE_LIMIT:
                     print("Transfer appears to be complete (timeout)")
                     self.logger.info("Transfer appears to be complete (timeout)")
                     break
 
+        # Without the EOF marker the file is incomplete: don't leave it behind
+        try:
+            sink.close()
+            os.remove(output_filename)
+        except OSError:
+            pass
         return False
     
+    def check_digest(self, filename, received, expected):
+        """Print the machine-readable integrity line for filename; True if
+        the digests match"""
+        status = 'ok' if received == expected else 'mismatch'
+        line = f"DIGEST file={filename} md5={received.hex()} expected={expected.hex()} status={status}"
+        print(line)
+        if received == expected:
+            self.logger.info(line)
+        else:
+            self.logger.error(line)
+        return received == expected
+    
     def run(self):
         """Main client loop"""
         success = self.receive_file('received_data.txt')
@@ -226,14 +595,14 @@ class ReliableUDPClient:
             self.logger.error("Client finished with errors")
 
 def main():
-    if len(sys.argv) != 3:
-        print("Usage: python3 p1_client.py <SERVER_IP> <SERVER_PORT>")
+    if len(sys.argv) < 3 or sys.argv[3:] not in ([], ['--writer-thread']):
+        print("Usage: python3 p1_client.py <SERVER_IP> <SERVER_PORT> [--writer-thread]")
         sys.exit(1)
     
     server_ip = sys.argv[1]
     server_port = int(sys.argv[2])
     
-    client = ReliableUDPClient(server_ip, server_port)
+    client = ReliableUDPClient(server_ip, server_port, writer_thread='--writer-thread' in sys.argv[3:])
     client.run()
 
 if __name__ == "__main__":
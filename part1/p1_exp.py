@@ -8,7 +8,6 @@ from mininet.node import Controller
 
 import time, re, os
 import sys
-import hashlib
 
 class CustomTopo(Topo):
     def build(self, loss, delay, jitter):
@@ -26,17 +25,18 @@ class CustomTopo(Topo):
         self.addLink(h2, s1, loss=0)
 
 
-def compute_md5(file_path):
-    hasher = hashlib.md5()
+def read_md5(output_path):
+    # The client hashes the file as it arrives and prints a DIGEST line
+    # once it has checked it against the server's, so no re-read is needed
     try:
-        with open(file_path, 'rb') as file:
-            # Read the file in chunks to avoid using too much memory for large files
-            while chunk := file.read(8192):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+        with open(output_path) as file:
+            for line in file:
+                match = re.match(r"DIGEST .*md5=([0-9a-f]{32}) ", line)
+                if match:
+                    return match.group(1)
     except FileNotFoundError:
-        print(f"File not found: {file_path}")
-        return None
+        print(f"File not found: {output_path}")
+    return None
 
 
 def run(expname):
@@ -111,7 +111,7 @@ def run(expname):
                     h1.cmd("cp /tmp/h1_server.out ./h1_server.out 2>/dev/null || true")
                     h2.cmd("cp /tmp/h2_client.out ./h2_client.out 2>/dev/null || true")
                     
-                    md5_hash = compute_md5(OUTFILE)
+                    md5_hash = read_md5("./h2_client.out")
                     # write the result to a file
                     f_out.write(f"{i},{LOSS},{DELAY},{JITTER},{md5_hash},{ttc}\n")
                     print(f"---------------------\n{i},{LOSS},{DELAY},{JITTER},{ttc}\n---------------------\n")
@@ -2,6 +2,14 @@
 """
 Part 1 Server: Reliable UDP File Transfer
 Implements sliding window protocol with ACKs, timeouts, and fast retransmit
+
+The send-side components (BatchSender, Segment, InFlightWindow,
+RetransmitQueue, SackScoreboard, RtoEstimator, RackTlp, parse_options and
+the digest and timestamp helpers) are copies of those in part2/p2_server.py,
+since each part is submitted and run as standalone scripts. Change both
+copies together. The Part 2 copies add GSO and FEC parity to BatchSender,
+delivery-rate and FEC fields to Segment, and make
+SackScoreboard.ack_through() return the SACKed bytes it drops.
 """
 
 import socket
@@ -10,42 +18,520 @@ import time
 import struct
 import os
 import logging
+import selectors
+import heapq
+import mmap
+import ctypes
+import errno
+import hashlib
 
 # Constants
 MAX_PAYLOAD = 1200
 HEADER_SIZE = 20
 DATA_SIZE = MAX_PAYLOAD - HEADER_SIZE  # 1180 bytes
 INITIAL_TIMEOUT = 1.0
+MIN_RTO = 0.1  # Default RTO bounds, in seconds
+MAX_RTO = 2.0
 ALPHA = 1/8
 BETA = 1/4
 K = 4
+DATA_HEADER = struct.Struct('!IIB11x')  # seq_num + TSval + flags + 11 reserved bytes
+ACK_HEADER = struct.Struct('!I4HIH2x')  # ack_num + 2 SACK blocks (offset, length in segments) + TSecr + segments ACKed
+SACK_DUP_THRESH = 3  # A hole is lost once this many segments above it are SACKed
+MAX_ACK_DELAY = 0.01  # Longest the client holds back a delayed ACK, in seconds
+SEND_BATCH = 256  # Max segments handed to the kernel per sendmmsg()
+ECHO_SLACK = 0.001  # TSval and Segment.send_time are taken this far apart at most
+RETRANSMIT_CAUSES = ('timeout', 'fast', 'sack', 'rack', 'tlp')
+EOF_FLAG = 0x01  # Header flag: the segment is the EOF marker
+EOF_MARKER = b'EOF'  # EOF payload: the marker followed by the file's MD5 digest
+
+# sendmmsg(2) through ctypes; None where libc does not provide it
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _sendmmsg = _libc.sendmmsg
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+except (OSError, AttributeError):
+    _sendmmsg = None
+
+_digests = {}  # filename -> (mtime_ns, size, MD5 digest)
+
+def file_digest(filename):
+    """MD5 digest of filename for the EOF segment, recomputed only when its
+    modification time or size changes"""
+    st = os.stat(filename)
+    cached = _digests.get(filename)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    hasher = hashlib.md5()
+    with open(filename, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+    _digests[filename] = (st.st_mtime_ns, st.st_size, hasher.digest())
+    return hasher.digest()
+
+def timestamp():
+    """Current time as a 32-bit microsecond TSval; never 0, which means 'none'"""
+    return (int(time.time() * 1_000_000) & 0xFFFFFFFF) or 1
+
+def timestamp_age(tsecr):
+    """Seconds since the echoed TSval was sent (wraps every ~71 minutes)"""
+    return ((timestamp() - tsecr) & 0xFFFFFFFF) / 1_000_000
+
+def echo_predates(tsecr, send_time):
+    """True if the echoed TSval was sent before send_time: the ACK was
+    triggered by an earlier transmission (Eifel detection, RFC 3522)"""
+    return time.time() - timestamp_age(tsecr) < send_time - ECHO_SLACK
+
+class IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.c_void_p), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', ctypes.c_uint)]
+
+class SockAddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_uint8 * 4), ('sin_zero', ctypes.c_uint8 * 8)]
+
+class BatchSender:
+    """Sends data segments straight from the file mapping.
+
+    Segments queued while filling the window are pushed to the kernel with a
+    single sendmmsg() per batch, each message gathering a header slot and a
+    slice of the mapping. Without sendmmsg it falls back to one sendmsg() per
+    segment. Every send syscall is counted in self.syscalls.
+    """
+    def __init__(self, sock, capacity=SEND_BATCH):
+        self.sock = sock
+        self.capacity = capacity
+        self.syscalls = 0
+        self.pending = []  # (seq_num, length) waiting for flush()
+        self.client_addr = None
+        self.file_view = memoryview(b'')
+        self.header = bytearray(HEADER_SIZE)  # Reused for single sends
+        self.use_mmsg = _sendmmsg is not None
+        if self.use_mmsg:
+            self.addr = SockAddrIn()
+            self.headers = (ctypes.c_char * (capacity * HEADER_SIZE))()
+            self.iov = (IoVec * (2 * capacity))()
+            self.msgs = (MMsgHdr * capacity)()
+            headers_base = ctypes.addressof(self.headers)
+            iov_base = ctypes.addressof(self.iov)
+            for i in range(capacity):
+                self.iov[2 * i].iov_base = headers_base + i * HEADER_SIZE
+                self.iov[2 * i].iov_len = HEADER_SIZE
+                hdr = self.msgs[i].msg_hdr
+                hdr.msg_name = ctypes.addressof(self.addr)
+                hdr.msg_namelen = ctypes.sizeof(SockAddrIn)
+                hdr.msg_iov = iov_base + 2 * i * ctypes.sizeof(IoVec)
+                hdr.msg_iovlen = 2
+        self.mapping_ref = None
+        self.mapping_base = 0
+    
+    def start(self, mapping, client_addr):
+        """Point the sender at a new file mapping and destination"""
+        self.client_addr = client_addr
+        self.file_view = memoryview(mapping) if mapping is not None else memoryview(b'')
+        if self.use_mmsg:
+            ip, port = client_addr
+            self.addr.sin_family = socket.AF_INET
+            self.addr.sin_port = socket.htons(port)
+            self.addr.sin_addr[:] = socket.inet_aton(ip)
+            if mapping is not None:
+                # Needs a writable (ACCESS_COPY) mapping; pins it until finish()
+                self.mapping_ref = ctypes.c_char.from_buffer(mapping)
+                self.mapping_base = ctypes.addressof(self.mapping_ref)
+    
+    def finish(self):
+        """Release every reference to the mapping so it can be closed"""
+        self.flush()
+        self.file_view.release()
+        self.file_view = memoryview(b'')
+        self.mapping_ref = None
+        self.mapping_base = 0
+    
+    def send(self, seq_num, length):
+        """Send one segment immediately with sendmsg()"""
+        DATA_HEADER.pack_into(self.header, 0, seq_num, timestamp(), 0)
+        payload = self.file_view[seq_num:seq_num + length]
+        self.sock.sendmsg([self.header, payload], (), 0, self.client_addr)
+        self.syscalls += 1
+    
+    def queue(self, seq_num, length):
+        """Queue a segment for the next batch, flushing when the batch is full"""
+        self.pending.append((seq_num, length))
+        if len(self.pending) >= self.capacity:
+            self.flush()
+    
+    def flush(self):
+        """Hand every queued segment to the kernel"""
+        pending = self.pending
+        if not pending:
+            return
+        self.pending = []
+        if not self.use_mmsg:
+            for seq_num, length in pending:
+                self.send(seq_num, length)
+            return
+        
+        iov = self.iov
+        tsval = timestamp()
+        for i, (seq_num, length) in enumerate(pending):
+            DATA_HEADER.pack_into(self.headers, i * HEADER_SIZE, seq_num, tsval, 0)
+            iov[2 * i + 1].iov_base = self.mapping_base + seq_num
+            iov[2 * i + 1].iov_len = length
+        
+        sent = 0
+        fd = self.sock.fileno()
+        msgs_base = ctypes.addressof(self.msgs)
+        while sent < len(pending):
+            result = _sendmmsg(fd, msgs_base + sent * ctypes.sizeof(MMsgHdr), len(pending) - sent, 0)
+            self.syscalls += 1
+            if result < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                raise OSError(err, os.strerror(err))
+            sent += result
+
+class Segment:
+    """Book-keeping for one in-flight segment"""
+    __slots__ = ('seq', 'length', 'send_time', 'retransmits', 'sacked')
+    
+    def __init__(self, seq, length, send_time):
+        self.seq = seq
+        self.length = length
+        self.send_time = send_time
+        self.retransmits = 0
+        self.sacked = False
+
+class InFlightWindow:
+    """In-flight segments in sequence order, stored as a list with a moving head.
+
+    Segments are DATA_SIZE bytes apart, so a segment is found by offset from
+    the head, and a cumulative ACK just advances the head past the prefix.
+    """
+    def __init__(self):
+        self.slots = []
+        self.head = 0
+    
+    def __len__(self):
+        return len(self.slots) - self.head
+    
+    def append(self, segment):
+        """Add the segment just sent past the current right edge"""
+        self.slots.append(segment)
+    
+    def get(self, seq_num):
+        """Return the in-flight segment starting at seq_num, or None"""
+        if self.head == len(self.slots):
+            return None
+        idx = self.head + (seq_num - self.slots[self.head].seq) // DATA_SIZE
+        if self.head <= idx < len(self.slots):
+            segment = self.slots[idx]
+            if segment.seq == seq_num:
+                return segment
+        return None
+    
+    def ack_through(self, ack_num):
+        """Release every segment that starts below the cumulative ACK"""
+        slots = self.slots
+        head = self.head
+        end = len(slots)
+        while head < end and slots[head].seq < ack_num:
+            slots[head] = None
+            head += 1
+        # Compact once the released prefix dominates the list
+        if head > 1024 and head * 2 > end:
+            del slots[:head]
+            head = 0
+        self.head = head
+
+class RetransmitQueue:
+    """Min-heap of (send_time, seq) over the in-flight window with lazy deletion.
+
+    Entries are never removed when a segment is ACKed or retransmitted; a
+    heap entry is simply ignored once it no longer matches the segment's
+    current send time, so expiry checks cost O(expired) instead of a scan
+    of the whole window.
+    """
+    def __init__(self, packets):
+        self.packets = packets  # InFlightWindow
+        self.heap = []
+    
+    def push(self, segment):
+        """Arm the timer for a segment that was just (re)transmitted"""
+        heapq.heappush(self.heap, (segment.send_time, segment.seq))
+    
+    def discard_stale(self):
+        """Drop entries for segments that were ACKed, SACKed or re-armed since"""
+        heap = self.heap
+        while heap:
+            send_time, seq_num = heap[0]
+            segment = self.packets.get(seq_num)
+            if segment is not None and segment.send_time == send_time and not segment.sacked:
+                return
+            heapq.heappop(heap)
+    
+    def oldest_send_time(self):
+        """Send time of the oldest in-flight segment (None if nothing in flight)"""
+        self.discard_stale()
+        return self.heap[0][0] if self.heap else None
+    
+    def pop_expired(self, deadline):
+        """Pop the oldest segment sent at or before deadline, or None"""
+        self.discard_stale()
+        if self.heap and self.heap[0][0] <= deadline:
+            return self.packets.get(heapq.heappop(self.heap)[1])
+        return None
+
+class SackScoreboard:
+    """Byte ranges the receiver has reported in SACK blocks.
+
+    A short sorted list of disjoint [start, end) ranges above the cumulative
+    ACK. update() returns only the newly covered pieces, so each segment is
+    marked once however often the receiver repeats a block.
+    """
+    def __init__(self):
+        self.ranges = []
+        self.high = 0  # Highest SACKed byte
+    
+    def update(self, start, end):
+        """Merge [start, end) in; returns the pieces not SACKed before"""
+        if start >= end:
+            # A stale block, already below the cumulative ACK
+            return []
+        new_pieces = []
+        kept = []
+        cursor = start
+        merged_start, merged_end = start, end
+        for range_start, range_end in self.ranges:
+            if range_end < start or range_start > end:
+                kept.append((range_start, range_end))
+                continue
+            # Overlapping or adjacent: the gap before it is new
+            if range_start > cursor:
+                new_pieces.append((cursor, range_start))
+            cursor = max(cursor, range_end)
+            merged_start = min(merged_start, range_start)
+            merged_end = max(merged_end, range_end)
+        if cursor < end:
+            new_pieces.append((cursor, end))
+        kept.append((merged_start, merged_end))
+        kept.sort()
+        self.ranges = kept
+        self.high = max(self.high, end)
+        return new_pieces
+    
+    def sacked_bytes(self):
+        """Bytes SACKed above the cumulative ACK"""
+        return sum(end - start for start, end in self.ranges)
+    
+    def ack_through(self, ack_num):
+        """Drop everything below the cumulative ACK"""
+        if self.ranges and self.ranges[0][0] < ack_num:
+            self.ranges = [(max(start, ack_num), end) for start, end in self.ranges if end > ack_num]
+
+class RtoEstimator:
+    """Retransmission timeout after RFC 6298.
+
+    SRTT/RTTVAR are seeded from the first sample and smoothed after it;
+    with a timestamp sample on every ACK the gains are divided by the
+    number of ACKs expected per RTT (RFC 7323, Appendix G). Each timeout
+    doubles the RTO until the next valid sample (Karn's rule: the caller
+    never feeds samples whose transmission is ambiguous). A timeout that
+    proves spurious gives its backoff back.
+    """
+    def __init__(self, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = -1  # No sample yet
+        self.rttvar = 0
+        self.base_rto = INITIAL_TIMEOUT  # RTO before backoff
+        self.backoff = 0  # Timeouts since the last valid sample
+        self.rto = INITIAL_TIMEOUT
+    
+    def on_sample(self, sample_rtt, samples_per_rtt=1):
+        """Fold in an RTT sample taken from an unambiguous transmission"""
+        alpha = ALPHA / samples_per_rtt
+        beta = BETA / samples_per_rtt
+        if self.srtt == -1:
+            self.srtt = sample_rtt
+            self.rttvar = sample_rtt / 2
+        else:
+            self.rttvar = (1 - beta) * self.rttvar + beta * abs(sample_rtt - self.srtt)
+            self.srtt = (1 - alpha) * self.srtt + alpha * sample_rtt
+        self.base_rto = max(self.min_rto, min(self.srtt + K * self.rttvar, self.max_rto))
+        self.backoff = 0
+        self.rto = self.base_rto
+    
+    def on_timeout(self):
+        """Back the timer off exponentially"""
+        self.backoff += 1
+        self.rto = min(self.base_rto * 2 ** self.backoff, self.max_rto)
+    
+    def undo_backoff(self):
+        """The last timeout was spurious: return to the un-backed-off RTO"""
+        self.backoff = 0
+        self.rto = self.base_rto
+
+class RackTlp:
+    """RACK-TLP loss detection (RFC 8985).
+
+    RACK marks a segment lost once a segment sent after it has been
+    delivered and a reordering window has passed, instead of counting
+    duplicate ACKs, so reordered packets are not retransmitted and lost
+    retransmissions are caught without an RTO. TLP sends a probe when
+    the ACKs stop, so a lost tail costs about two RTTs instead of an RTO.
+    The segments are scanned oldest-sent first through the RetransmitQueue.
+    """
+    REO_WND_PERSIST = 16  # Loss episodes a widened reordering window lasts
+    
+    def __init__(self, rtx_queue):
+        self.rtx_queue = rtx_queue
+        self.xmit_time = 0  # Send time of the most recently sent delivered segment
+        self.end_seq = 0  # ... and its end, ordering segments sent at the same time
+        self.rtt = 0  # RTT of that segment
+        self.min_rtt = float('inf')
+        self.fack = 0  # Highest byte delivered
+        self.reordering_seen = False
+        self.reo_wnd_mult = 1
+        self.reo_wnd_persist = 0
+        self.reorder_deadline = None  # When the oldest candidate is lost, if still missing
+        self.probe_armed_at = 0  # Last send of new data or ACK arrival
+        self.tlp_end_seq = None  # Set while a probe is outstanding
+        self.tlp_segment = None  # The segment a retransmission probe resent
+    
+    def on_delivered(self, segment, current_time):
+        """Update the state from a segment the receiver just ACKed or SACKed"""
+        end = segment.seq + segment.length
+        if segment.retransmits == 0 and end < self.fack:
+            # Never resent, yet overtaken by later data
+            self.reordering_seen = True
+        self.fack = max(self.fack, end)
+        rtt = current_time - segment.send_time
+        if segment.retransmits and rtt < self.min_rtt:
+            # Too fast to be the retransmission: the original arrived late
+            return
+        self.min_rtt = min(self.min_rtt, rtt)
+        if (segment.send_time, end) > (self.xmit_time, self.end_seq):
+            self.xmit_time = segment.send_time
+            self.end_seq = end
+            self.rtt = rtt
+    
+    def on_spurious_retransmit(self):
+        """A retransmission proved unnecessary: widen the reordering window"""
+        self.reordering_seen = True
+        self.reo_wnd_mult += 1
+        self.reo_wnd_persist = self.REO_WND_PERSIST
+    
+    def reo_wnd(self, srtt, in_recovery, sacked_segments):
+        """Time a segment may lag behind later data before it counts as lost"""
+        if not self.reordering_seen and (in_recovery or sacked_segments >= SACK_DUP_THRESH):
+            return 0
+        return min(self.min_rtt / 4 * self.reo_wnd_mult, max(srtt, 0))
+    
+    def detect_lost(self, current_time, reo_wnd):
+        """Pop the in-flight segments RACK deems lost and re-arm the
+        reordering timer for the oldest one still within the window"""
+        lost = []
+        deadline = min(self.xmit_time, current_time - self.rtt - reo_wnd)
+        while True:
+            segment = self.rtx_queue.pop_expired(deadline)
+            if segment is None:
+                break
+            if segment.send_time == self.xmit_time and segment.seq >= self.end_seq:
+                # Sent together with the delivered segment, but after it
+                self.rtx_queue.push(segment)
+                break
+            lost.append(segment)
+        if lost and self.reo_wnd_persist:
+            self.reo_wnd_persist -= 1
+            if self.reo_wnd_persist == 0:
+                self.reo_wnd_mult = 1
+        
+        oldest_send_time = self.rtx_queue.oldest_send_time()
+        self.reorder_deadline = None
+        if oldest_send_time is not None and oldest_send_time < self.xmit_time:
+            self.reorder_deadline = oldest_send_time + self.rtt + reo_wnd
+        return lost
+    
+    def probe_deadline(self, srtt, rto, in_flight):
+        """When to send a tail loss probe, or None while one is not due"""
+        if srtt < 0 or self.tlp_end_seq is not None or self.reorder_deadline is not None:
+            return None
+        pto = 2 * srtt
+        if in_flight <= DATA_SIZE:
+            # A lone segment is ACKed only when the client's delayed-ACK timer fires
+            pto = max(pto, 1.5 * srtt + MAX_ACK_DELAY)
+        return self.probe_armed_at + min(pto, rto)
+    
+    def on_probe(self, end_seq, segment=None):
+        """A probe went out; segment is set when it was a retransmission"""
+        self.tlp_end_seq = end_seq
+        self.tlp_segment = segment
+    
+    def end_probe(self, ack_num):
+        """Close the probe episode once ack_num covers it; returns the
+        segment a retransmission probe resent, else None"""
+        if self.tlp_end_seq is None or ack_num < self.tlp_end_seq:
+            return None
+        segment = self.tlp_segment
+        self.tlp_end_seq = self.tlp_segment = None
+        return segment
 
 class ReliableUDPServer:
-    def __init__(self, server_ip, server_port, sws):
+    def __init__(self, server_ip, server_port, sws, rack=False, min_rto=MIN_RTO, max_rto=MAX_RTO):
         self.server_ip = server_ip
         self.server_port = server_port
         self.sws = sws  # Sender Window Size in bytes
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((self.server_ip, self.server_port))
         
+        # Readiness notification for the event-driven send loop
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        
         # Setup logging
         self.setup_logging()
         
         # RTT estimation
-        self.estimated_rtt = -1
-        self.dev_rtt = 0
-        self.rto = INITIAL_TIMEOUT
+        self.rtt = RtoEstimator(min_rto, max_rto)
+        self.last_backoff_time = 0  # One RTO backoff per timeout episode
+        self.rto_undo = None  # (seq, resend time) of the last backed-off retransmission
         
         # Window management
         self.base = 0  # First unacknowledged byte
         self.next_seq = 0  # Next byte to send
-        self.packets = {}  # seq_num -> (data, send_time)
+        self.packets = InFlightWindow()  # Segments sent but not yet ACKed
         self.dup_ack_count = {}  # ack_num -> count
+        self.rtx_queue = RetransmitQueue(self.packets)
+        self.scoreboard = SackScoreboard()  # What the client has SACKed
+        self.sack_rtx_next = 0  # Holes below this were already retransmitted
+        self.use_rack = rack  # RACK-TLP instead of duplicate-ACK counting
+        self.rack = None
+        self.retransmit_counts = dict.fromkeys(RETRANSMIT_CAUSES, 0)
+        self.total_bytes = 0
+        
+        # Zero-copy, batched send path straight from a mapping of the file
+        self.sender = BatchSender(self.sock)
+        self.syscalls = 0  # select/recv syscalls (sends are counted by self.sender)
         
         self.logger.info(f"Server listening on {self.server_ip}:{self.server_port}")
         self.logger.info(f"Sender Window Size: {self.sws} bytes")
         print(f"Server listening on {self.server_ip}:{self.server_port}")
         print(f"Sender Window Size: {self.sws} bytes")
+        if rack:
+            self.logger.info("Loss detection: RACK-TLP")
+            print("Loss detection: RACK-TLP")
+        self.logger.info(f"RTO bounds: {min_rto}s - {max_rto}s")
+        print(f"RTO bounds: {min_rto}s - {max_rto}s")
     
     def setup_logging(self):
         """Setup file-based logging"""
@@ -69,129 +555,288 @@ class ReliableUDPServer:
         # Add handler to logger
         self.logger.addHandler(file_handler)
     
-    def create_packet(self, seq_num, data):
+    def create_packet(self, seq_num, data, flags=0):
         """Create a packet with header and data"""
-        # Header: 4 bytes seq_num + 16 bytes reserved
-        header = struct.pack('!I', seq_num) + b'\x00' * 16
-        return header + data
+        # Header: 4 bytes seq_num + 4 bytes TSval + 1 byte flags + 11 bytes reserved
+        return DATA_HEADER.pack(seq_num, timestamp(), flags) + data
     
     def parse_ack(self, packet):
-        """Parse ACK packet to get ack number"""
-        if len(packet) < 4:
+        """Parse ACK packet to get ack number, SACK blocks as byte ranges,
+        TSecr and the number of segments it covers (0 = not reported)"""
+        if len(packet) < ACK_HEADER.size:
+            if len(packet) < 4:
+                return None, [], 0, 0
+            return struct.unpack('!I', packet[:4])[0], [], 0, 0
+        ack_num, *fields, tsecr, segments = ACK_HEADER.unpack_from(packet)
+        sack_blocks = []
+        for i in range(0, len(fields), 2):
+            offset, length = fields[i], fields[i + 1]
+            if length:
+                start = ack_num + offset * DATA_SIZE
+                # The last segment may be short; nothing past next_seq was sent
+                sack_blocks.append((start, min(start + length * DATA_SIZE, self.next_seq)))
+        return ack_num, sack_blocks, tsecr, segments
+    
+    def update_rtt(self, sample_rtt, samples_per_rtt=1):
+        """Feed an RTT sample to the RTO estimator"""
+        self.rtt.on_sample(sample_rtt, samples_per_rtt)
+    
+    def next_timeout(self):
+        """Seconds until the oldest in-flight packet's RTO expires, or
+        RACK-TLP's next timer fires (None if idle)"""
+        oldest_send_time = self.rtx_queue.oldest_send_time()
+        if oldest_send_time is None:
+            return None
+        deadline = oldest_send_time + self.rtt.rto
+        if self.rack is not None:
+            for timer in (self.rack.reorder_deadline, self.probe_deadline()):
+                if timer is not None and timer < deadline:
+                    deadline = timer
+        return max(0.0, deadline - time.time())
+    
+    def retransmit(self, segment, client_addr, cause):
+        """Resend an in-flight segment and re-arm its timer"""
+        self.sender.send(segment.seq, segment.length)
+        segment.send_time = time.time()
+        segment.retransmits += 1
+        self.retransmit_counts[cause] += 1
+        self.rtx_queue.push(segment)
+    
+    def send_segment(self):
+        """Queue the next new segment"""
+        length = min(DATA_SIZE, self.total_bytes - self.next_seq)
+        self.sender.queue(self.next_seq, length)
+        self.logger.debug(f"SEND: seq={self.next_seq} size={length} bytes")
+        segment = Segment(self.next_seq, length, time.time())
+        self.packets.append(segment)
+        self.rtx_queue.push(segment)
+        self.next_seq += length
+        if self.rack is not None:
+            self.rack.probe_armed_at = segment.send_time
+    
+    def check_spurious_timeout(self, tsecr):
+        """The segment resent by the last timeout is ACKed. If the ACK
+        echoes the original transmission, the original was only delayed:
+        undo the RTO backoff (Eifel, RFC 3522/4015)."""
+        seq_num, resend_time = self.rto_undo
+        self.rto_undo = None
+        if tsecr and echo_predates(tsecr, resend_time):
+            self.rtt.undo_backoff()
+            self.logger.info(f"Spurious timeout: seq {seq_num}, RTO back to {self.rtt.rto:.3f}s")
+            print(f"Spurious timeout: seq {seq_num}, RTO back to {self.rtt.rto:.3f}s")
+    
+    def rack_on_cumulative_ack(self, ack_num, tsecr, first, last):
+        """Feed a cumulative ACK to RACK-TLP; first and last are the lowest
+        and highest segments it covers (None if already released)"""
+        current_time = time.time()
+        for segment in (first, last):
+            if segment is not None and not segment.sacked:
+                self.rack.on_delivered(segment, current_time)
+        if first is not None and first.retransmits and tsecr and echo_predates(tsecr, first.send_time):
+            # The hole was filled by the original, not by the retransmission
+            self.rack.on_spurious_retransmit()
+            self.logger.info(f"Spurious retransmit: seq {first.seq}")
+        self.rack.end_probe(ack_num)
+    
+    def detect_rack_losses(self, current_time, client_addr):
+        """Retransmit every segment RACK has marked lost"""
+        reo_wnd = self.rack.reo_wnd(self.rtt.srtt, False,
+                                    self.scoreboard.sacked_bytes() // DATA_SIZE)
+        for segment in self.rack.detect_lost(current_time, reo_wnd):
+            self.retransmit(segment, client_addr, 'rack')
+            self.logger.warning(f"RACK retransmit: seq {segment.seq}")
+    
+    def probe_deadline(self):
+        """When the tail loss probe is due (None if not armed)"""
+        if self.base >= self.next_seq:
             return None
-        ack_num = struct.unpack('!I', packet[:4])[0]
-        return ack_num
-    
-    def update_rtt(self, sample_rtt):
-        """Update RTT estimates using TCP-like algorithm"""
-        if self.estimated_rtt == -1:
-            self.estimated_rtt = sample_rtt
-            self.dev_rtt = sample_rtt/2
-            self.rto = sample_rtt*1.5
+        return self.rack.probe_deadline(self.rtt.srtt, self.rtt.rto, self.next_seq - self.base)
+    
+    def send_probe(self, client_addr):
+        """Tail loss probe: one new segment, or else the last one again"""
+        if self.next_seq < self.total_bytes:
+            self.logger.warning(f"Tail loss probe: new data at seq {self.next_seq}")
+            self.send_segment()
+            self.sender.flush()
+            self.rack.on_probe(self.next_seq)
+            return
+        segment = self.packets.get((self.next_seq - 1) // DATA_SIZE * DATA_SIZE)
+        if segment is None or segment.sacked:
+            # Only holes are left, and RACK is timing those
+            self.rack.on_probe(self.next_seq)
+            return
+        self.retransmit(segment, client_addr, 'tlp')
+        self.logger.warning(f"Tail loss probe: retransmit seq {segment.seq}")
+        self.rack.on_probe(self.next_seq, segment)
+    
+    def process_sack(self, sack_blocks, ack_num, client_addr):
+        """Mark SACKed segments and retransmit the holes below them"""
+        for start, end in sack_blocks:
+            for piece_start, piece_end in self.scoreboard.update(max(start, self.base), end):
+                for seq_num in range(piece_start, piece_end, DATA_SIZE):
+                    segment = self.packets.get(seq_num)
+                    if segment is not None:
+                        segment.sacked = True
+                        if self.rack is not None:
+                            self.rack.on_delivered(segment, time.time())
+        if self.rack is not None:
+            # RACK decides by send time, after the cumulative ACK is applied
             return
         
-        self.estimated_rtt = (1 - ALPHA) * self.estimated_rtt + ALPHA * sample_rtt
-        self.dev_rtt = (1 - BETA) * self.dev_rtt + BETA * abs(sample_rtt - self.estimated_rtt)
-        self.rto = self.estimated_rtt + K * self.dev_rtt
-        # self.rto = max(0.1, min(self.rto, 2.0))  # Clamp between 0.1 and 2 seconds
-        self.rto = max(.1, self.rto)
+        # Each hole is retransmitted once here; a lost retransmission is
+        # left to the RTO
+        # Start past this ACK's cumulative ACK: it is applied only after
+        # the scan, and segments below it are no holes
+        lost_below = self.scoreboard.high - SACK_DUP_THRESH * DATA_SIZE
+        seq_num = max(self.sack_rtx_next, self.base, ack_num or 0)
+        while seq_num + DATA_SIZE <= lost_below:
+            segment = self.packets.get(seq_num)
+            if segment is not None and not segment.sacked:
+                self.retransmit(segment, client_addr, 'sack')
+                self.logger.warning(f"SACK retransmit: seq {seq_num}")
+            seq_num += DATA_SIZE
+        self.sack_rtx_next = max(self.sack_rtx_next, seq_num)
+    
+    def handle_ack(self, ack_packet, client_addr):
+        """Process a single ACK: slide the window or count duplicates"""
+        ack_num, sack_blocks, tsecr, segments = self.parse_ack(ack_packet)
+        self.logger.debug(f"RECV ACK: ack_num={ack_num} sack={sack_blocks}")
+        if tsecr:
+            # The echoed TSval belongs to the exact transmission that was
+            # delivered, so even ACKs of retransmissions give a clean sample
+            in_flight = max(1, (self.next_seq - self.base) // DATA_SIZE)
+            self.update_rtt(timestamp_age(tsecr), max(1, in_flight // max(segments, 1)))
+        if sack_blocks:
+            self.process_sack(sack_blocks, ack_num, client_addr)
+        
+        if ack_num is not None and ack_num > self.base:
+            # Cumulative ACK - all bytes up to ack_num-1 received
+            segment = self.packets.get(self.base)
+            if not tsecr and segment is not None and segment.retransmits == 0:
+                # No timestamp echoed: Karn's rule, never sample a retransmission
+                sample_rtt = time.time() - segment.send_time
+                self.update_rtt(sample_rtt)
+            if self.rack is not None:
+                last = self.packets.get((ack_num - 1) // DATA_SIZE * DATA_SIZE)
+                self.rack_on_cumulative_ack(ack_num, tsecr, segment, last)
+            if self.rto_undo is not None and ack_num > self.rto_undo[0]:
+                self.check_spurious_timeout(tsecr)
+            
+            # Remove acknowledged packets
+            self.packets.ack_through(ack_num)
+            self.scoreboard.ack_through(ack_num)
+            
+            self.base = ack_num
+            self.dup_ack_count = {}  # Reset duplicate ACK counter
+            self.logger.info(f"Recieved ack: {ack_num}, new rto: {self.rtt.rto}")
+            
+        elif ack_num is not None and ack_num == self.base:
+            # Duplicate ACK
+            self.dup_ack_count[ack_num] = self.dup_ack_count.get(ack_num, 0) + 1
+            
+            # Fast retransmit after 3 duplicate ACKs, unless SACK already
+            # retransmitted this hole
+            if self.dup_ack_count[ack_num] == 3 and self.sack_rtx_next <= self.base and self.rack is None:
+                segment = self.packets.get(self.base)
+                if segment is not None:
+                    self.retransmit(segment, client_addr, 'fast')
+                    self.logger.warning(f"Fast retransmit: seq {self.base}")
+                    print(f"Fast retransmit: seq {self.base}")
+        
+        if self.rack is not None and ack_num is not None:
+            self.rack.probe_armed_at = time.time()
+            self.detect_rack_losses(time.time(), client_addr)
     
     def send_file(self, client_addr, filename):
         """Send file using sliding window protocol"""
         try:
             with open(filename, 'rb') as f:
-                file_data = f.read()
+                total_bytes = os.fstat(f.fileno()).st_size
+                # mmap cannot map an empty file; ACCESS_COPY lets ctypes take the
+                # mapping's address for sendmmsg (pages are never written)
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) if total_bytes else None
+            digest = file_digest(filename)
         except FileNotFoundError:
             print(f"Error: File {filename} not found")
             self.logger.error(f"Error: File {filename} not found")
             return
         
-        total_bytes = len(file_data)
+        self.sender.start(mapping, client_addr)
+        self.syscalls = 0
+        self.sender.syscalls = 0
         print(f"Starting file transfer: {total_bytes} bytes")
         self.logger.info(f"Starting file transfer: {total_bytes} bytes")
         
-        # Set socket to non-blocking
-        self.sock.settimeout(0.001)
-        
         start_time = time.time()
         self.base = 0
         self.next_seq = 0
-        self.packets = {}
+        self.packets = InFlightWindow()
         self.dup_ack_count = {}
+        self.rtx_queue = RetransmitQueue(self.packets)
+        self.scoreboard = SackScoreboard()
+        self.sack_rtx_next = 0
+        self.rack = RackTlp(self.rtx_queue) if self.use_rack else None
+        self.retransmit_counts = dict.fromkeys(RETRANSMIT_CAUSES, 0)
+        self.rto_undo = None
+        self.total_bytes = total_bytes
         
-        # Split file into chunks
-        chunks = []
-        for i in range(0, total_bytes, DATA_SIZE):
-            chunks.append(file_data[i:i + DATA_SIZE])
-        
-        total_packets = len(chunks)
+        total_packets = (total_bytes + DATA_SIZE - 1) // DATA_SIZE
         print(f"Total packets to send: {total_packets}")
         self.logger.info(f"Total packets to send: {total_packets}")
         
         while self.base < total_bytes:
             # Send new packets within window
             while self.next_seq < total_bytes and (self.next_seq - self.base) < self.sws:
-                chunk_idx = self.next_seq // DATA_SIZE
-                if chunk_idx < len(chunks):
-                    data = chunks[chunk_idx]
-                    packet = self.create_packet(self.next_seq, data)
-                    self.sock.sendto(packet, client_addr)
-                    self.logger.debug(f"SEND: seq={self.next_seq} size={len(data)} bytes")
-                    self.packets[self.next_seq] = (packet, time.time())
-                    self.next_seq += len(data)
+                self.send_segment()
             
-            # Try to receive ACKs
-            try:
-                ack_packet, _ = self.sock.recvfrom(MAX_PAYLOAD)
-                ack_num = self.parse_ack(ack_packet)
-                self.logger.debug(f"RECV ACK: ack_num={ack_num}")
-                
-                if ack_num is not None and ack_num > self.base:
-                    # Cumulative ACK - all bytes up to ack_num-1 received
-                    if self.base in self.packets:
-                        _, send_time = self.packets[self.base]
-                        sample_rtt = time.time() - send_time
-                        self.update_rtt(sample_rtt)
-                    
-                    # Remove acknowledged packets
-                    acked_seqs = [seq for seq in self.packets if seq < ack_num]
-                    for seq in acked_seqs:
-                        del self.packets[seq]
-                    
-                    self.base = ack_num
-                    self.dup_ack_count = {}  # Reset duplicate ACK counter
-                    self.logger.info(f"Recieved ack: {ack_num}, new rto: {self.rto}")
-                    
-                elif ack_num is not None and ack_num == self.base:
-                    # Duplicate ACK
-                    self.dup_ack_count[ack_num] = self.dup_ack_count.get(ack_num, 0) + 1
-                    
-                    # Fast retransmit after 3 duplicate ACKs
-                    if self.dup_ack_count[ack_num] == 3:
-                        if self.base in self.packets:
-                            packet, _ = self.packets[self.base]
-                            self.sock.sendto(packet, client_addr)
-                            self.packets[self.base] = (packet, time.time())
-                            self.logger.warning(f"Fast retransmit: seq {self.base}")
-                            print(f"Fast retransmit: seq {self.base}")
+            self.sender.flush()
+            
+            # Sleep until an ACK arrives or the oldest packet's RTO expires
+            self.selector.select(self.next_timeout())
+            self.syscalls += 1
             
-            except socket.timeout:
-                pass
+            # Drain every ACK queued on the socket
+            while True:
+                self.syscalls += 1
+                try:
+                    ack_packet, _ = self.sock.recvfrom(MAX_PAYLOAD, socket.MSG_DONTWAIT)
+                except BlockingIOError:
+                    break
+                self.handle_ack(ack_packet, client_addr)
             
-            # Check for timeouts
             current_time = time.time()
-            for seq_num in list(self.packets.keys()):
-                packet, send_time = self.packets[seq_num]
-                if current_time - send_time > self.rto:
-                    # Timeout - retransmit
-                    self.sock.sendto(packet, client_addr)
-                    self.packets[seq_num] = (packet, current_time)
-                    self.logger.warning(f"TIMEOUT retransmit: seq={seq_num} RTO={self.rto:.3f}s")
-                    print(f"Timeout retransmit: seq {seq_num}, RTO: {self.rto:.3f}s")
-                    break  # Only retransmit one packet per timeout
-        
-        # Send EOF marker
-        eof_packet = self.create_packet(self.next_seq, b'EOF')
+            if self.rack is not None:
+                deadline = self.rack.reorder_deadline
+                if deadline is not None and current_time >= deadline:
+                    self.detect_rack_losses(current_time, client_addr)
+                deadline = self.probe_deadline()
+                if deadline is not None and current_time >= deadline:
+                    self.send_probe(client_addr)
+            
+            # Check for timeouts (only retransmit one packet per timeout)
+            segment = self.rtx_queue.pop_expired(current_time - self.rtt.rto)
+            if segment is not None:
+                # Timeout - retransmit
+                self.logger.warning(f"TIMEOUT retransmit: seq={segment.seq} RTO={self.rtt.rto:.3f}s")
+                print(f"Timeout retransmit: seq {segment.seq}, RTO: {self.rtt.rto:.3f}s")
+                # Segments sent together expire together: back off once per RTO
+                backed_off = current_time - self.last_backoff_time >= self.rtt.rto
+                if backed_off:
+                    self.last_backoff_time = current_time
+                    self.rtt.on_timeout()
+                self.retransmit(segment, client_addr, 'timeout')
+                if backed_off:
+                    # Kept until the segment is ACKed, to recognise a spurious timeout
+                    self.rto_undo = (segment.seq, segment.send_time)
+        
+        # Unmap the file before the next transfer
+        self.sender.finish()
+        if mapping is not None:
+            mapping.close()
+        total_syscalls = self.syscalls + self.sender.syscalls
+        
+        # Send EOF marker, with the digest the client checks the file against
+        eof_packet = self.create_packet(self.next_seq, EOF_MARKER + digest, EOF_FLAG)
         for _ in range(5):  # Send EOF multiple times to ensure delivery
             self.sock.sendto(eof_packet, client_addr)
             self.logger.debug("SEND: EOF marker")
@@ -202,11 +847,32 @@ class ReliableUDPServer:
         print(f"Throughput: {(total_bytes * 8 / duration / 1_000_000):.2f} Mbps")
         self.logger.info(f"File transfer complete in {duration:.2f} seconds")
         self.logger.info(f"Throughput: {(total_bytes * 8 / duration / 1_000_000):.2f} Mbps")
+        self.report_syscalls(total_syscalls, total_bytes)
+        self.report_retransmits()
+    
+    def report_syscalls(self, total_syscalls, total_bytes):
+        """Print the syscall budget of the last transfer"""
+        mode = "sendmmsg" if self.sender.use_mmsg else "sendmsg"
+        per_mb = total_syscalls / max(total_bytes / 1_000_000, 1e-9)
+        print(f"Syscalls: {total_syscalls} ({per_mb:.1f} per MB, {mode} send path)")
+        self.logger.info(f"Syscalls: {total_syscalls} ({per_mb:.1f} per MB, {mode} send path)")
+    
+    def report_retransmits(self):
+        """Print the retransmissions of the last transfer by cause"""
+        counts = ", ".join(f"{cause} {count}" for cause, count in self.retransmit_counts.items())
+        message = f"Retransmits: {sum(self.retransmit_counts.values())} ({counts})"
+        print(message)
+        self.logger.info(message)
     
     def run(self):
         """Main server loop"""
         print("Waiting for client request...")
         self.logger.info("Server started - waiting for client request")
+        # Hash the file now rather than when the request arrives
+        try:
+            file_digest('data.txt')
+        except FileNotFoundError:
+            pass
         
         while True:
             try:
@@ -221,18 +887,41 @@ class ReliableUDPServer:
                 self.logger.info("Server shutting down")
                 break
         
+        self.selector.close()
         self.sock.close()
 
+def parse_options(args):
+    """Parse trailing --flag / --name=value options into a dict"""
+    options = {}
+    for arg in args:
+        if not arg.startswith('--'):
+            raise ValueError(f"unexpected argument {arg}")
+        name, _, value = arg[2:].partition('=')
+        options[name] = value if value else True
+    return options
+
+USAGE = ("Usage: python3 p1_server.py <SERVER_IP> <SERVER_PORT> <SWS> [--rack]\n"
+         "       [--rto-min=SECONDS] [--rto-max=SECONDS]")
+
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python3 p1_server.py <SERVER_IP> <SERVER_PORT> <SWS>")
+    try:
+        options = parse_options(sys.argv[4:])
+        rack = options.pop('rack', False)
+        min_rto = float(options.pop('rto-min', MIN_RTO))
+        max_rto = float(options.pop('rto-max', MAX_RTO))
+        if not 0 < min_rto <= max_rto:
+            raise ValueError("RTO bounds out of order")
+        if len(sys.argv) < 4 or options:
+            raise ValueError(f"unknown options {options}")
+    except ValueError:
+        print(USAGE)
         sys.exit(1)
     
     server_ip = sys.argv[1]
     server_port = int(sys.argv[2])
     sws = int(sys.argv[3])
     
-    server = ReliableUDPServer(server_ip, server_port, sws)
+    server = ReliableUDPServer(server_ip, server_port, sws, rack, min_rto, max_rto)
     server.run()
 
 if __name__ == "__main__":
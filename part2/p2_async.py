@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Part 2 asyncio engine: Reliable UDP File Transfer with Congestion Control
+DatagramProtocol versions of ReliableUDPServer and CongestionControlClient.
+Retransmission timers are loop.call_at handles, so any number of transfers
+share one thread without polling. Wire-compatible with p2_server.py and
+p2_client.py.
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import time
+
+from p2_server import (HEADER_SIZE, DATA_SIZE, DATA_HEADER, PACING_GAIN, FEC_PARITY,
+                       CONGESTION_CONTROLLERS, TransferFlow, file_digest, map_file, parse_options, timestamp,
+                       warm_digest)
+from p2_client import (CongestionControlClient, SegmentBitmap, FecDecoder, AckPolicy, FileSink,
+                       ACK_DELAY, check_digest)
+
+REQUEST_TIMEOUT = 2.0
+MAX_RETRIES = 5
+IDLE_CHECK = 0.5  # Seconds between client idle checks
+IDLE_ACK_DELAY = 0.2  # Re-ACK after this much silence
+MAX_IDLE_CHECKS = 20  # Give up after this many silent checks
+
+class TransportSender:
+    """Send path for TransferFlow over an asyncio datagram transport.
+
+    Same interface as p2_server.BatchSender; the transport buffers datagrams
+    itself when the socket would block, so segments are sent one by one.
+    """
+    def __init__(self, transport):
+        self.transport = transport
+        self.syscalls = 0
+        self.client_addr = None
+        self.file_view = memoryview(b'')
+        self.header = bytearray(HEADER_SIZE)
+    
+    def mode(self):
+        """Short description of the send path for reports"""
+        return "asyncio transport"
+    
+    def start(self, mapping, client_addr):
+        """Point the sender at a new file mapping and destination"""
+        self.client_addr = client_addr
+        self.file_view = memoryview(mapping) if mapping is not None else memoryview(b'')
+    
+    def finish(self):
+        """Release every reference to the mapping so it can be closed"""
+        self.file_view.release()
+        self.file_view = memoryview(b'')
+    
+    def send(self, seq_num, length, flags=0, index=0):
+        """Send one segment"""
+        DATA_HEADER.pack_into(self.header, 0, seq_num, timestamp(), flags, 0, index)
+        self.transport.sendto(bytes(self.header) + self.file_view[seq_num:seq_num + length],
+                              self.client_addr)
+        self.syscalls += 1
+    
+    queue = send
+    
+    def queue_parity(self, seq_num, k, length_xor, payload):
+        """Send the parity segment of the FEC block starting at seq_num"""
+        DATA_HEADER.pack_into(self.header, 0, seq_num, timestamp(), FEC_PARITY, k, length_xor)
+        self.transport.sendto(bytes(self.header) + payload, self.client_addr)
+        self.syscalls += 1
+    
+    def flush(self):
+        """Nothing is held back: queue() sends immediately"""
+        pass
+
+class AsyncReliableUDPServer(asyncio.DatagramProtocol):
+    """Serves data.txt to concurrent clients, one TransferFlow per address"""
+    def __init__(self, filename='data.txt', initial_cwnd=DATA_SIZE, pacing_gain=None,
+                 congestion_control='cubic', rack=False, fec=False):
+        self.filename = filename
+        self.initial_cwnd = initial_cwnd
+        self.pacing_gain = pacing_gain
+        self.congestion_control = congestion_control
+        self.rack = rack
+        self.fec = fec
+        self.transport = None
+        self.loop = None
+        self.flows = {}  # client_addr -> TransferFlow
+        self.timers = {}  # client_addr -> (deadline, asyncio.TimerHandle)
+    
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+    
+    def datagram_received(self, data, client_addr):
+        flow = self.flows.get(client_addr)
+        if flow is not None:
+            flow.recv_syscalls += 1
+            flow.handle_ack(data)
+            self.service(client_addr)
+        elif 0 < len(data) < HEADER_SIZE:
+            # File request from a new client
+            print(f"Received request from {client_addr}")
+            self.start_transfer(client_addr)
+        # Anything else is a late ACK for a finished transfer
+    
+    def error_received(self, exc):
+        print(f"An error occurred: {exc}")
+    
+    def start_transfer(self, client_addr):
+        """Create a flow for client_addr and send its first window"""
+        try:
+            mapping, total_bytes = map_file(self.filename)
+            digest = file_digest(self.filename)
+        except FileNotFoundError:
+            print(f"Error: File {self.filename} not found")
+            return
+        
+        print(f"Starting file transfer to {client_addr}: {total_bytes} bytes")
+        flow = TransferFlow(self.transport, client_addr, mapping, total_bytes, digest,
+                            self.initial_cwnd, sender=TransportSender(self.transport),
+                            pacing_gain=self.pacing_gain,
+                            congestion_control=self.congestion_control, rack=self.rack,
+                            fec=self.fec)
+        self.flows[client_addr] = flow
+        self.service(client_addr)
+    
+    def service(self, client_addr):
+        """Send what the window allows, then re-arm the flow's timer"""
+        flow = self.flows[client_addr]
+        if flow.base < flow.total_bytes:
+            flow.fill_window()
+        
+        deadline = flow.next_deadline()
+        armed = self.timers.get(client_addr)
+        if armed is not None:
+            if armed[0] == deadline:
+                return
+            armed[1].cancel()
+            del self.timers[client_addr]
+        if deadline is not None:
+            # Flow deadlines are wall-clock; the loop schedules on its own clock
+            when = self.loop.time() + max(0.0, deadline - time.time())
+            handle = self.loop.call_at(when, self.on_timer, client_addr)
+            self.timers[client_addr] = (deadline, handle)
+    
+    def on_timer(self, client_addr):
+        """A flow's RTO, EOF-repeat or idle-limit timer fired"""
+        self.timers.pop(client_addr, None)
+        flow = self.flows[client_addr]
+        flow.on_timer(time.time())
+        if flow.finished:
+            del self.flows[client_addr]
+            flow.report()
+        else:
+            self.service(client_addr)
+    
+    def close(self):
+        for _, handle in self.timers.values():
+            handle.cancel()
+        for flow in self.flows.values():
+            flow.close()
+
+class AsyncCongestionControlClient(asyncio.DatagramProtocol):
+    """Downloads the file with cumulative ACKs, like CongestionControlClient"""
+    def __init__(self, server_addr, output_filename):
+        self.server_addr = server_addr
+        self.output_filename = output_filename
+        self.transport = None
+        self.loop = None
+        self.done = None  # Future resolved with True/False
+        
+        # Receive buffer
+        self.expected_seq = 0
+        self.received = SegmentBitmap()  # Arrivals above expected_seq, reported as SACK blocks
+        self.sink = None  # FileSink, opened once the server answers
+        self.fec = FecDecoder()  # Repairs single losses when the server sends parity
+        self.acks = AckPolicy()
+        self.ack_timer = None  # Pending delayed ACK
+        
+        self.connected = False
+        self.attempts = 0
+        self.request_timer = None
+        self.idle_timer = None
+        self.idle_checks = 0
+        self.last_packet_time = 0
+        self.last_ack_time = 0
+        self.start_time = 0
+    
+    parse_packet = CongestionControlClient.parse_packet
+    create_ack = CongestionControlClient.create_ack
+    store_segment = CongestionControlClient.store_segment
+    eof_digest = CongestionControlClient.eof_digest
+    handle_data = CongestionControlClient.handle_data
+    
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+        self.done = self.loop.create_future()
+        self.send_request()
+    
+    def send_request(self):
+        """Send the file request, retrying every REQUEST_TIMEOUT seconds"""
+        if self.connected:
+            return
+        if self.attempts >= MAX_RETRIES:
+            print("Failed to connect after maximum retries")
+            self.finish(False)
+            return
+        self.attempts += 1
+        print(f"Sending request (attempt {self.attempts}/{MAX_RETRIES})...")
+        self.transport.sendto(b'G', self.server_addr)
+        self.request_timer = self.loop.call_later(REQUEST_TIMEOUT, self.send_request)
+    
+    def datagram_received(self, packet, addr):
+        if self.done.done():
+            return
+        seq_num, tsval, data, fec = self.parse_packet(packet)
+        if seq_num is None:
+            return
+        
+        if not self.connected:
+            print("Connection established!")
+            self.connected = True
+            self.request_timer.cancel()
+            try:
+                self.sink = FileSink(self.output_filename)
+            except OSError as e:
+                print(f"Error opening output file: {e}")
+                self.finish(False)
+                return
+            self.start_time = time.time()
+            self.idle_timer = self.loop.call_later(IDLE_CHECK, self.check_idle)
+        self.last_packet_time = time.time()
+        self.idle_checks = 0
+        
+        # Check for EOF
+        expected_digest = self.eof_digest(data, fec)
+        if expected_digest is not None:
+            final_ack = self.create_ack(self.expected_seq)
+            for _ in range(5):
+                self.transport.sendto(final_ack, self.server_addr)
+            self.write_file(expected_digest)
+            return
+        
+        # Handle data packet
+        expected_seq = self.expected_seq
+        had_gap = bool(self.received)
+        self.handle_data(seq_num, data, fec)
+        
+        # Send cumulative ACK, delayed only while in-order data arrives
+        in_order = self.expected_seq > expected_seq and not had_gap and not self.received
+        if self.acks.on_segment(tsval, in_order):
+            self.send_ack()
+        elif self.ack_timer is None:
+            self.ack_timer = self.loop.call_later(ACK_DELAY, self.send_ack)
+    
+    def send_ack(self):
+        """Acknowledge every segment received so far"""
+        if self.ack_timer is not None:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+        if self.acks.pending == 0:
+            return
+        tsecr, segments = self.acks.on_ack_sent()
+        ack = self.create_ack(self.expected_seq, self.received.blocks(), tsecr, segments)
+        self.transport.sendto(ack, self.server_addr)
+        self.last_ack_time = time.time()
+    
+    def check_idle(self):
+        """Re-ACK after a short silence; give up after a long one"""
+        if self.done.done():
+            return
+        now = time.time()
+        if now - self.last_packet_time >= IDLE_CHECK:
+            self.idle_checks += 1
+            if now - self.last_ack_time > IDLE_ACK_DELAY:
+                ack = self.create_ack(self.expected_seq, self.received.blocks())
+                self.transport.sendto(ack, self.server_addr)
+                self.last_ack_time = now
+            if self.idle_checks > MAX_IDLE_CHECKS:
+                print("\nTransfer appears complete (timeout)")
+                self.finish(False)
+                return
+        self.idle_timer = self.loop.call_later(IDLE_CHECK, self.check_idle)
+    
+    def write_file(self, expected_digest):
+        """Finish writing the received data, check its digest and report"""
+        sink, self.sink = self.sink, None
+        try:
+            sink.close()
+        except Exception as e:
+            print(f"Error writing file: {e}")
+            self.finish(False)
+            return
+        
+        duration = max(time.time() - self.start_time, 1e-9)
+        total_bytes = self.expected_seq
+        print(f"{self.output_filename}: {total_bytes} bytes in {duration:.2f}s, "
+              f"{(total_bytes * 8 / duration / 1_000_000):.2f} Mbps")
+        self.finish(check_digest(self.output_filename, sink.digest.digest(), expected_digest))
+    
+    def finish(self, success):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+        if self.ack_timer is not None:
+            self.ack_timer.cancel()
+        if self.sink is not None:
+            # Without the EOF marker the file is incomplete: don't leave it behind
+            sink, self.sink = self.sink, None
+            try:
+                sink.close()
+                os.remove(self.output_filename)
+            except OSError:
+                pass
+        if not self.done.done():
+            self.done.set_result(success)
+    
+    def error_received(self, exc):
+        print(f"An error occurred: {exc}")
+
+async def serve(server_ip, server_port, pacing_gain=None, congestion_control='cubic', rack=False,
+                fec=False):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        lambda: AsyncReliableUDPServer(pacing_gain=pacing_gain,
+                                       congestion_control=congestion_control, rack=rack, fec=fec),
+        local_addr=(server_ip, server_port))
+    print(f"Server listening on {server_ip}:{server_port} (asyncio)")
+    warm_digest(server.filename)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        server.close()
+        transport.close()
+
+async def download(server_ip, server_port, pref_filename, parallel):
+    """Run `parallel` downloads on one event loop"""
+    loop = asyncio.get_running_loop()
+    if parallel == 1:
+        names = [f"{pref_filename}received_data.txt"]
+    else:
+        names = [f"{pref_filename}{i}_received_data.txt" for i in range(parallel)]
+    
+    start_time = time.time()
+    clients = []
+    for name in names:
+        transport, client = await loop.create_datagram_endpoint(
+            lambda name=name: AsyncCongestionControlClient((server_ip, server_port), name),
+            family=socket.AF_INET)
+        clients.append((transport, client))
+    results = await asyncio.gather(*(client.done for _, client in clients))
+    for transport, _ in clients:
+        transport.close()
+    
+    print(f"{sum(results)}/{len(results)} downloads succeeded in {time.time() - start_time:.2f}s")
+    return all(results)
+
+USAGE = ("Usage: python3 p2_async.py server <SERVER_IP> <SERVER_PORT> [--pacing[=GAIN]] [--cc=NAME] [--rack] [--fec]\n"
+         "       python3 p2_async.py client <SERVER_IP> <SERVER_PORT> <PREF_FILENAME> [--parallel=N]")
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[1] not in ('server', 'client'):
+        print(USAGE)
+        sys.exit(1)
+    
+    mode = sys.argv[1]
+    server_ip = sys.argv[2]
+    server_port = int(sys.argv[3])
+    
+    try:
+        if mode == 'server':
+            options = parse_options(sys.argv[4:])
+            pacing = options.pop('pacing', None)
+            congestion_control = options.pop('cc', 'cubic')
+            rack = options.pop('rack', False)
+            fec = options.pop('fec', False)
+            if options or congestion_control not in CONGESTION_CONTROLLERS:
+                print(USAGE)
+                sys.exit(1)
+            pacing_gain = PACING_GAIN if pacing is True else (float(pacing) if pacing else None)
+            asyncio.run(serve(server_ip, server_port, pacing_gain, congestion_control, rack, fec))
+        else:
+            if len(sys.argv) < 5:
+                print(USAGE)
+                sys.exit(1)
+            options = parse_options(sys.argv[5:])
+            parallel = int(options.pop('parallel', 1))
+            if options:
+                print(USAGE)
+                sys.exit(1)
+            success = asyncio.run(download(server_ip, server_port, sys.argv[4], parallel))
+            print("Client finished successfully" if success else "Client finished with errors")
+    except KeyboardInterrupt:
+        print("\nShutting down")
+
+if __name__ == "__main__":
+    main()
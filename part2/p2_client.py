@@ -2,13 +2,26 @@
 """
 Part 2 Client: Reliable UDP File Transfer with Congestion Control
 Receives file and sends ACKs
+
+SegmentBitmap, BufferPool, FileSink and AckPolicy are copies of those in
+part1/p1_client.py, since each part is submitted and run as standalone
+scripts. Change both copies together; only this BufferPool keeps each
+buffer's address for recvmmsg().
 """
 
 import socket
+import errno
 import sys
 import time
 import struct
 import os
+import select
+import ctypes
+import queue
+import threading
+import mmap
+import array
+import hashlib
 
 # Constants
 MAX_PAYLOAD = 1200
@@ -16,9 +29,552 @@ HEADER_SIZE = 20
 DATA_SIZE = MAX_PAYLOAD - HEADER_SIZE
 REQUEST_TIMEOUT = 2.0
 MAX_RETRIES = 5
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_GRO = 104  # linux/udp.h
+GRO_BUFFER_SIZE = 65535  # Largest coalesced batch the kernel can hand over
+RECV_BATCH = 64  # Max datagrams taken from the kernel per recvmmsg()
+RECV_DRAIN = 4  # Full batches read per wakeup before the data is processed
+POOL_SLAB = 256  # Receive buffers carved out of each slab allocation
+MAP_WINDOW = 8 * 1024 * 1024  # Bytes of the output file per mapping (a multiple of the mmap granularity)
+MAPPED_WINDOWS = 2  # Mappings kept open at once
+WRITE_QUEUE = 1024  # Segments the writer thread may fall behind by
+HASH_CHUNK = 256 * 1024  # In-order bytes fed to the digest at a time
+DATA_HEADER = struct.Struct('!IIBBH8x')  # seq_num + TSval + FEC flags, k, index (parity: XOR of lengths) + 8 reserved bytes
+ACK_HEADER = struct.Struct('!I4HIHH')  # ack_num + 2 SACK blocks (offset, length in segments) + TSecr + segments ACKed + FEC repairs minus duplicates
+MAX_SACK_BLOCKS = 2
+WORD_MASK = (1 << 64) - 1  # A full word of SegmentBitmap
+ACK_EVERY = 2  # In-order segments per ACK
+ACK_DELAY = 0.01  # Longest an in-order segment waits for its ACK, in seconds
+IDLE_LIMIT = 10.0  # Give up after this long without a packet, in seconds
+FEC_DATA = 0x01  # Header flag: data segment covered by a parity block
+FEC_PARITY = 0x02  # Header flag: XOR parity of the block starting at seq_num
+FEC_MAX_K = 32  # Largest block the server sends
+EOF_FLAG = 0x04  # Header flag: the segment is the EOF marker
+EOF_MARKER = b'EOF'  # EOF payload: the marker followed by the file's MD5 digest
+DIGEST_SIZE = 16
+
+# recvmmsg(2) through ctypes; None where libc does not provide it
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _recvmmsg = _libc.recvmmsg
+    _recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    _recvmmsg.restype = ctypes.c_int
+except (OSError, AttributeError):
+    _recvmmsg = None
+
+class IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.c_void_p), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', ctypes.c_uint)]
+
+class BufferPool:
+    """MAX_PAYLOAD-byte receive buffers carved out of large slabs.
+
+    Datagrams are read straight into a free buffer and handed on as
+    memoryviews, so a payload is never copied before it is written out.
+    Each buffer is a (view, address) pair; the address is what recvmmsg()
+    needs. A buffer whose data is dropped goes back on the free list, one
+    holding stored data stays with it, and a new slab is allocated only
+    when the free list runs dry: one allocation per POOL_SLAB datagrams.
+    """
+    def __init__(self, slab_buffers=POOL_SLAB):
+        self.slab_buffers = slab_buffers
+        self.free = []
+        self.slabs = 0
+    
+    def get(self):
+        """Take a free buffer"""
+        if not self.free:
+            self.grow()
+        return self.free.pop()
+    
+    def put(self, buffer):
+        """Return a buffer whose contents are no longer referenced (None,
+        for a packet read outside the pool, is ignored)"""
+        if buffer is not None:
+            self.free.append(buffer)
+    
+    def grow(self):
+        """Allocate another slab and split it into buffers"""
+        slab = bytearray(self.slab_buffers * MAX_PAYLOAD)
+        view = memoryview(slab)
+        # from_buffer() pins the slab, which is never resized anyway
+        base = ctypes.addressof(ctypes.c_char.from_buffer(slab))
+        self.free.extend((view[i:i + MAX_PAYLOAD], base + i)
+                         for i in range(0, len(slab), MAX_PAYLOAD))
+        self.slabs += 1
+
+class BatchReceiver:
+    """Drains every datagram queued on a non-blocking socket per wakeup.
+
+    A single poll() waits for data, then recvmmsg() reads up to RECV_BATCH
+    datagrams per call straight into buffers from the pool. Without recvmmsg
+    it falls back to recv_into() until the queue is empty; with UDP GRO it
+    uses recvmsg_into() on a scratch buffer and splits each coalesced batch
+    into pool buffers. Every receive syscall (polls included) is counted in
+    self.syscalls.
+    """
+    def __init__(self, sock, pool, gro=False, capacity=RECV_BATCH):
+        self.sock = sock
+        self.pool = pool
+        self.gro = gro
+        self.capacity = capacity
+        self.syscalls = 0
+        self.datagrams = 0
+        self.poller = select.poll()
+        self.poller.register(sock, select.POLLIN)
+        self.use_mmsg = _recvmmsg is not None and not gro
+        if gro:
+            self.scratch = bytearray(GRO_BUFFER_SIZE)
+            self.scratch_view = memoryview(self.scratch)
+        if self.use_mmsg:
+            self.iov = (IoVec * capacity)()
+            self.msgs = (MMsgHdr * capacity)()
+            iov_base = ctypes.addressof(self.iov)
+            for i in range(capacity):
+                self.iov[i].iov_len = MAX_PAYLOAD
+                hdr = self.msgs[i].msg_hdr
+                hdr.msg_iov = iov_base + i * ctypes.sizeof(IoVec)
+                hdr.msg_iovlen = 1
+            self.msgs_base = ctypes.addressof(self.msgs)
+    
+    def mode(self):
+        """Short description of the receive path for reports"""
+        if self.gro:
+            return "recvmsg + GRO"
+        return "recvmmsg" if self.use_mmsg else "recv"
+    
+    def recv(self, timeout):
+        """Wait up to timeout seconds for data, then return every queued
+        datagram (up to RECV_DRAIN batches) as (packet view, pool buffer)
+        pairs; empty on timeout"""
+        self.syscalls += 1
+        if not self.poller.poll(timeout * 1000):
+            return []
+        packets = []
+        drain = self.drain_mmsg if self.use_mmsg else self.drain_one
+        for _ in range(RECV_DRAIN):
+            if not drain(packets):
+                break
+        self.datagrams += len(packets)
+        return packets
+    
+    def drain_mmsg(self, packets):
+        """Read one batch with recvmmsg(); returns True if more may be queued"""
+        buffers = [self.pool.get() for _ in range(self.capacity)]
+        for i, (_, address) in enumerate(buffers):
+            self.iov[i].iov_base = address
+        count = _recvmmsg(self.sock.fileno(), self.msgs_base, self.capacity, 0, None)
+        self.syscalls += 1
+        for buffer in buffers[max(count, 0):]:
+            self.pool.put(buffer)
+        if count < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return False
+            raise OSError(err, os.strerror(err))
+        msgs = self.msgs
+        for i in range(count):
+            buffer = buffers[i]
+            packets.append((buffer[0][:msgs[i].msg_len], buffer))
+        return count == self.capacity
+    
+    def drain_one(self, packets):
+        """Read up to a batch one datagram at a time; returns True if more
+        may be queued"""
+        for _ in range(self.capacity):
+            self.syscalls += 1
+            if not self.gro:
+                buffer = self.pool.get()
+                try:
+                    length = self.sock.recv_into(buffer[0])
+                except BlockingIOError:
+                    self.pool.put(buffer)
+                    return False
+                packets.append((buffer[0][:length], buffer))
+                continue
+            try:
+                length, ancdata, _, _ = self.sock.recvmsg_into([self.scratch], socket.CMSG_SPACE(4))
+            except BlockingIOError:
+                return False
+            segment_size = length
+            for level, cmsg_type, cmsg_data in ancdata:
+                if level == SOL_UDP and cmsg_type == UDP_GRO:
+                    segment_size = struct.unpack('=i', cmsg_data[:4])[0]
+            # One copy per datagram, out of the scratch buffer into the pool
+            for start in range(0, length, segment_size):
+                end = min(start + segment_size, length, start + MAX_PAYLOAD)
+                buffer = self.pool.get()
+                buffer[0][:end - start] = self.scratch_view[start:end]
+                packets.append((buffer[0][:end - start], buffer))
+        return True
+
+class SegmentBitmap:
+    """Which segments have arrived above the cumulative ACK, one bit each.
+
+    Bit i stands for the segment at i * DATA_SIZE. The bits live in 64-bit
+    words covering a window that slides with the cumulative ACK, dropping
+    words wholly below it. The next hole is found a word at a time, and the
+    runs around the most recent arrivals are reported as SACK blocks,
+    newest first as in RFC 2018.
+    """
+    def __init__(self):
+        self.base = 0  # Cumulative ACK: everything below it has arrived
+        self.first_word = 0  # Word index of words[0]
+        self.words = array.array('Q')
+        self.count = 0  # Segments held above base
+        self.end = None  # End of the short final segment, once it arrives
+        self.recent = []  # Segments that most recently extended a run, newest first
+    
+    def __len__(self):
+        return self.count
+    
+    def add(self, seq_num, length):
+        """Record an arrival; returns False if the segment arrived before. A
+        segment at base slides it past the run it joins"""
+        if seq_num < self.base:
+            return False
+        index = seq_num // DATA_SIZE
+        w = (index >> 6) - self.first_word
+        if w >= len(self.words):
+            self.words.frombytes(bytes(8 * (w + 1 - len(self.words))))
+        bit = 1 << (index & 63)
+        if self.words[w] & bit:
+            return False
+        self.words[w] |= bit
+        if length < DATA_SIZE:
+            self.end = seq_num + length
+        
+        if seq_num == self.base:
+            self.slide(index)
+        else:
+            self.count += 1
+            if self.recent and self.recent[0] == index - 1:
+                self.recent[0] = index  # Extends the newest run
+            else:
+                self.recent = [index] + [i for i in self.recent[:MAX_SACK_BLOCKS + 1] if i != index]
+        return True
+    
+    def slide(self, index):
+        """Move base past the run of arrived segments starting at index"""
+        hole = self.next_hole(index)
+        self.count -= hole - index - 1
+        drop = (hole >> 6) - self.first_word
+        if drop > 0:
+            del self.words[:drop]
+            self.first_word += drop
+        self.base = hole * DATA_SIZE
+        if self.end is not None and self.base > self.end:
+            self.base = self.end
+    
+    def next_hole(self, index):
+        """First segment at or above index that has not arrived"""
+        w = (index >> 6) - self.first_word
+        word = (self.words[w] if w < len(self.words) else 0) | ((1 << (index & 63)) - 1)
+        while word == WORD_MASK:
+            w += 1
+            word = self.words[w] if w < len(self.words) else 0
+        # Lowest clear bit
+        return ((w + self.first_word) << 6) + ((word + 1) & ~word).bit_length() - 1
+    
+    def run_start(self, index):
+        """First segment of the run of arrived segments holding index"""
+        w = (index >> 6) - self.first_word
+        below = (1 << (index & 63)) - 1
+        # The segment at base is always missing, so this stops there at the latest
+        while w >= 0:
+            holes = ~self.words[w] & below
+            if holes:
+                return ((w + self.first_word) << 6) + holes.bit_length()
+            w -= 1
+            below = WORD_MASK
+        return self.first_word << 6
+    
+    def blocks(self):
+        """Up to MAX_SACK_BLOCKS (start, end) runs, most recently extended first"""
+        blocks = []
+        for index in self.recent:
+            if index * DATA_SIZE < self.base:
+                continue
+            end = self.next_hole(index) * DATA_SIZE
+            if self.end is not None:
+                end = min(end, self.end)
+            block = (self.run_start(index) * DATA_SIZE, end)
+            if block not in blocks:
+                blocks.append(block)
+                if len(blocks) == MAX_SACK_BLOCKS:
+                    break
+        return blocks
+
+class FileSink:
+    """Copies every segment to its offset in a memory-mapped output file.
+
+    Each payload, in order or not, is copied straight into a mapping of the
+    file and the kernel writes the pages back, so the client holds no file
+    data itself. The size is not known up front: the file grows MAP_WINDOW
+    bytes at a time ahead of the furthest segment, with the space reserved
+    by posix_fallocate() where supported so a full disk fails the write
+    rather than a page fault, and is cut to its real size on close. At most
+    MAPPED_WINDOWS windows stay mapped. With threaded=True the copies run on
+    a writer thread behind a bounded queue, so page faults only stall the
+    receive loop once WRITE_QUEUE segments are waiting. Pool buffers go
+    back to the pool once their segment is copied.
+
+    The bytes delivered in order are fed to an MD5 digest from the mapping,
+    HASH_CHUNK at a time while their pages are still resident, so the file
+    never has to be read back to check it against the server's digest.
+    """
+    def __init__(self, filename, pool=None, threaded=False):
+        self.fd = os.open(filename, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.pool = pool
+        self.size = 0  # End of the furthest segment
+        self.allocated = 0
+        self.windows = {}  # window index -> mmap, least recently used first
+        self.error = None  # First error hit by the writer thread
+        self.digest = hashlib.md5()
+        self.hashed = 0  # Bytes fed to the digest
+        self.delivered = 0  # End of the in-order data
+        self.queue = None
+        if threaded:
+            self.queue = queue.Queue(WRITE_QUEUE)
+            self.thread = threading.Thread(target=self.writer, daemon=True)
+            self.thread.start()
+    
+    def write(self, offset, data, buffer=None, delivered=0):
+        """Copy data to offset, then release its pool buffer; delivered is
+        the end of the in-order data once this segment is in"""
+        self.size = max(self.size, offset + len(data))
+        self.delivered = max(self.delivered, delivered)
+        if self.queue is not None:
+            self.queue.put((offset, data, buffer, delivered))
+        else:
+            self.copy(offset, data, buffer, delivered)
+    
+    def copy(self, offset, data, buffer, delivered=0):
+        """Copy one segment into the mapping, across a window edge if need
+        be, then hash the in-order data once HASH_CHUNK bytes are pending"""
+        end = offset + len(data)
+        if end > self.allocated:
+            self.grow(end)
+        while offset < end:
+            index, start = divmod(offset, MAP_WINDOW)
+            count = min(end - offset, MAP_WINDOW - start)
+            self.window(index)[start:start + count] = data[:count]
+            data = data[count:]
+            offset += count
+        if self.pool is not None:
+            self.pool.put(buffer)
+        if delivered - self.hashed >= HASH_CHUNK:
+            self.hash(delivered)
+    
+    def hash(self, end):
+        """Feed the in-order bytes up to end to the digest"""
+        while self.hashed < end:
+            index, start = divmod(self.hashed, MAP_WINDOW)
+            count = min(end - self.hashed, MAP_WINDOW - start)
+            self.digest.update(self.window(index)[start:start + count])
+            self.hashed += count
+    
+    def grow(self, end):
+        """Extend the file to the next MAP_WINDOW boundary past end"""
+        target = (end // MAP_WINDOW + 1) * MAP_WINDOW
+        try:
+            os.posix_fallocate(self.fd, self.allocated, target - self.allocated)
+        except AttributeError:
+            os.ftruncate(self.fd, target)  # Not available on this platform
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            os.ftruncate(self.fd, target)  # Not supported by the filesystem
+        self.allocated = target
+    
+    def window(self, index):
+        """The mapping of window index, unmapping the least recently used
+        one to make room if needed"""
+        window = self.windows.pop(index, None)
+        if window is None:
+            if len(self.windows) >= MAPPED_WINDOWS:
+                self.windows.pop(next(iter(self.windows))).close()
+            window = mmap.mmap(self.fd, MAP_WINDOW, offset=index * MAP_WINDOW)
+        self.windows[index] = window
+        return window
+    
+    def writer(self):
+        """Writer thread: copy queued segments until close() queues None"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self.copy(*item)
+                except OSError as e:
+                    self.error = e
+    
+    def close(self):
+        """Finish queued copies and the digest, unmap the file, cut it to its
+        size and close it; raises the writer thread's error, if any"""
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+        try:
+            if self.error is None:
+                self.hash(self.delivered)
+            for window in self.windows.values():
+                window.close()
+            self.windows = {}
+            if self.error is not None:
+                raise self.error
+            os.ftruncate(self.fd, self.size)
+        finally:
+            os.close(self.fd)
+
+def check_digest(filename, received, expected):
+    """Print the machine-readable integrity line for filename; True if the
+    digests match"""
+    status = 'ok' if received == expected else 'mismatch'
+    print(f"DIGEST file={filename} md5={received.hex()} expected={expected.hex()} status={status}")
+    return received == expected
+
+class AckPolicy:
+    """Delayed ACKs (RFC 5681, section 4.2).
+
+    In-order data is ACKed every ack_every segments, or ACK_DELAY after the
+    first unacknowledged one. Anything else (out-of-order, duplicate or
+    hole-filling segments) is ACKed at once, so the sender's loss detection
+    is not slowed down. Each ACK echoes the TSval of the oldest segment it
+    covers (RFC 7323) and reports how many segments it covers, so the
+    sender can count bytes and scale its per-ACK RTT gains.
+    """
+    def __init__(self, ack_every=ACK_EVERY, delay=ACK_DELAY):
+        self.ack_every = ack_every
+        self.delay = delay
+        self.pending = 0  # Segments received since the last ACK
+        self.tsecr = 0  # TSval to echo
+        self.deadline = None  # When the delayed ACK is due
+        self.acks_sent = 0
+        self.segments = 0
+    
+    def on_segment(self, tsval, in_order):
+        """Count a received segment; returns True if it must be ACKed now"""
+        if self.pending == 0:
+            self.tsecr = tsval
+            self.deadline = time.time() + self.delay
+        self.pending += 1
+        self.segments += 1
+        return not in_order or self.pending >= self.ack_every
+    
+    def due(self):
+        """True if a delayed ACK is pending and its timer has expired"""
+        return self.pending > 0 and time.time() >= self.deadline
+    
+    def on_ack_sent(self):
+        """An ACK covering every pending segment went out; returns
+        (tsecr, segments covered)"""
+        covered = (self.tsecr, self.pending)
+        self.pending = 0
+        self.deadline = None
+        self.acks_sent += 1
+        return covered
+
+class FecBlock:
+    """What has arrived of one FEC block"""
+    __slots__ = ('count', 'payload_xor', 'length_xor', 'index_xor', 'k', 'parity', 'parity_length_xor')
+    
+    def __init__(self):
+        self.count = 0  # Data segments received
+        self.payload_xor = 0  # XOR of their payloads, as a little-endian int
+        self.length_xor = 0
+        self.index_xor = 0
+        self.k = None  # Block size, known once the parity arrives
+        self.parity = 0
+        self.parity_length_xor = 0
+
+class FecDecoder:
+    """Rebuilds a lost segment from its block's XOR parity.
+
+    Data segments carry their index in the block, so the block start is
+    known without the parity. Each block keeps running XORs of what has
+    arrived; once the parity is in and exactly one segment is missing, its
+    index, length and payload are the XOR of the parity with those.
+
+    The server sizes blocks by the losses ACKs report: repairs minus
+    duplicate data segments received. A duplicate means one transmission
+    was not needed, either a spurious retransmission or a late original of
+    a rebuilt segment, so reordering alone does not read as loss.
+    """
+    def __init__(self):
+        self.blocks = {}  # block start -> FecBlock
+        self.repaired = 0  # Segments rebuilt
+        self.duplicates = 0  # Data segments received again
+    
+    def add(self, seq_num, data, index):
+        """Record a newly received data segment; returns a rebuilt
+        (seq_num, data) or None"""
+        start = seq_num - index * DATA_SIZE
+        block = self.blocks.get(start)
+        if block is None:
+            block = self.blocks[start] = FecBlock()
+        block.count += 1
+        block.payload_xor ^= int.from_bytes(data, 'little')
+        block.length_xor ^= len(data)
+        block.index_xor ^= index
+        return self.repair(start, block)
+    
+    def add_parity(self, start, k, length_xor, payload, expected_seq):
+        """Record a parity segment; returns a rebuilt (seq_num, data) or None"""
+        if start + (k - 1) * DATA_SIZE < expected_seq:
+            # Every segment of the block was delivered already
+            self.blocks.pop(start, None)
+            return None
+        block = self.blocks.get(start)
+        if block is None:
+            block = self.blocks[start] = FecBlock()
+        block.k = k
+        block.parity = int.from_bytes(payload, 'little')
+        block.parity_length_xor = length_xor
+        return self.repair(start, block)
+    
+    def repair(self, start, block):
+        """Rebuild the block's only missing segment, forgetting blocks with
+        nothing left to repair"""
+        if block.k is None or block.count < block.k - 1:
+            return None
+        del self.blocks[start]
+        if block.count >= block.k:
+            return None
+        # XOR of 0..k-1 without the indices that arrived
+        index = block.index_xor
+        for i in range(block.k):
+            index ^= i
+        length = block.parity_length_xor ^ block.length_xor
+        data = (block.parity ^ block.payload_xor).to_bytes(DATA_SIZE, 'little')[:length]
+        self.repaired += 1
+        return start + index * DATA_SIZE, data
+    
+    def losses(self):
+        """The loss count echoed in every ACK (16 bits; it may go down)"""
+        return (self.repaired - self.duplicates) & 0xFFFF
+    
+    def prune(self, ack_num):
+        """Forget blocks that end at or below the cumulative ACK, in arrival
+        order; a block whose parity never came is assumed FEC_MAX_K long"""
+        blocks = self.blocks
+        while blocks:
+            start = next(iter(blocks))
+            if start + (blocks[start].k or FEC_MAX_K) * DATA_SIZE > ack_num:
+                break
+            del blocks[start]
 
 class CongestionControlClient:
-    def __init__(self, server_ip, server_port, pref_filename):
+    def __init__(self, server_ip, server_port, pref_filename, gro=False, writer_thread=False):
         self.server_ip = server_ip
         self.server_port = server_port
         self.pref_filename = pref_filename
@@ -27,23 +583,95 @@ class CongestionControlClient:
         
         # Receive buffer
         self.expected_seq = 0
-        self.buffer = {}  # seq_num -> data (for out-of-order packets)
-        self.received_data = []
+        self.received = SegmentBitmap()  # Arrivals above expected_seq, reported as SACK blocks
+        self.sink = None  # FileSink for the output file
+        self.fec = FecDecoder()  # Repairs single losses when the server sends parity
+        self.acks = AckPolicy()
+        
+        # UDP GRO: let the kernel hand over coalesced batches of datagrams
+        self.gro = gro
+        self.writer_thread = writer_thread  # Write to disk off the receive loop
         
         print(f"Client connecting to {self.server_ip}:{self.server_port}")
     
     def parse_packet(self, packet):
-        """Parse packet to extract seq_num and data"""
+        """Parse packet to extract seq_num, sender timestamp, data and the
+        FEC fields (flags, k, index or XOR of lengths); data is a view into
+        packet when packet is a memoryview"""
         if len(packet) < HEADER_SIZE:
-            return None, None
+            return None, 0, None, None
         
-        seq_num = struct.unpack('!I', packet[:4])[0]
+        seq_num, tsval, *fec = DATA_HEADER.unpack_from(packet)
         data = packet[HEADER_SIZE:]
-        return seq_num, data
+        return seq_num, tsval, data, fec
+    
+    def create_ack(self, ack_num, sack_blocks=(), tsecr=0, segments=0):
+        """Create ACK packet: cumulative ACK, up to two SACK blocks, TSecr
+        and the number of segments it acknowledges"""
+        # Blocks are sent as (offset past ack_num, length) in segments;
+        # length 0 marks an unused block. TSecr echoes the TSval of the
+        # packet being acknowledged (0 = none)
+        fields = [0] * (2 * MAX_SACK_BLOCKS)
+        for i, (start, end) in enumerate(sack_blocks):
+            offset = (start - ack_num) // DATA_SIZE
+            length = (end - start + DATA_SIZE - 1) // DATA_SIZE
+            if offset + length > 0xFFFF:
+                break
+            fields[2 * i] = offset
+            fields[2 * i + 1] = length
+        return ACK_HEADER.pack(ack_num, *fields, tsecr, segments, self.fec.losses())
+    
+    def eof_digest(self, data, fec):
+        """The server's MD5 digest if the header flags the EOF marker, else None"""
+        if not fec[0] & EOF_FLAG or len(data) != len(EOF_MARKER) + DIGEST_SIZE:
+            return None
+        return bytes(data[len(EOF_MARKER):])
+    
+    def send_ack(self):
+        """Acknowledge every segment received so far"""
+        tsecr, segments = self.acks.on_ack_sent()
+        ack = self.create_ack(self.expected_seq, self.received.blocks(), tsecr, segments)
+        self.sock.sendto(ack, (self.server_ip, self.server_port))
     
-    def create_ack(self, ack_num):
-        """Create ACK packet"""
-        return struct.pack('!I', ack_num) + b'\x00' * 16
+    def store_segment(self, seq_num, data, buffer=None):
+        """Copy a new segment to the sink at its offset and advance
+        expected_seq past it (and the run of earlier arrivals it joins, if
+        any); returns False for duplicates, whose buffer stays with the caller"""
+        if not self.received.add(seq_num, len(data)):
+            return False
+        self.expected_seq = self.received.base
+        self.sink.write(seq_num, data, buffer, self.expected_seq)
+        return True
+    
+    def handle_data(self, seq_num, data, fec, buffer=None):
+        """Store a data or parity segment, plus whatever the parity rebuilds;
+        returns True if the sink took over buffer"""
+        flags, k, field = fec
+        stored = False
+        if flags & FEC_PARITY:
+            rebuilt = self.fec.add_parity(seq_num, k, field, data, self.expected_seq)
+        else:
+            stored = self.store_segment(seq_num, data, buffer)
+            if not flags & FEC_DATA:
+                return stored
+            if not stored:
+                self.fec.duplicates += 1
+                return stored
+            # data is still intact: the pool only reuses a released buffer
+            # on the next receive
+            rebuilt = self.fec.add(seq_num, data, field)
+        if rebuilt is not None:
+            self.store_segment(*rebuilt)
+        self.fec.prune(self.expected_seq)
+        return stored
+    
+    def enable_gro(self):
+        """Turn on UDP GRO if the kernel supports it; returns True on success"""
+        try:
+            self.sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+        except OSError:
+            return False
+        return True
     
     def send_request(self):
         """Send file request to server with retries"""
@@ -76,96 +704,117 @@ class CongestionControlClient:
         if first_packet is None:
             return False
         
-        self.sock.settimeout(0.5)
+        # From here on the socket never blocks: BatchReceiver waits with
+        # poll(), then drains everything queued in as few syscalls as it can
+        self.sock.setblocking(False)
+        
+        # Enable GRO only after the first packet, which send_request() reads
+        # with a single-datagram buffer
+        if self.gro and not self.enable_gro():
+            print("UDP GRO not supported by this kernel, receiving one datagram at a time")
+            self.gro = False
+        pool = BufferPool()
+        receiver = BatchReceiver(self.sock, pool, self.gro)
+        try:
+            self.sink = FileSink(output_filename, pool, self.writer_thread)
+        except OSError as e:
+            print(f"Error opening output file: {e}")
+            return False
         
         start_time = time.time()
         self.expected_seq = 0
-        self.buffer = {}
-        self.received_data = []
+        self.received = SegmentBitmap()
+        self.fec = FecDecoder()
+        self.acks = AckPolicy()
         
-        packets_to_process = [first_packet]
+        packets_to_process = [(first_packet, None)]
         last_ack_time = time.time()
-        consecutive_timeouts = 0
+        last_packet_time = time.time()
         last_progress_time = time.time()
         
         while True:
-            # Process pending packets
-            for packet in packets_to_process:
-                seq_num, data = self.parse_packet(packet)
+            # Process the whole batch, then make one ACK decision for it
+            ack_now = False
+            for packet, buffer in packets_to_process:
+                seq_num, tsval, data, fec = self.parse_packet(packet)
                 
                 if seq_num is None:
+                    pool.put(buffer)
                     continue
                 
                 # Check for EOF
-                if data == b'EOF':
+                expected_digest = self.eof_digest(data, fec)
+                if expected_digest is not None:
                     print("\nReceived EOF marker")
                     final_ack = self.create_ack(self.expected_seq)
                     for _ in range(5):
                         self.sock.sendto(final_ack, (self.server_ip, self.server_port))
                     
                     try:
-                        with open(output_filename, 'wb') as f:
-                            f.write(b''.join(self.received_data))
+                        self.sink.close()
                         
                         duration = time.time() - start_time
-                        total_bytes = sum(len(d) for d in self.received_data)
+                        total_bytes = self.expected_seq
                         print(f"File received successfully: {total_bytes} bytes")
                         print(f"Duration: {duration:.2f}s")
                         print(f"Throughput: {(total_bytes * 8 / duration / 1_000_000):.2f} Mbps")
-                        return True
+                        print(f"ACKs sent: {self.acks.acks_sent} for {self.acks.segments} segments")
+                        print(f"Receive: {receiver.datagrams} datagrams in {receiver.syscalls} syscalls ({receiver.mode()}), {pool.slabs} buffer slabs")
+                        if self.fec.repaired:
+                            print(f"FEC repaired: {self.fec.repaired} segments")
+                        return check_digest(output_filename, self.sink.digest.digest(), expected_digest)
                     except Exception as e:
                         print(f"Error writing file: {e}")
                         return False
                 
                 # Handle data packet
-                if seq_num == self.expected_seq:
-                    # In-order packet
-                    self.received_data.append(data)
-                    self.expected_seq += len(data)
-                    
-                    # Deliver buffered packets
-                    while self.expected_seq in self.buffer:
-                        buffered_data = self.buffer.pop(self.expected_seq)
-                        self.received_data.append(buffered_data)
-                        self.expected_seq += len(buffered_data)
-                    
-                elif seq_num > self.expected_seq:
-                    # Out-of-order packet
-                    if seq_num not in self.buffer:
-                        self.buffer[seq_num] = data
+                expected_seq = self.expected_seq
+                had_gap = bool(self.received)
+                if not self.handle_data(seq_num, data, fec, buffer):
+                    pool.put(buffer)
                 
-                # Send cumulative ACK
-                ack = self.create_ack(self.expected_seq)
-                self.sock.sendto(ack, (self.server_ip, self.server_port))
-                last_ack_time = time.time()
+                # Cumulative ACK due now, unless this just extended gap-free
+                # in-order data
+                in_order = self.expected_seq > expected_seq and not had_gap and not self.received
+                ack_now |= self.acks.on_segment(tsval, in_order)
             
-            packets_to_process = []
+            if ack_now or self.acks.due():
+                self.send_ack()
+                last_ack_time = time.time()
             
-            # Try to receive more packets
-            try:
-                packet, _ = self.sock.recvfrom(MAX_PAYLOAD)
-                packets_to_process.append(packet)
-                consecutive_timeouts = 0
+            # Drain everything the kernel has queued for us
+            packets_to_process = receiver.recv(ACK_DELAY)
+            if packets_to_process:
+                last_packet_time = time.time()
                 
                 # Progress indicator
                 if time.time() - last_progress_time > 2.0:
-                    received_mb = sum(len(d) for d in self.received_data) / (1024 * 1024)
+                    received_mb = self.expected_seq / (1024 * 1024)
                     print(f"Received: {received_mb:.2f} MB")
                     last_progress_time = time.time()
                     
-            except socket.timeout:
-                consecutive_timeouts += 1
+            else:
+                if self.acks.pending:
+                    # No more data is coming right now: don't hold the ACK back
+                    self.send_ack()
+                    last_ack_time = time.time()
                 
                 # Send duplicate ACK
-                if time.time() - last_ack_time > 0.2:
-                    ack = self.create_ack(self.expected_seq)
+                elif time.time() - last_ack_time > 0.2:
+                    ack = self.create_ack(self.expected_seq, self.received.blocks())
                     self.sock.sendto(ack, (self.server_ip, self.server_port))
                     last_ack_time = time.time()
                 
-                if consecutive_timeouts > 20:
+                if time.time() - last_packet_time > IDLE_LIMIT:
                     print("\nTransfer appears complete (timeout)")
                     break
         
+        # Without the EOF marker the file is incomplete: don't leave it behind
+        try:
+            self.sink.close()
+            os.remove(output_filename)
+        except OSError:
+            pass
         return False
     
     def run(self):
@@ -180,15 +829,17 @@ class CongestionControlClient:
             print("Client finished with errors")
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python3 p2_client.py <SERVER_IP> <SERVER_PORT> <PREF_FILENAME>")
+    options = sys.argv[4:]
+    if len(sys.argv) < 4 or any(opt not in ('--gro', '--writer-thread') for opt in options):
+        print("Usage: python3 p2_client.py <SERVER_IP> <SERVER_PORT> <PREF_FILENAME> [--gro] [--writer-thread]")
         sys.exit(1)
     
     server_ip = sys.argv[1]
     server_port = int(sys.argv[2])
     pref_filename = sys.argv[3]
     
-    client = CongestionControlClient(server_ip, server_port, pref_filename)
+    client = CongestionControlClient(server_ip, server_port, pref_filename, gro='--gro' in options,
+                                     writer_thread='--writer-thread' in options)
     client.run()
 
 if __name__ == "__main__":
@@ -7,7 +7,6 @@ from mininet.log import setLogLevel
 from mininet.node import Controller
 import time, re, os
 import sys
-import hashlib
 import shutil
 import tempfile
 
@@ -94,21 +93,20 @@ def jain_fairness_index(allocations):
     return jfi
 
 
-def compute_md5(file_path):
-    """Compute the MD5 hash of a file on the controller host (local filesystem).
-    Returns hex digest or None if file doesn't exist."""
-    hasher = hashlib.md5()
+def read_md5(output_path):
+    """MD5 of the received file from the DIGEST line in the client's output
+    (hashed by the client as the data arrived, and checked against the
+    server's). Returns hex digest or None if the transfer didn't complete."""
     try:
-        with open(file_path, 'rb') as file:
-            while True:
-                chunk = file.read(8192)
-                if not chunk:
-                    break
-                hasher.update(chunk)
-        return hasher.hexdigest()
+        with open(output_path) as file:
+            for line in file:
+                match = re.match(r"DIGEST .*md5=([0-9a-f]{32}) ", line)
+                if match:
+                    return match.group(1)
     except FileNotFoundError:
-        # file not present on controller filesystem
-        return None
+        # client output not present on controller filesystem
+        pass
+    return None
 
 
 def get_file_size_bytes(file_path):
@@ -231,9 +229,9 @@ def run_trial(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mean=None, i
     dur_c1 = max(end_time_c1 - start_time_c1, 1e-9)
     dur_c2 = max(end_time_c2 - start_time_c2, 1e-9)
 
-    # compute MD5s using controller-local files
-    hash1 = compute_md5(f"{pref_c1}received_data.txt")
-    hash2 = compute_md5(f"{pref_c2}received_data.txt")
+    # MD5s as reported by the clients, no need to re-read the files
+    hash1 = read_md5(f"/tmp/{pref_c1}.out")
+    hash2 = read_md5(f"/tmp/{pref_c2}.out")
 
     # compute file sizes if available on controller
     size1 = get_file_size_bytes(f"{pref_c1}received_data.txt")
@@ -421,9 +419,9 @@ def run_trial_with_udp(output_handle, bw=100, loss=0, delay_c2_ms=5, udp_off_mea
     dur_c1 = max(end_time_c1 - start_time_c1, 1e-9)
     dur_c2 = max(end_time_c2 - start_time_c2, 1e-9)
 
-    # compute MD5s using controller-local files
-    hash1 = compute_md5(f"{pref_c1}received_data.txt")
-    hash2 = compute_md5(f"{pref_c2}received_data.txt")
+    # MD5s as reported by the clients, no need to re-read the files
+    hash1 = read_md5(f"/tmp/{pref_c1}.out")
+    hash2 = read_md5(f"/tmp/{pref_c2}.out")
 
     # compute file sizes if available on controller
     size1 = get_file_size_bytes(f"{pref_c1}received_data.txt")
@@ -3,6 +3,14 @@
 Part 1 Server: Reliable UDP File Transfer
 Implements sliding window protocol with ACKs, timeouts, fast retransmit,
 and CUBIC Congestion Control.
+
+The send-side components (BatchSender, Segment, InFlightWindow,
+RetransmitQueue, SackScoreboard, RtoEstimator, RackTlp, parse_options and
+the digest and timestamp helpers) are copies of those in part1/p1_server.py,
+since each part is submitted and run as standalone scripts. Change both
+copies together. Only these copies have GSO and FEC parity in BatchSender,
+delivery-rate and FEC fields in Segment, and a SackScoreboard.ack_through()
+that returns the SACKed bytes it drops.
 """
 
 import socket
@@ -10,107 +18,908 @@ import sys
 import time
 import struct
 import os
+import selectors
+import heapq
+import mmap
+import ctypes
+import errno
+import signal
+import collections
+import math
+import random
+import bisect
+import hashlib
 
 # Constants
 MAX_PAYLOAD = 1200
 HEADER_SIZE = 20
 DATA_SIZE = MAX_PAYLOAD - HEADER_SIZE  # 1180 bytes
 INITIAL_TIMEOUT = 1.0
+MIN_RTO = 0.1  # Default RTO bounds, in seconds
+MAX_RTO = 2.0
 ALPHA = 1/8
 BETA = 1/4
 K = 4
+DATA_HEADER = struct.Struct('!IIBBH8x')  # seq_num + TSval + FEC flags, k, index (parity: XOR of lengths) + 8 reserved bytes
+ACK_HEADER = struct.Struct('!I4HIHH')  # ack_num + 2 SACK blocks (offset, length in segments) + TSecr + segments ACKed + FEC repairs minus duplicates
+SACK_DUP_THRESH = 3  # A hole is lost once this many segments above it are SACKed
+ABC_LIMIT = 2  # Slow start grows by at most this many MSS per ACK (RFC 3465), or the segments a stretch ACK covers
+MAX_ACK_DELAY = 0.01  # Longest a client holds back a delayed ACK, in seconds
+SEND_BATCH = 256  # Max segments handed to the kernel per sendmmsg()
+GSO_SEGMENTS = 48  # Segments per GSO buffer (48 * 1200 fits one UDP datagram)
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = 103  # linux/udp.h
+EOF_REPEATS = 5  # Copies of the EOF marker sent to each client
+EOF_INTERVAL = 0.1  # Seconds between EOF copies
+FLOW_IDLE_LIMIT = 10.0  # Abandon a flow after this long without an ACK, in seconds
+EOF_MARKER = b'EOF'  # EOF payload: the marker followed by the file's MD5 digest
+PACING_GAIN = 1.2  # Default pacing rate = gain * cwnd / sRTT in congestion avoidance
+PACING_SS_GAIN = 2.0  # Minimum gain during slow start, so pacing never caps its growth
+PACING_QUANTUM = 0.002  # Largest burst a paced flow may send at once, in seconds of its rate
+SO_MAX_PACING_RATE = getattr(socket, 'SO_MAX_PACING_RATE', 47)  # asm-generic/socket.h
+ECHO_SLACK = 0.001  # TSval and Segment.send_time are taken this far apart at most
+RETRANSMIT_CAUSES = ('timeout', 'fast', 'sack', 'partial', 'rack', 'tlp')
+FEC_DATA = 0x01  # Header flag: data segment covered by a parity block
+FEC_PARITY = 0x02  # Header flag: XOR parity of the block starting at seq_num
+EOF_FLAG = 0x04  # Header flag: the segment is the EOF marker
+FEC_MIN_K = 4  # Bounds of the data segments per parity segment
+FEC_MAX_K = 32
+FEC_LOSS_K = 0.25  # k = FEC_LOSS_K / loss rate: about one loss per four blocks
+FEC_LOSS_WINDOW = 128  # New segments per loss-rate sample
+FEC_LOSS_GAIN = 1/4  # EWMA gain of the loss-rate estimate
 
-class ReliableUDPServer:
-    def __init__(self, server_ip, server_port, initial_cwnd=DATA_SIZE):
-        self.server_ip = server_ip
-        self.server_port = server_port
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind((self.server_ip, self.server_port))
+# sendmmsg(2) through ctypes; None where libc does not provide it
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _sendmmsg = _libc.sendmmsg
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+except (OSError, AttributeError):
+    _sendmmsg = None
+
+def enable_udp_gso(sock):
+    """Turn on UDP GSO for sock if the kernel supports it; returns True on success"""
+    try:
+        # Socket-wide segment size: datagrams up to MAX_PAYLOAD go out
+        # unchanged, larger buffers are split into MAX_PAYLOAD datagrams
+        sock.setsockopt(SOL_UDP, UDP_SEGMENT, MAX_PAYLOAD)
+    except OSError:
+        return False
+    return True
+
+def set_max_pacing_rate(sock, rate):
+    """Cap sock's send rate (bytes/s, None = unlimited) via SO_MAX_PACING_RATE.
+
+    Enforced by the fq qdisc, which spreads each flow's datagrams in the
+    kernel; a no-op on other qdiscs. Returns True if the kernel accepted it.
+    """
+    value = 0xFFFFFFFF if rate is None else max(1, min(int(rate), 0xFFFFFFFE))
+    try:
+        # Unsigned 32-bit option: pack it, setsockopt() would take an int as signed
+        sock.setsockopt(socket.SOL_SOCKET, SO_MAX_PACING_RATE, struct.pack('=I', value))
+    except OSError:
+        return False
+    return True
+
+def map_file(filename):
+    """Map filename for sending; returns (mapping or None if empty, size)"""
+    with open(filename, 'rb') as f:
+        total_bytes = os.fstat(f.fileno()).st_size
+        # mmap cannot map an empty file; ACCESS_COPY lets ctypes take the
+        # mapping's address for sendmmsg (pages are never written)
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) if total_bytes else None
+    return mapping, total_bytes
+
+_digests = {}  # filename -> (mtime_ns, size, MD5 digest)
+
+def file_digest(filename):
+    """MD5 digest of filename for the EOF segment, recomputed only when its
+    modification time or size changes"""
+    st = os.stat(filename)
+    cached = _digests.get(filename)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    hasher = hashlib.md5()
+    with open(filename, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+    _digests[filename] = (st.st_mtime_ns, st.st_size, hasher.digest())
+    return hasher.digest()
+
+def warm_digest(filename):
+    """Hash filename ahead of the first request, if it exists"""
+    try:
+        file_digest(filename)
+    except FileNotFoundError:
+        pass
+
+def timestamp():
+    """Current time as a 32-bit microsecond TSval; never 0, which means 'none'"""
+    return (int(time.time() * 1_000_000) & 0xFFFFFFFF) or 1
+
+def timestamp_age(tsecr):
+    """Seconds since the echoed TSval was sent (wraps every ~71 minutes)"""
+    return ((timestamp() - tsecr) & 0xFFFFFFFF) / 1_000_000
+
+def echo_predates(tsecr, send_time):
+    """True if the echoed TSval was sent before send_time: the ACK was
+    triggered by an earlier transmission (Eifel detection, RFC 3522)"""
+    return time.time() - timestamp_age(tsecr) < send_time - ECHO_SLACK
+
+class IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.c_void_p), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', MsgHdr), ('msg_len', ctypes.c_uint)]
+
+class SockAddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_uint8 * 4), ('sin_zero', ctypes.c_uint8 * 8)]
+
+class BatchSender:
+    """Sends data segments straight from the file mapping.
+
+    Segments queued while filling the window are pushed to the kernel with a
+    single sendmmsg() per batch, each message gathering header slots and
+    slices of the mapping. Without sendmmsg it falls back to one sendmsg() per
+    message. Every send syscall is counted in self.syscalls.
+
+    With UDP GSO enabled a message carries a run of up to GSO_SEGMENTS
+    back-to-back [header | payload] segments; the kernel splits it at
+    MAX_PAYLOAD boundaries, so each datagram on the wire keeps its own header.
+    
+    FEC parity segments are queued with their own payload and travel in the
+    same batches as the data they protect.
+    """
+    def __init__(self, sock, gso_segments=1, capacity=SEND_BATCH):
+        self.sock = sock
+        self.capacity = capacity
+        self.syscalls = 0
+        self.pending = []  # (seq_num, length, flags, k, field, payload) waiting for flush()
+        self.client_addr = None
+        self.file_view = memoryview(b'')
+        self.header = bytearray(HEADER_SIZE)  # Reused for single sends
+        self.headers = (ctypes.c_char * (capacity * HEADER_SIZE))()
+        self.gso_segments = gso_segments  # Segments per message (1 = no offload)
+        self.use_mmsg = _sendmmsg is not None
+        if self.use_mmsg:
+            self.addr = SockAddrIn()
+            self.iov = (IoVec * (2 * capacity))()
+            self.msgs = (MMsgHdr * capacity)()
+            headers_base = ctypes.addressof(self.headers)
+            for i in range(capacity):
+                self.iov[2 * i].iov_base = headers_base + i * HEADER_SIZE
+                self.iov[2 * i].iov_len = HEADER_SIZE
+                hdr = self.msgs[i].msg_hdr
+                hdr.msg_name = ctypes.addressof(self.addr)
+                hdr.msg_namelen = ctypes.sizeof(SockAddrIn)
+        self.mapping_ref = None
+        self.mapping_base = 0
+    
+    def start(self, mapping, client_addr):
+        """Point the sender at a new file mapping and destination"""
+        self.client_addr = client_addr
+        self.file_view = memoryview(mapping) if mapping is not None else memoryview(b'')
+        if self.use_mmsg:
+            ip, port = client_addr
+            self.addr.sin_family = socket.AF_INET
+            self.addr.sin_port = socket.htons(port)
+            self.addr.sin_addr[:] = socket.inet_aton(ip)
+            if mapping is not None:
+                # Needs a writable (ACCESS_COPY) mapping; pins it until finish()
+                self.mapping_ref = ctypes.c_char.from_buffer(mapping)
+                self.mapping_base = ctypes.addressof(self.mapping_ref)
+    
+    def finish(self):
+        """Release every reference to the mapping so it can be closed"""
+        self.flush()
+        self.file_view.release()
+        self.file_view = memoryview(b'')
+        self.mapping_ref = None
+        self.mapping_base = 0
+    
+    def mode(self):
+        """Short description of the send path for reports"""
+        mode = "sendmmsg" if self.use_mmsg else "sendmsg"
+        if self.gso_segments > 1:
+            mode += " + GSO"
+        return mode
+    
+    def send(self, seq_num, length, flags=0, index=0):
+        """Send one segment immediately with sendmsg()"""
+        DATA_HEADER.pack_into(self.header, 0, seq_num, timestamp(), flags, 0, index)
+        payload = self.file_view[seq_num:seq_num + length]
+        self.sock.sendmsg([self.header, payload], (), 0, self.client_addr)
+        self.syscalls += 1
+    
+    def queue(self, seq_num, length, flags=0, index=0):
+        """Queue a segment for the next batch, flushing when the batch is full"""
+        self.pending.append((seq_num, length, flags, 0, index, None))
+        if len(self.pending) >= self.capacity:
+            self.flush()
+    
+    def queue_parity(self, seq_num, k, length_xor, payload):
+        """Queue the parity segment of the FEC block starting at seq_num"""
+        self.pending.append((seq_num, len(payload), FEC_PARITY, k, length_xor, payload))
+        if len(self.pending) >= self.capacity:
+            self.flush()
+    
+    def runs(self, pending):
+        """Split pending segments into (start, count) messages.
+
+        A GSO message may only end with a short segment, so a run is cut
+        after any segment that is not a full DATA_SIZE.
+        """
+        start = 0
+        while start < len(pending):
+            count = 1
+            while (count < self.gso_segments and start + count < len(pending)
+                   and pending[start + count - 1][1] == DATA_SIZE):
+                count += 1
+            yield start, count
+            start += count
+    
+    def flush(self):
+        """Hand every queued segment to the kernel"""
+        pending = self.pending
+        if not pending:
+            return
+        self.pending = []
+        tsval = timestamp()
+        for i, (seq_num, _, flags, k, field, _) in enumerate(pending):
+            DATA_HEADER.pack_into(self.headers, i * HEADER_SIZE, seq_num, tsval, flags, k, field)
         
-        # RTT estimation
-        self.estimated_rtt = INITIAL_TIMEOUT
-        self.dev_rtt = 0
-        self.rto = INITIAL_TIMEOUT
+        if not self.use_mmsg:
+            headers = memoryview(self.headers).cast('B')
+            for start, count in self.runs(pending):
+                buffers = []
+                for i in range(start, start + count):
+                    seq_num, length, _, _, _, payload = pending[i]
+                    buffers.append(headers[i * HEADER_SIZE:(i + 1) * HEADER_SIZE])
+                    if payload is None:
+                        payload = self.file_view[seq_num:seq_num + length]
+                    buffers.append(payload)
+                self.sock.sendmsg(buffers, (), 0, self.client_addr)
+                self.syscalls += 1
+            return
         
-        # Window management
-        self.base = 0  # First unacknowledged byte
-        self.next_seq = 0  # Next byte to send
-        self.packets = {}  # seq_num -> (data, send_time)
-        self.dup_ack_count = {}  # ack_num -> count
+        iov = self.iov
+        for i, (seq_num, length, _, _, _, payload) in enumerate(pending):
+            if payload is None:
+                iov[2 * i + 1].iov_base = self.mapping_base + seq_num
+            else:
+                # Parity bytes stay referenced by pending until sendmmsg returns
+                iov[2 * i + 1].iov_base = ctypes.cast(ctypes.c_char_p(payload), ctypes.c_void_p).value
+            iov[2 * i + 1].iov_len = length
         
-        # CUBIC Congestion Control
-        self.initial_cwnd = initial_cwnd  # Initial window size in bytes
-        self.cwnd = initial_cwnd
-        self.ssthresh = 65535  # Start high
-        self.w_max = 0
-        self.t_epoch_start = 0
-        self.min_rtt = float('inf')
-        self.beta_cubic = 0.7  # Multiplicative decrease factor
-        self.C = 0.4  # CUBIC constant
-        self.last_congestion_event_time = 0
+        msgs = self.msgs
+        iov_base = ctypes.addressof(iov)
+        num_msgs = 0
+        for start, count in self.runs(pending):
+            hdr = msgs[num_msgs].msg_hdr
+            hdr.msg_iov = iov_base + 2 * start * ctypes.sizeof(IoVec)
+            hdr.msg_iovlen = 2 * count
+            num_msgs += 1
         
-        print(f"Server listening on {self.server_ip}:{self.server_port}")
-        print(f"Initial CWND: {self.initial_cwnd} bytes ({self.initial_cwnd / DATA_SIZE:.1f} MSS)")
+        sent = 0
+        fd = self.sock.fileno()
+        msgs_base = ctypes.addressof(msgs)
+        while sent < num_msgs:
+            result = _sendmmsg(fd, msgs_base + sent * ctypes.sizeof(MMsgHdr), num_msgs - sent, 0)
+            self.syscalls += 1
+            if result < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                raise OSError(err, os.strerror(err))
+            sent += result
+
+class Segment:
+    """Book-keeping for one in-flight segment"""
+    __slots__ = ('seq', 'length', 'send_time', 'retransmits', 'sacked',
+                 'delivered', 'delivered_time', 'first_sent_time', 'fec_index')
     
-    def create_packet(self, seq_num, data):
-        """Create a packet with header and data"""
-        # Header: 4 bytes seq_num + 16 bytes reserved
-        header = struct.pack('!I', seq_num) + b'\x00' * 16
-        return header + data
+    def __init__(self, seq, length, send_time):
+        self.seq = seq
+        self.length = length
+        self.send_time = send_time
+        self.retransmits = 0
+        self.sacked = False
+        # Flow's delivery counters when the segment was (last) sent
+        self.delivered = 0
+        self.delivered_time = send_time
+        self.first_sent_time = send_time
+        self.fec_index = None  # Position in its FEC block, None without FEC
+
+class RateSample:
+    """Delivery rate measured on one ACK (draft-cheng-iccrg-delivery-rate-estimation)"""
+    __slots__ = ('delivery_rate', 'delivered', 'prior_delivered', 'newly_delivered', 'in_flight')
     
-    def parse_ack(self, packet):
-        """Parse ACK packet to get ack number"""
-        if len(packet) < 4:
+    def __init__(self, delivery_rate, delivered, prior_delivered, newly_delivered, in_flight):
+        self.delivery_rate = delivery_rate  # Bytes/s, None if the interval was empty
+        self.delivered = delivered  # Flow's total delivered bytes
+        self.prior_delivered = prior_delivered  # Total when the sampled segment was sent
+        self.newly_delivered = newly_delivered  # Bytes ACKed or SACKed by this ACK
+        self.in_flight = in_flight
+
+class InFlightWindow:
+    """In-flight segments in sequence order, stored as a list with a moving head.
+
+    Segments are DATA_SIZE bytes apart, so a segment is found by offset from
+    the head, and a cumulative ACK just advances the head past the prefix.
+    """
+    def __init__(self):
+        self.slots = []
+        self.head = 0
+    
+    def __len__(self):
+        return len(self.slots) - self.head
+    
+    def append(self, segment):
+        """Add the segment just sent past the current right edge"""
+        self.slots.append(segment)
+    
+    def get(self, seq_num):
+        """Return the in-flight segment starting at seq_num, or None"""
+        if self.head == len(self.slots):
             return None
-        ack_num = struct.unpack('!I', packet[:4])[0]
-        return ack_num
+        idx = self.head + (seq_num - self.slots[self.head].seq) // DATA_SIZE
+        if self.head <= idx < len(self.slots):
+            segment = self.slots[idx]
+            if segment.seq == seq_num:
+                return segment
+        return None
     
-    def update_rtt(self, sample_rtt):
-        """Update RTT estimates using TCP-like algorithm"""
-        self.estimated_rtt = (1 - ALPHA) * self.estimated_rtt + ALPHA * sample_rtt
-        self.dev_rtt = (1 - BETA) * self.dev_rtt + BETA * abs(sample_rtt - self.estimated_rtt)
-        self.rto = self.estimated_rtt + K * self.dev_rtt
-        self.rto = max(0.1, min(self.rto, 2.0))  # Clamp between 0.1 and 2 seconds
-        
-        # CUBIC needs the minimum RTT
-        self.min_rtt = min(self.min_rtt, sample_rtt)
+    def ack_through(self, ack_num):
+        """Release every segment that starts below the cumulative ACK"""
+        slots = self.slots
+        head = self.head
+        end = len(slots)
+        while head < end and slots[head].seq < ack_num:
+            slots[head] = None
+            head += 1
+        # Compact once the released prefix dominates the list
+        if head > 1024 and head * 2 > end:
+            del slots[:head]
+            head = 0
+        self.head = head
 
-    def handle_congestion_event(self):
-        """Handle a congestion event (timeout or fast retransmit)."""
-        current_time = time.time()
-        # Debounce: Only trigger one event per RTO
-        if current_time - self.last_congestion_event_time < self.rto:
-            return
+class RetransmitQueue:
+    """Min-heap of (send_time, seq) over the in-flight window with lazy deletion.
+
+    Entries are never removed when a segment is ACKed or retransmitted; a
+    heap entry is simply ignored once it no longer matches the segment's
+    current send time, so expiry checks cost O(expired) instead of a scan
+    of the whole window.
+    """
+    def __init__(self, packets):
+        self.packets = packets  # InFlightWindow
+        self.heap = []
+    
+    def push(self, segment):
+        """Arm the timer for a segment that was just (re)transmitted"""
+        heapq.heappush(self.heap, (segment.send_time, segment.seq))
+    
+    def discard_stale(self):
+        """Drop entries for segments that were ACKed, SACKed or re-armed since"""
+        heap = self.heap
+        while heap:
+            send_time, seq_num = heap[0]
+            segment = self.packets.get(seq_num)
+            if segment is not None and segment.send_time == send_time and not segment.sacked:
+                return
+            heapq.heappop(heap)
+    
+    def oldest_send_time(self):
+        """Send time of the oldest in-flight segment (None if nothing in flight)"""
+        self.discard_stale()
+        return self.heap[0][0] if self.heap else None
+    
+    def pop_expired(self, deadline):
+        """Pop the oldest segment sent at or before deadline, or None"""
+        self.discard_stale()
+        if self.heap and self.heap[0][0] <= deadline:
+            return self.packets.get(heapq.heappop(self.heap)[1])
+        return None
+
+class SackScoreboard:
+    """Byte ranges the receiver has reported in SACK blocks.
+
+    A short sorted list of disjoint [start, end) ranges above the cumulative
+    ACK. update() returns only the newly covered pieces, so each segment is
+    marked once however often the receiver repeats a block.
+    """
+    def __init__(self):
+        self.ranges = []
+        self.high = 0  # Highest SACKed byte
+    
+    def update(self, start, end):
+        """Merge [start, end) in; returns the pieces not SACKed before"""
+        if start >= end:
+            # A stale block, already below the cumulative ACK
+            return []
+        new_pieces = []
+        kept = []
+        cursor = start
+        merged_start, merged_end = start, end
+        for range_start, range_end in self.ranges:
+            if range_end < start or range_start > end:
+                kept.append((range_start, range_end))
+                continue
+            # Overlapping or adjacent: the gap before it is new
+            if range_start > cursor:
+                new_pieces.append((cursor, range_start))
+            cursor = max(cursor, range_end)
+            merged_start = min(merged_start, range_start)
+            merged_end = max(merged_end, range_end)
+        if cursor < end:
+            new_pieces.append((cursor, end))
+        kept.append((merged_start, merged_end))
+        kept.sort()
+        self.ranges = kept
+        self.high = max(self.high, end)
+        return new_pieces
+    
+    def sacked_bytes(self):
+        """Bytes SACKed above the cumulative ACK"""
+        return sum(end - start for start, end in self.ranges)
+    
+    def ack_through(self, ack_num):
+        """Drop everything below the cumulative ACK; returns the SACKed bytes dropped"""
+        dropped = 0
+        if self.ranges and self.ranges[0][0] < ack_num:
+            kept = []
+            for start, end in self.ranges:
+                if start < ack_num:
+                    dropped += min(end, ack_num) - start
+                if end > ack_num:
+                    kept.append((max(start, ack_num), end))
+            self.ranges = kept
+        return dropped
+
+class HyStart:
+    """HyStart++ (RFC 9406) for the initial slow start.
+
+    Compares each round's minimum RTT with the previous round's. A rise of
+    more than RTT/8 (clamped to 4-16 ms) means a queue is building, so slow
+    start switches to Conservative Slow Start (a quarter of the growth).
+    If the RTT falls back, slow start resumes; after CSS_ROUNDS rounds of
+    CSS, slow start ends with ssthresh = cwnd.
+    """
+    MIN_RTT_THRESH = 0.004
+    MAX_RTT_THRESH = 0.016
+    MIN_RTT_DIVISOR = 8
+    N_RTT_SAMPLE = 8  # RTT samples a round needs before it is compared
+    CSS_GROWTH_DIVISOR = 4
+    CSS_ROUNDS = 5
+    
+    def __init__(self):
+        self.done = False  # Only the initial slow start is searched
+        self.window_end = 0  # The current round ends when this is ACKed
+        self.last_round_min_rtt = float('inf')
+        self.current_round_min_rtt = float('inf')
+        self.rtt_sample_count = 0
+        self.css_baseline_min_rtt = float('inf')  # Finite while in CSS
+        self.css_rounds = 0
+    
+    def in_css(self):
+        return self.css_baseline_min_rtt != float('inf')
+    
+    def on_rtt_sample(self, rtt):
+        self.current_round_min_rtt = min(self.current_round_min_rtt, rtt)
+        self.rtt_sample_count += 1
+    
+    def on_ack(self, ack_num, next_seq):
+        """Advance rounds and check for a delay increase; returns True when
+        slow start should end"""
+        if self.done:
+            return False
+        if ack_num >= self.window_end:
+            # New round: everything sent in the previous one is ACKed
+            self.window_end = next_seq
+            self.last_round_min_rtt = self.current_round_min_rtt
+            self.current_round_min_rtt = float('inf')
+            self.rtt_sample_count = 0
+            if self.in_css():
+                self.css_rounds += 1
+                if self.css_rounds >= self.CSS_ROUNDS:
+                    self.done = True
+                    return True
         
-        self.last_congestion_event_time = current_time
-        self.t_epoch_start = current_time  # Start new CUBIC epoch
-        self.w_max = self.cwnd  # Save max window
+        if self.rtt_sample_count < self.N_RTT_SAMPLE:
+            return False
+        if self.in_css():
+            if self.current_round_min_rtt < self.css_baseline_min_rtt:
+                # The RTT rise was spurious: back to standard slow start
+                self.css_baseline_min_rtt = float('inf')
+        elif self.last_round_min_rtt != float('inf'):
+            rtt_thresh = max(self.MIN_RTT_THRESH,
+                             min(self.last_round_min_rtt / self.MIN_RTT_DIVISOR, self.MAX_RTT_THRESH))
+            if self.current_round_min_rtt >= self.last_round_min_rtt + rtt_thresh:
+                self.css_baseline_min_rtt = self.current_round_min_rtt
+                self.css_rounds = 0
+        return False
+
+class RtoEstimator:
+    """Retransmission timeout after RFC 6298.
+
+    SRTT/RTTVAR are seeded from the first sample and smoothed after it;
+    with a timestamp sample on every ACK the gains are divided by the
+    number of ACKs expected per RTT (RFC 7323, Appendix G). Each timeout
+    doubles the RTO until the next valid sample (Karn's rule: the caller
+    never feeds samples whose transmission is ambiguous). A timeout that
+    proves spurious gives its backoff back.
+    """
+    def __init__(self, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = -1  # No sample yet
+        self.rttvar = 0
+        self.base_rto = INITIAL_TIMEOUT  # RTO before backoff
+        self.backoff = 0  # Timeouts since the last valid sample
+        self.rto = INITIAL_TIMEOUT
+    
+    def on_sample(self, sample_rtt, samples_per_rtt=1):
+        """Fold in an RTT sample taken from an unambiguous transmission"""
+        alpha = ALPHA / samples_per_rtt
+        beta = BETA / samples_per_rtt
+        if self.srtt == -1:
+            self.srtt = sample_rtt
+            self.rttvar = sample_rtt / 2
+        else:
+            self.rttvar = (1 - beta) * self.rttvar + beta * abs(sample_rtt - self.srtt)
+            self.srtt = (1 - alpha) * self.srtt + alpha * sample_rtt
+        self.base_rto = max(self.min_rto, min(self.srtt + K * self.rttvar, self.max_rto))
+        self.backoff = 0
+        self.rto = self.base_rto
+    
+    def on_timeout(self):
+        """Back the timer off exponentially"""
+        self.backoff += 1
+        self.rto = min(self.base_rto * 2 ** self.backoff, self.max_rto)
+    
+    def undo_backoff(self):
+        """The last timeout was spurious: return to the un-backed-off RTO"""
+        self.backoff = 0
+        self.rto = self.base_rto
+
+class FecEncoder:
+    """Adaptive XOR forward error correction.
+
+    New data is cut into blocks of k consecutive segments, each followed by
+    one parity segment: the XOR of the block's payloads (zero-padded to
+    DATA_SIZE) tagged with the XOR of their lengths. The client rebuilds a
+    single lost segment per block without waiting for a retransmission.
+    k tracks the loss rate: segments retransmitted or repaired per segment
+    sent, less the duplicates the client received. A duplicate is a
+    spurious retransmission or the late original of a repaired segment, so
+    the parity overhead of 1/k grows only on lossy paths, not on merely
+    reordering ones.
+    """
+    def __init__(self):
+        self.k = FEC_MAX_K
+        self.block_start = 0
+        self.count = 0  # Segments in the open block
+        self.parity = 0  # XOR of the open block's payloads, as a little-endian int
+        self.length_xor = 0
+        self.ends = []  # End of every closed block, ascending
+        self.parity_times = []  # When each closed block's parity was sent
+        self.parity_sent = 0
         
-        # Multiplicative decrease
-        self.ssthresh = max(self.cwnd * self.beta_cubic, 2 * DATA_SIZE)
-        self.cwnd = self.ssthresh  # CUBIC fast recovery
-        self.dup_ack_count = {}  # Reset dup ACKs
+        # Loss-rate estimate
+        self.loss_rate = 0.0
+        self.sent = 0  # New segments since the last sample
+        self.lost = 0  # Losses reported since the last sample, negative after late corrections
+        self.retransmits = 0  # Flow's retransmissions at the last ACK
+        self.client_losses = 0  # Client's repairs minus duplicates at the last ACK (16 bits)
+    
+    def add(self, seq_num, payload):
+        """Fold a new segment into the open block; returns its index there"""
+        if self.count == 0:
+            self.block_start = seq_num
+        index = self.count
+        self.parity ^= int.from_bytes(payload, 'little')
+        self.length_xor ^= len(payload)
+        self.count += 1
+        self.sent += 1
+        return index
+    
+    def block_full(self):
+        """True once the open block holds k segments"""
+        return self.count >= self.k
+    
+    def close(self, end_seq):
+        """Close the open block at end_seq; returns the arguments of its
+        parity segment for BatchSender.queue_parity()"""
+        parity = (self.block_start, self.count, self.length_xor,
+                  self.parity.to_bytes(DATA_SIZE, 'little'))
+        self.ends.append(end_seq)
+        self.parity_times.append(time.time())
+        self.count = self.parity = self.length_xor = 0
+        self.parity_sent += 1
+        self.update_k()
+        return parity
+    
+    def closed_below(self, seq_num, echo_time):
+        """End of the last block at or below seq_num whose parity was sent
+        no later than echo_time (0 if none): a hole there that is still
+        open after the client saw the parity, or what followed it, is lost"""
+        i = min(bisect.bisect_right(self.ends, seq_num),
+                bisect.bisect_right(self.parity_times, echo_time + ECHO_SLACK))
+        return self.ends[i - 1] if i else 0
+    
+    def on_ack(self, client_losses, retransmits):
+        """Count the losses reported since the last ACK: the flow's
+        retransmissions plus the client's repairs, minus the duplicates
+        it received"""
+        delta = (client_losses - self.client_losses) & 0xFFFF
+        if delta >= 0x8000:
+            # Duplicates, or a reordered older ACK; the counter is
+            # cumulative, so the next ACK nets the latter out
+            delta -= 0x10000
+        self.client_losses = client_losses
+        self.lost += delta + retransmits - self.retransmits
+        self.retransmits = retransmits
+    
+    def update_k(self):
+        """Fold the last FEC_LOSS_WINDOW segments into the loss rate and
+        size the next blocks for it"""
+        if self.sent < FEC_LOSS_WINDOW:
+            return
+        sample = min(max(self.lost, 0) / self.sent, 1.0)
+        self.loss_rate += FEC_LOSS_GAIN * (sample - self.loss_rate)
+        self.sent = 0
+        self.lost = min(self.lost, 0)  # Duplicates of losses already sampled carry over
+        if self.loss_rate > 0:
+            self.k = max(FEC_MIN_K, min(int(FEC_LOSS_K / self.loss_rate), FEC_MAX_K))
+        else:
+            self.k = FEC_MAX_K
+
+class RackTlp:
+    """RACK-TLP loss detection (RFC 8985).
+
+    RACK marks a segment lost once a segment sent after it has been
+    delivered and a reordering window has passed, instead of counting
+    duplicate ACKs, so reordered packets are not retransmitted and lost
+    retransmissions are caught without an RTO. TLP sends a probe when
+    the ACKs stop, so a lost tail costs about two RTTs instead of an RTO.
+    The segments are scanned oldest-sent first through the RetransmitQueue.
+    """
+    REO_WND_PERSIST = 16  # Loss episodes a widened reordering window lasts
+    
+    def __init__(self, rtx_queue):
+        self.rtx_queue = rtx_queue
+        self.xmit_time = 0  # Send time of the most recently sent delivered segment
+        self.end_seq = 0  # ... and its end, ordering segments sent at the same time
+        self.rtt = 0  # RTT of that segment
+        self.min_rtt = float('inf')
+        self.fack = 0  # Highest byte delivered
+        self.reordering_seen = False
+        self.reo_wnd_mult = 1
+        self.reo_wnd_persist = 0
+        self.reorder_deadline = None  # When the oldest candidate is lost, if still missing
+        self.probe_armed_at = 0  # Last send of new data or ACK arrival
+        self.tlp_end_seq = None  # Set while a probe is outstanding
+        self.tlp_segment = None  # The segment a retransmission probe resent
+    
+    def on_delivered(self, segment, current_time):
+        """Update the state from a segment the receiver just ACKed or SACKed"""
+        end = segment.seq + segment.length
+        if segment.retransmits == 0 and end < self.fack:
+            # Never resent, yet overtaken by later data
+            self.reordering_seen = True
+        self.fack = max(self.fack, end)
+        rtt = current_time - segment.send_time
+        if segment.retransmits and rtt < self.min_rtt:
+            # Too fast to be the retransmission: the original arrived late
+            return
+        self.min_rtt = min(self.min_rtt, rtt)
+        if (segment.send_time, end) > (self.xmit_time, self.end_seq):
+            self.xmit_time = segment.send_time
+            self.end_seq = end
+            self.rtt = rtt
+    
+    def on_spurious_retransmit(self):
+        """A retransmission proved unnecessary: widen the reordering window"""
+        self.reordering_seen = True
+        self.reo_wnd_mult += 1
+        self.reo_wnd_persist = self.REO_WND_PERSIST
+    
+    def reo_wnd(self, srtt, in_recovery, sacked_segments):
+        """Time a segment may lag behind later data before it counts as lost"""
+        if not self.reordering_seen and (in_recovery or sacked_segments >= SACK_DUP_THRESH):
+            return 0
+        return min(self.min_rtt / 4 * self.reo_wnd_mult, max(srtt, 0))
+    
+    def detect_lost(self, current_time, reo_wnd):
+        """Pop the in-flight segments RACK deems lost and re-arm the
+        reordering timer for the oldest one still within the window"""
+        lost = []
+        deadline = min(self.xmit_time, current_time - self.rtt - reo_wnd)
+        while True:
+            segment = self.rtx_queue.pop_expired(deadline)
+            if segment is None:
+                break
+            if segment.send_time == self.xmit_time and segment.seq >= self.end_seq:
+                # Sent together with the delivered segment, but after it
+                self.rtx_queue.push(segment)
+                break
+            lost.append(segment)
+        if lost and self.reo_wnd_persist:
+            self.reo_wnd_persist -= 1
+            if self.reo_wnd_persist == 0:
+                self.reo_wnd_mult = 1
         
-        print(f"--- Congestion Event --- W_max={self.w_max / DATA_SIZE:.1f}, "
-              f"ssthresh={self.ssthresh / DATA_SIZE:.1f}, "
-              f"new cwnd={self.cwnd / DATA_SIZE:.1f} MSS")
+        oldest_send_time = self.rtx_queue.oldest_send_time()
+        self.reorder_deadline = None
+        if oldest_send_time is not None and oldest_send_time < self.xmit_time:
+            self.reorder_deadline = oldest_send_time + self.rtt + reo_wnd
+        return lost
+    
+    def probe_deadline(self, srtt, rto, in_flight):
+        """When to send a tail loss probe, or None while one is not due"""
+        if srtt < 0 or self.tlp_end_seq is not None or self.reorder_deadline is not None:
+            return None
+        pto = 2 * srtt
+        if in_flight <= DATA_SIZE:
+            # A lone segment is ACKed only when the client's delayed-ACK timer fires
+            pto = max(pto, 1.5 * srtt + MAX_ACK_DELAY)
+        return self.probe_armed_at + min(pto, rto)
+    
+    def on_probe(self, end_seq, segment=None):
+        """A probe went out; segment is set when it was a retransmission"""
+        self.tlp_end_seq = end_seq
+        self.tlp_segment = segment
+    
+    def end_probe(self, ack_num):
+        """Close the probe episode once ack_num covers it; returns the
+        segment a retransmission probe resent, else None"""
+        if self.tlp_end_seq is None or ack_num < self.tlp_end_seq:
+            return None
+        segment = self.tlp_segment
+        self.tlp_end_seq = self.tlp_segment = None
+        return segment
+
+class CongestionControl:
+    """Base class for a flow's congestion controller.
 
-    def update_cwnd_on_ack(self):
+    The controller owns cwnd and ssthresh (in bytes); TransferFlow reports
+    events through the on_* hooks and reads cwnd before sending. Fast
+    recovery itself (window inflation, partial ACKs) is run by the flow;
+    on_ack is not called until recovery ends.
+    """
+    name = None
+    partial_ack_recovery = True  # Stay in fast recovery until the recovery point is ACKed
+    
+    def __init__(self, initial_cwnd):
+        self.cwnd = initial_cwnd
+        self.ssthresh = float('inf')  # HyStart++ or the first loss sets it
+        self.min_rtt = float('inf')
+        self.hystart = HyStart()
+        self.next_seq = 0
+    
+    def in_slow_start(self):
+        return self.cwnd < self.ssthresh
+    
+    def slow_start(self, ack_num, increase):
+        """Grow cwnd by a slow-start step, as moderated by HyStart++"""
+        if self.hystart.on_ack(ack_num, self.next_seq):
+            self.ssthresh = self.cwnd
+            return
+        if self.hystart.in_css():
+            increase /= HyStart.CSS_GROWTH_DIVISOR
+        self.cwnd += increase
+    
+    def on_rtt_sample(self, rtt, current_time):
+        """Every RTT measurement of the flow"""
+        self.min_rtt = min(self.min_rtt, rtt)
+        self.hystart.on_rtt_sample(rtt)
+    
+    def on_send(self, next_seq):
+        """Data up to next_seq has been sent"""
+        self.next_seq = next_seq
+    
+    def on_ack(self, ack_num, acked_bytes, current_time, segments=1):
+        """A cumulative ACK newly acknowledged acked_bytes, up to ack_num;
+        the client reports it covers segments new segments"""
+        pass
+    
+    def abc_increase(self, acked_bytes, segments):
+        """Slow-start growth for an ACK (appropriate byte counting): the
+        bytes it ACKs, capped at ABC_LIMIT MSS, or at the segments it covers
+        for a stretch ACK, so delayed and batched ACKs grow cwnd as fast"""
+        return min(acked_bytes, max(segments, ABC_LIMIT) * DATA_SIZE)
+    
+    def on_dup_ack(self, current_time):
+        """A duplicate ACK arrived"""
+        pass
+    
+    def on_loss(self, current_time, in_flight, recovery_point):
+        """Loss detected by duplicate ACKs or SACK, once per window; the
+        flow stays in fast recovery until recovery_point is ACKed"""
+        pass
+    
+    def on_timeout(self, current_time, in_flight):
+        """The retransmission timer expired"""
+        pass
+    
+    def on_rate_sample(self, sample, current_time):
+        """A delivery-rate sample (RateSample) from an ACK that delivered data"""
+        pass
+    
+    def undo(self, prior_cwnd, prior_ssthresh):
+        """The last congestion event was spurious: return to the window
+        from before it"""
+        self.cwnd = max(self.cwnd, prior_cwnd)
+        self.ssthresh = max(self.ssthresh, prior_ssthresh)
+    
+    def pacing_rate(self):
+        """Pacing rate the controller requires (bytes/s), or None to leave
+        pacing to the flow's --pacing setting"""
+        return None
+    
+    def describe(self):
+        """State summary printed after a congestion event"""
+        return f"ssthresh={self.ssthresh / DATA_SIZE:.1f}, new cwnd={self.cwnd / DATA_SIZE:.1f} MSS"
+
+class Reno(CongestionControl):
+    """TCP Reno (RFC 5681): AIMD with fast recovery that ends on the first new ACK"""
+    name = 'reno'
+    partial_ack_recovery = False
+    
+    def on_ack(self, ack_num, acked_bytes, current_time, segments=1):
+        if self.in_slow_start():
+            self.slow_start(ack_num, self.abc_increase(acked_bytes, segments))
+        else:
+            self.cwnd += DATA_SIZE * acked_bytes / self.cwnd
+    
+    def on_loss(self, current_time, in_flight, recovery_point):
+        # The flow inflates this by the duplicate ACKs until recovery ends
+        self.ssthresh = max(in_flight / 2, 2 * DATA_SIZE)
+        self.cwnd = self.ssthresh
+    
+    def on_timeout(self, current_time, in_flight):
+        self.ssthresh = max(in_flight / 2, 2 * DATA_SIZE)
+        self.cwnd = DATA_SIZE
+
+class NewReno(Reno):
+    """TCP NewReno (RFC 6582): stays in fast recovery across partial ACKs
+    until everything sent before the loss is acknowledged"""
+    name = 'newreno'
+    partial_ack_recovery = True
+
+class Cubic(CongestionControl):
+    """CUBIC (RFC 8312) with its TCP-friendly region"""
+    name = 'cubic'
+    
+    def __init__(self, initial_cwnd):
+        super().__init__(initial_cwnd)
+        self.w_max = 0
+        self.t_epoch_start = 0
+        self.beta_cubic = 0.7  # Multiplicative decrease factor
+        self.C = 0.4  # CUBIC constant
+    
+    def on_ack(self, ack_num, acked_bytes, current_time, segments=1):
         """Update CWND on receiving a new ACK, following CUBIC."""
         
         if self.cwnd < self.ssthresh:
-            # Slow Start: Increase exponentially (one MSS per ACK)
-            self.cwnd += DATA_SIZE
+            # Slow Start: Increase exponentially (appropriate byte counting)
+            self.slow_start(ack_num, self.abc_increase(acked_bytes, segments))
         else:
             # Congestion Avoidance (CUBIC)
-            current_time = time.time()
             if self.t_epoch_start == 0:
                 # First time in C.A. since last event
                 self.t_epoch_start = current_time
                 self.w_max = self.cwnd
 
             t = current_time - self.t_epoch_start
-            rtt = self.min_rtt if self.min_rtt != float('inf') else self.estimated_rtt
+            rtt = self.min_rtt if self.min_rtt != float('inf') else INITIAL_TIMEOUT
             rtt = max(rtt, 0.001)  # Avoid division by zero
             
             # K = (W_max * (1-beta) / C)^(1/3)
@@ -129,170 +938,1118 @@ class ReliableUDPServer:
             else:
                 w_target = w_cubic_target
             
-            # Increase cwnd towards the target
+            # Increase cwnd towards the target, per MSS acknowledged
             if w_target > self.cwnd:
                 # (w_target - cwnd) / cwnd * MSS
-                increase = (w_target - self.cwnd) / self.cwnd * DATA_SIZE
+                increase = (w_target - self.cwnd) / self.cwnd * acked_bytes
                 self.cwnd += increase
             else:
                 # Standard Reno-like increase if at/above target
-                self.cwnd += (DATA_SIZE * DATA_SIZE) / self.cwnd
+                self.cwnd += (DATA_SIZE * acked_bytes) / self.cwnd
         
         self.cwnd = max(self.cwnd, 2 * DATA_SIZE) # Ensure cwnd is at least 2*MSS
+    
+    def on_loss(self, current_time, in_flight, recovery_point):
+        self.t_epoch_start = current_time  # Start new CUBIC epoch
+        self.w_max = self.cwnd  # Save max window
+        
+        # Multiplicative decrease
+        self.ssthresh = max(self.cwnd * self.beta_cubic, 2 * DATA_SIZE)
+        self.cwnd = self.ssthresh  # CUBIC fast recovery
+    
+    def on_timeout(self, current_time, in_flight):
+        self.on_loss(current_time, in_flight, None)
+    
+    def describe(self):
+        return f"W_max={self.w_max / DATA_SIZE:.1f}, " + super().describe()
 
-    def send_file(self, client_addr, filename):
-        """Send file using sliding window protocol"""
-        try:
-            with open(filename, 'rb') as f:
-                file_data = f.read()
-        except FileNotFoundError:
-            print(f"Error: File {filename} not found")
+class WindowedMax:
+    """Maximum of the samples taken in the last `window` rounds"""
+    def __init__(self, window):
+        self.window = window
+        self.samples = collections.deque()  # (round, value), values decreasing
+    
+    def update(self, value, round_count):
+        samples = self.samples
+        while samples and samples[-1][1] <= value:
+            samples.pop()
+        samples.append((round_count, value))
+        while samples[0][0] <= round_count - self.window:
+            samples.popleft()
+    
+    def get(self):
+        return self.samples[0][1] if self.samples else 0
+
+class BBR(CongestionControl):
+    """Model-based congestion control after BBR v1.
+
+    Estimates the bottleneck bandwidth (windowed max of delivery-rate
+    samples) and the path's min RTT, paces at gain * bandwidth and caps
+    cwnd at a multiple of their product, so random loss does not shrink
+    the window. Cycles through STARTUP, DRAIN, PROBE_BW and PROBE_RTT.
+    """
+    name = 'bbr'
+    STARTUP_GAIN = 2 / math.log(2)  # Doubles the sending rate each round
+    PROBE_BW_GAINS = (1.25, 0.75, 1, 1, 1, 1, 1, 1)
+    CWND_GAIN = 2
+    BW_WINDOW_ROUNDS = 10
+    MIN_RTT_WINDOW = 10.0  # Seconds before min_rtt must be re-measured
+    PROBE_RTT_DURATION = 0.2
+    MIN_CWND = 4 * DATA_SIZE
+    
+    def __init__(self, initial_cwnd):
+        super().__init__(initial_cwnd)
+        self.max_bw = WindowedMax(self.BW_WINDOW_ROUNDS)
+        self.min_rtt_stamp = time.time()
+        
+        # Round trips, counted in delivered bytes
+        self.round_count = 0
+        self.next_round_delivered = 0
+        
+        # STARTUP ends once bandwidth grows less than 25% in 3 rounds
+        self.full_bw = 0
+        self.full_bw_count = 0
+        self.filled_pipe = False
+        
+        self.state = 'startup'
+        self.pacing_gain = self.STARTUP_GAIN
+        self.cwnd_gain = self.STARTUP_GAIN
+        self.cycle_index = 0
+        self.cycle_stamp = 0
+        self.loss_in_cycle = False
+        self.probe_rtt_done_time = None
+        self.probe_rtt_round = 0
+        self.prior_cwnd = initial_cwnd
+        
+        # ACKs arriving in bursts (jitter, aggregation) deliver more than
+        # btl_bw predicts; the excess is kept as extra cwnd headroom
+        self.extra_acked = WindowedMax(self.BW_WINDOW_ROUNDS)
+        self.ack_epoch_start = None
+        self.ack_epoch_acked = 0
+    
+    def in_slow_start(self):
+        return self.state == 'startup'
+    
+    def bdp(self):
+        """Estimated bandwidth-delay product in bytes (None without a model yet)"""
+        bw = self.max_bw.get()
+        if not bw or self.min_rtt == float('inf'):
+            return None
+        return bw * self.min_rtt
+    
+    def pacing_rate(self):
+        bw = self.max_bw.get()
+        if bw:
+            return self.pacing_gain * bw
+        if self.min_rtt == float('inf'):
+            return None
+        return self.pacing_gain * self.cwnd / max(self.min_rtt, 0.001)
+    
+    def on_rtt_sample(self, rtt, current_time):
+        expired = current_time - self.min_rtt_stamp > self.MIN_RTT_WINDOW
+        if rtt <= self.min_rtt or expired:
+            self.min_rtt = rtt
+            self.min_rtt_stamp = current_time
+        if expired and self.state != 'probe_rtt':
+            # Drain the queue so the next samples see the bare path
+            self.state = 'probe_rtt'
+            self.pacing_gain = self.cwnd_gain = 1
+            self.prior_cwnd = self.cwnd
+            self.probe_rtt_done_time = None
+    
+    def on_loss(self, current_time, in_flight, recovery_point):
+        # Loss does not change the model; it only ends a probing phase early
+        self.loss_in_cycle = True
+    
+    def on_timeout(self, current_time, in_flight):
+        self.prior_cwnd = self.cwnd
+        self.cwnd = self.MIN_CWND
+    
+    def on_rate_sample(self, sample, current_time):
+        round_start = False
+        if sample.prior_delivered >= self.next_round_delivered:
+            self.next_round_delivered = sample.delivered
+            self.round_count += 1
+            round_start = True
+        if sample.delivery_rate is not None:
+            self.max_bw.update(sample.delivery_rate, self.round_count)
+        
+        if round_start and not self.filled_pipe:
+            bw = self.max_bw.get()
+            if bw >= self.full_bw * 1.25:
+                self.full_bw = bw
+                self.full_bw_count = 0
+            else:
+                self.full_bw_count += 1
+                self.filled_pipe = self.full_bw_count >= 3
+        
+        self.update_ack_aggregation(sample.newly_delivered, current_time)
+        self.update_state(sample, current_time, round_start)
+        self.update_cwnd(sample.newly_delivered)
+    
+    def update_ack_aggregation(self, newly_delivered, current_time):
+        """Track how far deliveries run ahead of the bandwidth estimate"""
+        bw = self.max_bw.get()
+        if not bw:
             return
+        expected = 0
+        if self.ack_epoch_start is not None:
+            expected = bw * (current_time - self.ack_epoch_start)
+        if self.ack_epoch_start is None or self.ack_epoch_acked <= expected:
+            # Deliveries caught up with the estimate: start a new epoch
+            self.ack_epoch_start = current_time
+            self.ack_epoch_acked = 0
+            expected = 0
+        self.ack_epoch_acked += newly_delivered
+        extra = min(self.ack_epoch_acked - expected, self.cwnd)
+        self.extra_acked.update(extra, self.round_count)
+    
+    def enter_probe_bw(self, current_time):
+        self.state = 'probe_bw'
+        self.cwnd_gain = self.CWND_GAIN
+        # Random phase, but never start by draining
+        self.cycle_index = random.choice([0] + list(range(2, len(self.PROBE_BW_GAINS))))
+        self.pacing_gain = self.PROBE_BW_GAINS[self.cycle_index]
+        self.cycle_stamp = current_time
+        self.loss_in_cycle = False
+    
+    def update_state(self, sample, current_time, round_start):
+        bdp = self.bdp()
+        if self.state == 'startup' and self.filled_pipe:
+            self.state = 'drain'
+            self.pacing_gain = 1 / self.STARTUP_GAIN
         
-        total_bytes = len(file_data)
-        print(f"Starting file transfer: {total_bytes} bytes")
+        if self.state == 'drain' and (bdp is None or sample.in_flight <= bdp):
+            self.enter_probe_bw(current_time)
         
-        # Set socket to non-blocking
-        self.sock.settimeout(0.001)
+        elif self.state == 'probe_bw':
+            full_length = current_time - self.cycle_stamp > self.min_rtt
+            if self.pacing_gain > 1:
+                # Probe until the extra data is really in flight (or lost)
+                advance = full_length and (self.loss_in_cycle or bdp is None
+                                           or sample.in_flight >= self.pacing_gain * bdp)
+            elif self.pacing_gain < 1:
+                # Drain until the queue is gone
+                advance = full_length or bdp is None or sample.in_flight <= bdp
+            else:
+                advance = full_length
+            if advance:
+                self.cycle_index = (self.cycle_index + 1) % len(self.PROBE_BW_GAINS)
+                self.pacing_gain = self.PROBE_BW_GAINS[self.cycle_index]
+                self.cycle_stamp = current_time
+                self.loss_in_cycle = False
         
-        start_time = time.time()
+        elif self.state == 'probe_rtt':
+            if self.probe_rtt_done_time is None:
+                if sample.in_flight <= self.MIN_CWND:
+                    self.probe_rtt_done_time = current_time + self.PROBE_RTT_DURATION
+                    self.probe_rtt_round = self.round_count
+            elif current_time >= self.probe_rtt_done_time and self.round_count > self.probe_rtt_round:
+                self.min_rtt_stamp = current_time
+                self.cwnd = max(self.cwnd, self.prior_cwnd)
+                if self.filled_pipe:
+                    self.enter_probe_bw(current_time)
+                else:
+                    self.state = 'startup'
+                    self.pacing_gain = self.cwnd_gain = self.STARTUP_GAIN
+    
+    def update_cwnd(self, newly_delivered):
+        bdp = self.bdp()
+        if bdp is None:
+            self.cwnd += newly_delivered
+        else:
+            # Headroom for delayed, stretched and aggregated ACKs
+            target = self.cwnd_gain * bdp + 3 * DATA_SIZE + self.extra_acked.get()
+            if self.filled_pipe:
+                self.cwnd = min(self.cwnd + newly_delivered, target)
+            elif self.cwnd < target:
+                self.cwnd += newly_delivered
+        self.cwnd = max(self.cwnd, self.MIN_CWND)
+        if self.state == 'probe_rtt':
+            self.cwnd = min(self.cwnd, self.MIN_CWND)
+    
+    def describe(self):
+        bw = self.max_bw.get()
+        return (f"state={self.state}, btl_bw={bw * 8 / 1_000_000:.2f} Mbps, "
+                f"min_rtt={self.min_rtt * 1000:.1f} ms, cwnd={self.cwnd / DATA_SIZE:.1f} MSS")
+
+CONGESTION_CONTROLLERS = {cc.name: cc for cc in (Cubic, Reno, NewReno, BBR)}
+
+class TransferFlow:
+    """Per-client transfer state: window, RTT estimate, congestion controller
+    and in-flight buffer. The server feeds it ACKs and timer ticks; it never
+    blocks, so any number of flows can share one socket."""
+    def __init__(self, sock, client_addr, mapping, total_bytes, digest,
+                 initial_cwnd=DATA_SIZE, gso_segments=1, sender=None, pacing_gain=None,
+                 congestion_control='cubic', rack=False, min_rto=MIN_RTO, max_rto=MAX_RTO,
+                 fec=False):
+        self.sock = sock
+        self.client_addr = client_addr
+        self.mapping = mapping
+        self.total_bytes = total_bytes
+        self.digest = digest  # MD5 of the file, carried in the EOF segment
+        self.start_time = time.time()
         
-        # Reset state for this transfer
-        self.base = 0
-        self.next_seq = 0
-        self.packets = {}
-        self.dup_ack_count = {}
+        # RTT estimation
+        self.rtt = RtoEstimator(min_rto, max_rto)
+        self.rto_undo = None  # (seq, resend time, cwnd, ssthresh) of the last RTO retransmission
         
-        # Reset CUBIC state
-        self.cwnd = self.initial_cwnd
-        self.ssthresh = 65535
-        self.w_max = 0
-        self.t_epoch_start = 0
-        self.min_rtt = float('inf')
+        # Window management
+        self.base = 0  # First unacknowledged byte
+        self.next_seq = 0  # Next byte to send
+        self.packets = InFlightWindow()  # Segments sent but not yet ACKed
+        self.dup_ack_count = {}  # ack_num -> count
+        self.rtx_queue = RetransmitQueue(self.packets)
+        self.scoreboard = SackScoreboard()  # What the client has SACKed
+        self.sack_rtx_next = 0  # Holes below this were already retransmitted
+        self.rack = RackTlp(self.rtx_queue) if rack else None  # Replaces duplicate-ACK counting
+        self.retransmit_counts = dict.fromkeys(RETRANSMIT_CAUSES, 0)
+        self.fec = FecEncoder() if fec else None  # Parity for single losses per block
+        self.echo_time = 0  # Send time of the latest transmission an ACK echoed
+        
+        # Delivery-rate estimation: bytes ACKed or SACKed so far, and when
+        self.delivered = 0
+        self.delivered_time = self.start_time
+        self.first_sent_time = self.start_time
+        self.rate_segment = None  # Most recently sent segment delivered by this ACK
+        
+        # Zero-copy, batched send path straight from a mapping of the file
+        self.sender = sender if sender is not None else BatchSender(sock, gso_segments)
+        self.sender.start(mapping, client_addr)
+        self.recv_syscalls = 0  # ACK reads for this flow (sends are counted by self.sender)
+        
+        # EOF marker is repeated EOF_REPEATS times, EOF_INTERVAL apart
+        self.eof_sent = 0
+        self.next_eof_time = 0
+        self.finished = False
+        self.abandoned = False  # Finished because the client stopped ACKing
+        self.last_ack_time = self.start_time
+        
+        # Congestion Control
+        self.initial_cwnd = initial_cwnd  # Initial window size in bytes
+        self.cc = CONGESTION_CONTROLLERS[congestion_control](initial_cwnd)
         self.last_congestion_event_time = 0
+        
+        # Fast recovery (RFC 6582): one window reduction per loss episode
+        self.recovery_point = None  # Set while in fast recovery
+        self.recover = 0  # Losses below this belong to the last episode
+        self.inflation = 0  # Window credit for segments that left the network
+        
+        # Pacing: spread each window over an RTT instead of bursting it
+        self.pacing_gain = pacing_gain  # None = send as fast as the window opens
+        self.pacing_time = 0  # Earliest time the next paced segment may leave
+    
+    def create_packet(self, seq_num, data, flags=0):
+        """Create a packet with header and data"""
+        # Header: 4 bytes seq_num + 4 bytes TSval + flags, k, index + 8 bytes reserved
+        return DATA_HEADER.pack(seq_num, timestamp(), flags, 0, 0) + data
+    
+    def parse_ack(self, packet):
+        """Parse ACK packet to get ack number, SACK blocks as byte ranges,
+        TSecr, the number of segments it covers (0 = not reported) and the
+        client's FEC repairs minus duplicates received"""
+        if len(packet) < ACK_HEADER.size:
+            if len(packet) < 4:
+                return None, [], 0, 0, 0
+            return struct.unpack('!I', packet[:4])[0], [], 0, 0, 0
+        ack_num, *fields, tsecr, segments, client_losses = ACK_HEADER.unpack_from(packet)
+        sack_blocks = []
+        for i in range(0, len(fields), 2):
+            offset, length = fields[i], fields[i + 1]
+            if length:
+                start = ack_num + offset * DATA_SIZE
+                # The last segment may be short; nothing past next_seq was sent
+                sack_blocks.append((start, min(start + length * DATA_SIZE, self.next_seq)))
+        return ack_num, sack_blocks, tsecr, segments, client_losses
+    
+    def update_rtt(self, sample_rtt, samples_per_rtt=1):
+        """Feed an RTT sample to the RTO estimator and the congestion controller"""
+        self.rtt.on_sample(sample_rtt, samples_per_rtt)
+        self.cc.on_rtt_sample(sample_rtt, time.time())
 
-        # Split file into chunks
-        chunks = []
-        for i in range(0, total_bytes, DATA_SIZE):
-            chunks.append(file_data[i:i + DATA_SIZE])
+    def handle_congestion_event(self, timeout=False):
+        """Handle a congestion event (timeout or fast retransmit).
+        A loss enters fast recovery unless the lost data was sent before
+        the last event; a timeout abandons fast recovery and backs off the
+        RTO. Returns False if the event was folded into an earlier one."""
+        current_time = time.time()
+        if timeout:
+            # Debounce: segments sent together expire together, one event per RTO
+            if current_time - self.last_congestion_event_time < self.rtt.rto:
+                return False
+            self.recovery_point = None
+            self.inflation = 0
+            self.rtt.on_timeout()
+        elif self.recovery_point is not None or self.base < self.recover:
+            return False
         
-        total_packets = len(chunks)
-        print(f"Total packets to send: {total_packets}")
+        self.last_congestion_event_time = current_time
+        self.recover = self.next_seq
+        self.dup_ack_count = {}  # Reset dup ACKs
+        # Loss ends the search; later slow starts stop at the ssthresh it sets
+        self.cc.hystart.done = True
+        in_flight = self.next_seq - self.base
+        if timeout:
+            self.cc.on_timeout(current_time, in_flight)
+        else:
+            self.cc.on_loss(current_time, in_flight, self.next_seq)
+            self.recovery_point = self.next_seq
+            # The duplicate ACKs (or SACKed segments) that revealed the loss
+            self.inflation = SACK_DUP_THRESH * DATA_SIZE
+        
+        print(f"--- Congestion Event --- {self.cc.describe()}")
+        return True
+
+    def pacing_rate(self):
+        """Pacing rate in bytes/s, or None if not pacing (yet)"""
+        rate = self.cc.pacing_rate()
+        if rate is not None:
+            return rate
+        if self.pacing_gain is None or self.cc.min_rtt == float('inf'):
+            # No RTT sample yet: the initial window goes out unpaced
+            return None
+        gain = self.pacing_gain
+        if self.cc.in_slow_start():
+            gain = max(gain, PACING_SS_GAIN)
+        return gain * self.cc.cwnd / max(self.rtt.srtt, 0.001)
+    
+    def window_open(self):
+        """True if there is new data the congestion window allows to send"""
+        window = self.cc.cwnd + self.inflation
+        return self.next_seq < self.total_bytes and (self.next_seq - self.base) < window
+    
+    def next_deadline(self):
+        """Absolute time of this flow's next timer: RTO expiry, RACK reordering
+        timer, tail loss probe, paced send, EOF repeat or idle limit"""
+        if self.base >= self.total_bytes:
+            return self.next_eof_time
+        deadline = self.last_ack_time + FLOW_IDLE_LIMIT
+        oldest_send_time = self.rtx_queue.oldest_send_time()
+        if oldest_send_time is not None:
+            deadline = min(deadline, oldest_send_time + self.rtt.rto)
+            if self.rack is not None:
+                for timer in (self.rack.reorder_deadline, self.probe_deadline()):
+                    if timer is not None and timer < deadline:
+                        deadline = timer
+        if self.pacing_rate() is not None and self.window_open():
+            # Held back by pacing rather than by the window
+            if self.pacing_time < deadline:
+                deadline = self.pacing_time
+        return deadline
+
+    def retransmit(self, segment, cause):
+        """Resend an in-flight segment and re-arm its timer"""
+        if segment.fec_index is None:
+            self.sender.send(segment.seq, segment.length)
+        else:
+            # Same block position, so the client can still use it for repairs
+            self.sender.send(segment.seq, segment.length, FEC_DATA, segment.fec_index)
+        segment.send_time = time.time()
+        segment.retransmits += 1
+        self.retransmit_counts[cause] += 1
+        self.stamp_delivery(segment)
+        self.rtx_queue.push(segment)
+    
+    def stamp_delivery(self, segment):
+        """Record the delivery counters as of this transmission"""
+        segment.delivered = self.delivered
+        segment.delivered_time = self.delivered_time
+        segment.first_sent_time = self.first_sent_time
+    
+    def note_delivered(self, segment):
+        """Keep the most recently sent segment this ACK delivered for the rate sample"""
+        latest = self.rate_segment
+        if latest is None or (segment.delivered, segment.send_time) > (latest.delivered, latest.send_time):
+            self.rate_segment = segment
+    
+    def sample_delivery_rate(self, newly_delivered, current_time):
+        """Turn the data delivered by one ACK into a RateSample for the controller"""
+        self.delivered += newly_delivered
+        self.delivered_time = current_time
+        segment = self.rate_segment
+        self.rate_segment = None
+        if segment is None:
+            return
+        
+        self.first_sent_time = segment.send_time
+        # The slower of the send and ACK rates over the sampled flight
+        send_elapsed = segment.send_time - segment.first_sent_time
+        ack_elapsed = current_time - segment.delivered_time
+        interval = max(send_elapsed, ack_elapsed)
+        delivered = self.delivered - segment.delivered
+        delivery_rate = None
+        if interval > 0 and interval >= self.cc.min_rtt:
+            # Shorter intervals only measure ACK compression
+            delivery_rate = delivered / interval
+        
+        sample = RateSample(delivery_rate, self.delivered, segment.delivered,
+                            newly_delivered, self.next_seq - self.base)
+        self.cc.on_rate_sample(sample, current_time)
+    
+    def process_sack(self, sack_blocks, ack_num):
+        """Mark SACKed segments and retransmit the holes below them, above
+        the cumulative ACK that carried them. Returns the number of bytes
+        newly SACKed."""
+        newly_sacked = 0
+        for start, end in sack_blocks:
+            for piece_start, piece_end in self.scoreboard.update(max(start, self.base), end):
+                for seq_num in range(piece_start, piece_end, DATA_SIZE):
+                    segment = self.packets.get(seq_num)
+                    if segment is not None:
+                        segment.sacked = True
+                        newly_sacked += segment.length
+                        self.note_delivered(segment)
+                        if self.rack is not None:
+                            self.rack.on_delivered(segment, time.time())
+        if self.rack is not None:
+            # RACK decides by send time, after the cumulative ACK is applied
+            return newly_sacked
+        
+        # Each hole is retransmitted once here; a lost retransmission is
+        # left to the RTO
+        # Start past this ACK's cumulative ACK: it is applied only after
+        # the scan, and segments below it are no holes
+        lost_below = self.loss_horizon()
+        seq_num = max(self.sack_rtx_next, self.base, ack_num or 0)
+        holes = []
+        while seq_num + DATA_SIZE <= lost_below:
+            segment = self.packets.get(seq_num)
+            if segment is not None and not segment.sacked:
+                holes.append(segment)
+            seq_num += DATA_SIZE
+        self.sack_rtx_next = max(self.sack_rtx_next, seq_num)
+        
+        if holes:
+            print(f"SACK retransmit: {len(holes)} segments from seq {holes[0].seq}")
+            self.handle_congestion_event()
+            for segment in holes:
+                self.retransmit(segment, 'sack')
+        return newly_sacked
+    
+    def loss_horizon(self):
+        """Holes below this are lost: SACK_DUP_THRESH segments above them
+        were SACKed. With FEC the hole's block must also be closed and an
+        ACK must echo its parity or a later transmission, so the parity had
+        its chance to repair the hole."""
+        lost_below = self.scoreboard.high - SACK_DUP_THRESH * DATA_SIZE
+        if self.fec is not None:
+            lost_below = self.fec.closed_below(lost_below, self.echo_time)
+        return lost_below
+    
+    def handle_ack(self, ack_packet):
+        """Process a single ACK: slide the window, grow CWND or count duplicates"""
+        ack_num, sack_blocks, tsecr, segments, client_losses = self.parse_ack(ack_packet)
+        if ack_num is not None:
+            self.last_ack_time = time.time()
+        if self.fec is not None:
+            self.fec.on_ack(client_losses, sum(self.retransmit_counts.values()))
+            if tsecr:
+                self.echo_time = max(self.echo_time, time.time() - timestamp_age(tsecr))
+        if tsecr:
+            # The echoed TSval belongs to the exact transmission that was
+            # delivered, so even ACKs of retransmissions give a clean sample
+            in_flight = max(1, (self.next_seq - self.base) // DATA_SIZE)
+            self.update_rtt(timestamp_age(tsecr), max(1, in_flight // max(segments, 1)))
+        newly_delivered = 0
+        if sack_blocks:
+            newly_delivered += self.process_sack(sack_blocks, ack_num)
         
-        while self.base < total_bytes:
-            # Send new packets within window
-            # Use dynamic self.cwnd instead of fixed self.sws
-            while self.next_seq < total_bytes and (self.next_seq - self.base) < self.cwnd:
-                chunk_idx = self.next_seq // DATA_SIZE
-                if chunk_idx < len(chunks):
-                    data = chunks[chunk_idx]
-                    packet = self.create_packet(self.next_seq, data)
-                    self.sock.sendto(packet, client_addr)
-                    self.packets[self.next_seq] = (packet, time.time())
-                    self.next_seq += len(data)
+        if ack_num is not None and ack_num > self.base:
+            # Cumulative ACK - all bytes up to ack_num-1 received
+            segment = self.packets.get(self.base)
+            if not tsecr and segment is not None and segment.retransmits == 0:
+                # No timestamp echoed: Karn's rule, never sample a retransmission
+                sample_rtt = time.time() - segment.send_time
+                self.update_rtt(sample_rtt)
             
-            # Try to receive ACKs
-            try:
-                ack_packet, _ = self.sock.recvfrom(MAX_PAYLOAD)
-                ack_num = self.parse_ack(ack_packet)
-                
-                if ack_num is not None and ack_num > self.base:
-                    # Cumulative ACK - all bytes up to ack_num-1 received
-                    if self.base in self.packets:
-                        _, send_time = self.packets[self.base]
-                        sample_rtt = time.time() - send_time
-                        self.update_rtt(sample_rtt)
-                    
-                    # Remove acknowledged packets
-                    acked_seqs = [seq for seq in self.packets if seq < ack_num]
-                    for seq in acked_seqs:
-                        del self.packets[seq]
-                    
-                    self.base = ack_num
-                    self.dup_ack_count = {}  # Reset duplicate ACK counter
-                    
-                    # New ACK, update CWND
-                    self.update_cwnd_on_ack()
-                    
-                elif ack_num is not None and ack_num == self.base:
-                    # Duplicate ACK
-                    self.dup_ack_count[ack_num] = self.dup_ack_count.get(ack_num, 0) + 1
-                    
-                    # Fast retransmit after 3 duplicate ACKs (count == 2)
-                    if self.dup_ack_count[ack_num] == 3:
-                        if self.base in self.packets:
-                            print(f"Fast retransmit: seq {self.base}")
-                            # Congestion event
-                            self.handle_congestion_event()
-                            
-                            packet, _ = self.packets[self.base]
-                            self.sock.sendto(packet, client_addr)
-                            self.packets[self.base] = (packet, time.time())
+            # The highest segment below ack_num was sent most recently
+            last = self.packets.get((ack_num - 1) // DATA_SIZE * DATA_SIZE)
+            if last is not None and not last.sacked:
+                self.note_delivered(last)
+            if self.rack is not None:
+                self.rack_on_cumulative_ack(ack_num, tsecr, segment, last)
+            if self.rto_undo is not None and ack_num > self.rto_undo[0]:
+                self.check_spurious_timeout(tsecr)
             
-            except socket.timeout:
-                pass
+            # Remove acknowledged packets
+            self.packets.ack_through(ack_num)
+            sacked_below = self.scoreboard.ack_through(ack_num)
             
-            # Check for timeouts
-            current_time = time.time()
-            for seq_num in list(self.packets.keys()):
-                packet, send_time = self.packets[seq_num]
-                if current_time - send_time > self.rto:
-                    # Timeout - retransmit
-                    print(f"Timeout retransmit: seq {seq_num}, RTO: {self.rto:.3f}s")
-                    
+            acked_bytes = ack_num - self.base
+            newly_delivered += acked_bytes - sacked_below
+            self.base = ack_num
+            self.dup_ack_count = {}  # Reset duplicate ACK counter
+            
+            if self.recovery_point is None:
+                # New ACK, update CWND
+                self.inflation = 0
+                self.cc.on_ack(ack_num, acked_bytes, time.time(), segments)
+            elif ack_num >= self.recovery_point or not self.cc.partial_ack_recovery:
+                # Full ACK: deflate the window back to the controller's cwnd
+                self.recovery_point = None
+                self.inflation = 0
+            else:
+                self.handle_partial_ack(acked_bytes)
+            
+        elif ack_num is not None and ack_num == self.base:
+            # Duplicate ACK
+            self.dup_ack_count[ack_num] = self.dup_ack_count.get(ack_num, 0) + 1
+            self.cc.on_dup_ack(time.time())
+            if self.recovery_point is not None or self.dup_ack_count[ack_num] < 3:
+                # Each duplicate ACK means a segment has left the network;
+                # before recovery this is limited transmit (RFC 3042), which
+                # keeps small windows sending until the third duplicate
+                self.inflation += DATA_SIZE
+            
+            # Fast retransmit after 3 duplicate ACKs, unless SACK already
+            # retransmitted this hole
+            elif self.dup_ack_count[ack_num] == 3 and self.sack_rtx_next <= self.base and self.rack is None:
+                segment = self.packets.get(self.base)
+                if self.fec is not None and self.base + DATA_SIZE > self.loss_horizon():
+                    # Wait for process_sack(): the parity may still repair it
+                    segment = None
+                if segment is not None:
+                    print(f"Fast retransmit: seq {self.base}")
                     # Congestion event
                     self.handle_congestion_event()
                     
-                    self.sock.sendto(packet, client_addr)
-                    self.packets[seq_num] = (packet, current_time)
-                    break  # Only retransmit one packet per timeout check
-        
-        # Send EOF marker
-        eof_packet = self.create_packet(self.next_seq, b'EOF')
-        for _ in range(5):  # Send EOF multiple times to ensure delivery
-            self.sock.sendto(eof_packet, client_addr)
-            time.sleep(0.1)
-        
-        duration = time.time() - start_time
-        if duration > 0:
-            print(f"File transfer complete in {duration:.2f} seconds")
+                    self.retransmit(segment, 'fast')
+                    self.sack_rtx_next = self.base + segment.length
+        
+        if newly_delivered:
+            self.sample_delivery_rate(newly_delivered, time.time())
+        if self.rack is not None and ack_num is not None:
+            self.rack.probe_armed_at = time.time()
+            self.detect_rack_losses(time.time())
+    
+    def check_spurious_timeout(self, tsecr):
+        """The segment resent by the last timeout is ACKed. If the ACK
+        echoes the original transmission, the original was only delayed:
+        undo the window cut and the RTO backoff (Eifel, RFC 3522/4015)."""
+        seq_num, resend_time, prior_cwnd, prior_ssthresh = self.rto_undo
+        self.rto_undo = None
+        if tsecr and echo_predates(tsecr, resend_time):
+            self.cc.undo(prior_cwnd, prior_ssthresh)
+            self.rtt.undo_backoff()
+            print(f"Spurious timeout: seq {seq_num}, restored {self.cc.describe()}")
+    
+    def rack_on_cumulative_ack(self, ack_num, tsecr, first, last):
+        """Feed a cumulative ACK to RACK-TLP; first and last are the lowest
+        and highest segments it covers (None if already released)"""
+        current_time = time.time()
+        for segment in (first, last):
+            if segment is not None and not segment.sacked:
+                self.rack.on_delivered(segment, current_time)
+        if first is not None and first.retransmits and tsecr and echo_predates(tsecr, first.send_time):
+            # The hole was filled by the original, not by the retransmission
+            self.rack.on_spurious_retransmit()
+        
+        probe = self.rack.end_probe(ack_num)
+        if probe is not None and tsecr and not echo_predates(tsecr, probe.send_time):
+            # The probe itself repaired the tail: a real loss
+            print(f"Tail loss probe repaired seq {probe.seq}")
+            self.handle_congestion_event()
+    
+    def detect_rack_losses(self, current_time):
+        """Retransmit every segment RACK has marked lost"""
+        reo_wnd = self.rack.reo_wnd(self.rtt.srtt, self.recovery_point is not None,
+                                    self.scoreboard.sacked_bytes() // DATA_SIZE)
+        lost = self.rack.detect_lost(current_time, reo_wnd)
+        if lost and self.fec is not None:
+            # Segments the parity may still repair go back on the timer
+            # until an ACK echoes their block's parity
+            repairable_from = self.fec.closed_below(self.next_seq, self.echo_time)
+            for segment in lost:
+                if segment.seq >= repairable_from:
+                    self.rtx_queue.push(segment)
+            lost = [segment for segment in lost if segment.seq < repairable_from]
+        if lost:
+            print(f"RACK retransmit: {len(lost)} segments from seq {lost[0].seq}")
+            self.handle_congestion_event()
+            for segment in lost:
+                self.retransmit(segment, 'rack')
+    
+    def probe_deadline(self):
+        """When the tail loss probe is due (None if not armed)"""
+        if self.base >= self.next_seq or self.recovery_point is not None:
+            return None
+        return self.rack.probe_deadline(self.rtt.srtt, self.rtt.rto, self.next_seq - self.base)
+    
+    def send_probe(self):
+        """Tail loss probe: one new segment, or else the last one again"""
+        if self.next_seq < self.total_bytes:
+            print(f"Tail loss probe: new data at seq {self.next_seq}")
+            self.send_segment()
+            self.cc.on_send(self.next_seq)
+            self.sender.flush()
+            self.rack.on_probe(self.next_seq)
+            return
+        segment = self.packets.get((self.next_seq - 1) // DATA_SIZE * DATA_SIZE)
+        if segment is None or segment.sacked:
+            # Only holes are left, and RACK is timing those
+            self.rack.on_probe(self.next_seq)
+            return
+        print(f"Tail loss probe: retransmit seq {segment.seq}")
+        self.retransmit(segment, 'tlp')
+        self.rack.on_probe(self.next_seq, segment)
+
+    def handle_partial_ack(self, acked_bytes):
+        """An ACK inside fast recovery that stops short of the recovery
+        point: the next unacknowledged segment was lost too"""
+        # Deflate by the data acknowledged, keeping one MSS for the resend
+        self.inflation = max(self.inflation - acked_bytes, 0) + DATA_SIZE
+        segment = self.packets.get(self.base)
+        if self.rack is not None:
+            # RACK retransmits by send time instead
+            return
+        if segment is not None and not segment.sacked and self.sack_rtx_next <= self.base:
+            print(f"Partial ACK retransmit: seq {self.base}")
+            self.retransmit(segment, 'partial')
+            self.sack_rtx_next = self.base + segment.length
+    
+    def fill_window(self):
+        """Send new packets within the congestion window (and pacing rate)"""
+        rate = self.pacing_rate()
+        if rate is not None:
+            current_time = time.time()
+            # Unused send time carries over as at most one quantum of burst;
+            # the quantum also covers the selector's millisecond resolution
+            burst = max(2 * DATA_SIZE / rate, PACING_QUANTUM)
+            self.pacing_time = max(self.pacing_time, current_time - burst)
+        
+        if self.next_seq == self.base:
+            # Nothing in flight: rate samples start afresh from now
+            self.first_sent_time = self.delivered_time = time.time()
+        
+        # Use dynamic cwnd instead of fixed self.sws
+        while self.window_open():
+            if rate is not None and self.pacing_time > current_time:
+                break
+            length = self.send_segment()
+            if rate is not None:
+                self.pacing_time += length / rate
+        
+        if self.fec is not None and not self.window_open():
+            self.close_fec_block()
+        self.cc.on_send(self.next_seq)
+        self.sender.flush()
+    
+    def close_fec_block(self):
+        """Send the open block's parity early if the client has SACKed past
+        a hole in it: the window may not open far enough to complete it"""
+        fec = self.fec
+        if fec.count == 0 or self.scoreboard.high <= fec.block_start:
+            return
+        seq_num = max(fec.block_start, self.base)
+        while seq_num < self.scoreboard.high:
+            segment = self.packets.get(seq_num)
+            if segment is not None and not segment.sacked:
+                self.sender.queue_parity(*fec.close(self.next_seq))
+                return
+            seq_num += DATA_SIZE
+    
+    def send_segment(self):
+        """Queue the next new segment, and the parity of its FEC block if
+        it completes one; returns the bytes queued"""
+        length = min(DATA_SIZE, self.total_bytes - self.next_seq)
+        segment = Segment(self.next_seq, length, time.time())
+        if self.fec is None:
+            self.sender.queue(self.next_seq, length)
+        else:
+            segment.fec_index = self.fec.add(self.next_seq, self.mapping[self.next_seq:self.next_seq + length])
+            self.sender.queue(self.next_seq, length, FEC_DATA, segment.fec_index)
+        self.stamp_delivery(segment)
+        self.packets.append(segment)
+        self.rtx_queue.push(segment)
+        self.next_seq += length
+        if self.rack is not None:
+            self.rack.probe_armed_at = segment.send_time
+        if self.fec is not None and (self.fec.block_full() or self.next_seq >= self.total_bytes):
+            self.sender.queue_parity(*self.fec.close(self.next_seq))
+            length += DATA_SIZE
+        return length
+    
+    def on_timer(self, current_time):
+        """Retransmit an expired packet or repeat the EOF marker"""
+        if self.base >= self.total_bytes:
+            if current_time >= self.next_eof_time:
+                self.send_eof(current_time)
+            return
+        
+        if current_time - self.last_ack_time >= FLOW_IDLE_LIMIT:
+            # The client is gone: stop retransmitting and release the file
+            print(f"No ACK from {self.client_addr} for {FLOW_IDLE_LIMIT:.0f}s, abandoning transfer")
+            self.abandoned = True
+            self.finished = True
+            self.close()
+            return
+        
+        if self.rack is not None:
+            deadline = self.rack.reorder_deadline
+            if deadline is not None and current_time >= deadline:
+                self.detect_rack_losses(current_time)
+            deadline = self.probe_deadline()
+            if deadline is not None and current_time >= deadline:
+                self.send_probe()
+        
+        # Check for timeouts (only retransmit one packet per timeout check)
+        segment = self.rtx_queue.pop_expired(current_time - self.rtt.rto)
+        if segment is not None:
+            # Timeout - retransmit
+            print(f"Timeout retransmit: seq {segment.seq}, RTO: {self.rtt.rto:.3f}s")
+            
+            # Congestion event
+            prior_window = (self.cc.cwnd, self.cc.ssthresh)
+            backed_off = self.handle_congestion_event(timeout=True)
+            
+            self.retransmit(segment, 'timeout')
+            if backed_off:
+                # Kept until the segment is ACKed, to recognise a spurious timeout
+                self.rto_undo = (segment.seq, segment.send_time) + prior_window
+    
+    def send_eof(self, current_time):
+        """Send one copy of the EOF marker; the flow finishes after the last"""
+        if self.eof_sent == 0:
+            # Unmap the file once every byte is acknowledged
+            self.sender.finish()
+            if self.mapping is not None:
+                self.mapping.close()
+                self.mapping = None
+        
+        eof_packet = self.create_packet(self.next_seq, EOF_MARKER + self.digest, EOF_FLAG)
+        self.sock.sendto(eof_packet, self.client_addr)
+        self.eof_sent += 1
+        self.next_eof_time = current_time + EOF_INTERVAL
+        if self.eof_sent >= EOF_REPEATS:
+            self.finished = True
+    
+    def close(self):
+        """Release the file mapping of an abandoned flow"""
+        self.sender.finish()
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+    
+    def report(self):
+        """Print the summary of a completed or abandoned transfer"""
+        total_bytes = self.total_bytes
+        duration = time.time() - self.start_time
+        if self.abandoned:
+            print(f"File transfer to {self.client_addr} abandoned after {duration:.2f} seconds "
+                  f"({self.base}/{total_bytes} bytes ACKed)")
+        elif duration > 0:
+            print(f"File transfer to {self.client_addr} complete in {duration:.2f} seconds")
             print(f"Throughput: {(total_bytes * 8 / duration / 1_000_000):.2f} Mbps")
         else:
             print("File transfer complete.")
+        
+        total_syscalls = self.recv_syscalls + self.sender.syscalls
+        per_mb = total_syscalls / max(total_bytes / 1_000_000, 1e-9)
+        print(f"Syscalls: {total_syscalls} ({per_mb:.1f} per MB, {self.sender.mode()} send path)")
+        counts = ", ".join(f"{cause} {count}" for cause, count in self.retransmit_counts.items())
+        print(f"Retransmits: {sum(self.retransmit_counts.values())} ({counts})")
+        if self.fec is not None:
+            fec = self.fec
+            overhead = fec.parity_sent / max(math.ceil(total_bytes / DATA_SIZE), 1)
+            print(f"FEC: {fec.parity_sent} parity segments ({overhead:.1%} overhead), "
+                  f"k={fec.k} at {fec.loss_rate:.2%} loss")
+
+class ReliableUDPServer:
+    """Serves data.txt to any number of concurrent clients from one socket.
+
+    Datagrams are demultiplexed on the client address: a short request
+    (b'G') from an unknown address starts a TransferFlow, anything else
+    from a known address is an ACK for that flow.
+    """
+    def __init__(self, server_ip, server_port, initial_cwnd=DATA_SIZE, gso=False,
+                 reuse_port=False, worker_id=None, stats_fd=None,
+                 pacing_gain=None, pacing_offload=False, congestion_control='cubic',
+                 rack=False, min_rto=MIN_RTO, max_rto=MAX_RTO, fec=False):
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            # Several worker processes bind the same port; the kernel hashes
+            # each client's 4-tuple onto one of them
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.sock.bind((self.server_ip, self.server_port))
+        
+        # Readiness notification for the event loop
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        
+        self.initial_cwnd = initial_cwnd
+        self.congestion_control = congestion_control
+        self.rack = rack
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.fec = fec
+        self.flows = {}  # client_addr -> TransferFlow
+        
+        # Per-worker totals, reported to the supervisor through stats_fd
+        self.worker_id = worker_id
+        self.stats_fd = stats_fd
+        self.flows_served = 0
+        self.bytes_served = 0
+        
+        self.gso_segments = 1
+        if gso:
+            if enable_udp_gso(self.sock):
+                self.gso_segments = GSO_SEGMENTS
+                print(f"UDP GSO enabled: up to {GSO_SEGMENTS} segments per send")
+            else:
+                print("UDP GSO not supported by this kernel, sending one datagram per segment")
+        
+        self.pacing_gain = pacing_gain
+        self.pacing_offload = False
+        self.max_pacing_rate = None  # Last rate handed to SO_MAX_PACING_RATE
+        if pacing_gain is not None:
+            print(f"Pacing enabled: gain {pacing_gain} x cwnd / sRTT")
+            if pacing_offload:
+                if set_max_pacing_rate(self.sock, None):
+                    self.pacing_offload = True
+                    print("SO_MAX_PACING_RATE enabled (effective with the fq qdisc)")
+                else:
+                    print("SO_MAX_PACING_RATE not supported, pacing in user space only")
+        
+        if worker_id is None:
+            print(f"Server listening on {self.server_ip}:{self.server_port}")
+        else:
+            print(f"Worker {worker_id} (pid {os.getpid()}) listening on {self.server_ip}:{self.server_port}")
+        print(f"Initial CWND: {self.initial_cwnd} bytes ({self.initial_cwnd / DATA_SIZE:.1f} MSS)")
+        print(f"Congestion control: {self.congestion_control}")
+        if rack:
+            print("Loss detection: RACK-TLP")
+        print(f"RTO bounds: {min_rto}s - {max_rto}s")
+        if fec:
+            print(f"FEC enabled: XOR parity every {FEC_MIN_K}-{FEC_MAX_K} segments, adapted to loss")
+    
+    def start_transfer(self, client_addr, filename):
+        """Create a flow sending filename to client_addr (None if missing)"""
+        try:
+            mapping, total_bytes = map_file(filename)
+            digest = file_digest(filename)
+        except FileNotFoundError:
+            print(f"Error: File {filename} not found")
+            return None
+        
+        print(f"Starting file transfer to {client_addr}: {total_bytes} bytes")
+        total_packets = (total_bytes + DATA_SIZE - 1) // DATA_SIZE
+        print(f"Total packets to send: {total_packets}")
+        
+        flow = TransferFlow(self.sock, client_addr, mapping, total_bytes, digest,
+                            self.initial_cwnd, self.gso_segments,
+                            pacing_gain=self.pacing_gain,
+                            congestion_control=self.congestion_control, rack=self.rack,
+                            min_rto=self.min_rto, max_rto=self.max_rto, fec=self.fec)
+        self.flows[client_addr] = flow
+        flow.fill_window()
+        return flow
+    
+    def next_timeout(self):
+        """Seconds until the earliest timer of any flow fires (None if idle)"""
+        deadlines = [d for d in (flow.next_deadline() for flow in self.flows.values()) if d is not None]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.time())
+    
+    def poll(self):
+        """One pass of the event loop: wait, dispatch datagrams, run timers"""
+        # Sleep until a datagram arrives or the earliest flow timer fires
+        self.selector.select(self.next_timeout())
+        
+        # Drain every datagram queued on the socket
+        while True:
+            try:
+                data, client_addr = self.sock.recvfrom(MAX_PAYLOAD, socket.MSG_DONTWAIT)
+            except BlockingIOError:
+                break
+            flow = self.flows.get(client_addr)
+            if flow is not None:
+                flow.recv_syscalls += 1
+                flow.handle_ack(data)
+            elif 0 < len(data) < HEADER_SIZE:
+                # File request from a new client
+                print(f"Received request from {client_addr}")
+                self.start_transfer(client_addr, 'data.txt')
+            # Anything else is a late ACK for a finished transfer
+        
+        current_time = time.time()
+        for client_addr, flow in list(self.flows.items()):
+            flow.on_timer(current_time)
+            if flow.finished:
+                del self.flows[client_addr]
+                flow.report()
+                self.report_stats(flow)
+            elif flow.base < flow.total_bytes:
+                flow.fill_window()
+        
+        if self.pacing_offload:
+            self.update_max_pacing_rate()
+    
+    def update_max_pacing_rate(self):
+        """Let the kernel smooth the bursts user-space pacing still allows.
+
+        The socket is shared, so its cap is the sum of the flows' rates;
+        unlimited while any flow is unpaced. Only changes of more than
+        1/8 are passed down, to keep setsockopt() off the per-ACK path.
+        """
+        rates = [flow.pacing_rate() for flow in self.flows.values()]
+        rate = None if not rates or None in rates else sum(rates)
+        if rate == self.max_pacing_rate:
+            return
+        if rate is not None and self.max_pacing_rate is not None:
+            if abs(rate - self.max_pacing_rate) < self.max_pacing_rate / 8:
+                return
+        set_max_pacing_rate(self.sock, rate)
+        self.max_pacing_rate = rate
+    
+    def report_stats(self, flow):
+        """Update the worker totals and forward them to the supervisor"""
+        self.flows_served += 1
+        self.bytes_served += flow.base
+        if self.stats_fd is None:
+            return
+        duration = max(time.time() - flow.start_time, 1e-9)
+        # One short line per write() stays atomic on the shared pipe
+        line = (f"worker={self.worker_id} pid={os.getpid()} flows={self.flows_served} "
+                f"bytes={self.bytes_served} active={len(self.flows)} "
+                f"last_mbps={flow.base * 8 / duration / 1_000_000:.2f}\n")
+        os.write(self.stats_fd, line.encode())
+    
+    def send_file(self, client_addr, filename):
+        """Send file to one client, serving any other flows meanwhile"""
+        flow = self.start_transfer(client_addr, filename)
+        while flow is not None and client_addr in self.flows:
+            self.poll()
     
     def run(self):
         """Main server loop"""
-        print("Waiting for client request...")
+        print("Waiting for client requests...")
+        warm_digest('data.txt')
         
         while True:
             try:
-                # Set blocking timeout for initial request
-                self.sock.settimeout(None)
-                data, client_addr = self.sock.recvfrom(MAX_PAYLOAD)
-                if len(data) > 0:
-                    print(f"Received request from {client_addr}")
-                    self.send_file(client_addr, 'data.txt')
-                    print("\nWaiting for next client request...")
+                self.poll()
             
             except KeyboardInterrupt:
                 print("\nServer shutting down")
                 break
             except Exception as e:
                 print(f"An error occurred: {e}")
-                
+        
+        for flow in self.flows.values():
+            flow.close()
+        self.selector.close()
         self.sock.close()
 
+def run_workers(server_ip, server_port, num_workers, **server_options):
+    """Supervisor: fork num_workers servers sharing the port via SO_REUSEPORT.
+
+    Each worker maps data.txt itself (read-only pages are shared through the
+    page cache) and writes a stats line to a shared pipe after every
+    completed transfer; the supervisor prints them with running totals.
+    """
+    warm_digest('data.txt')  # Hashed once, the workers inherit the cache
+    read_fd, write_fd = os.pipe()
+    worker_pids = []
+    for worker_id in range(num_workers):
+        sys.stdout.flush()  # Don't duplicate buffered output into the child
+        pid = os.fork()
+        if pid == 0:
+            # Never unwind into the supervisor's code below: the worker
+            # leaves only through os._exit()
+            status = 1
+            try:
+                os.close(read_fd)
+                server = ReliableUDPServer(server_ip, server_port, reuse_port=True,
+                                           worker_id=worker_id, stats_fd=write_fd,
+                                           **server_options)
+                server.run()
+                status = 0
+            except Exception as e:
+                print(f"Worker {worker_id} failed: {e}")
+            finally:
+                os.close(write_fd)
+                sys.stdout.flush()
+                os._exit(status)
+        worker_pids.append(pid)
+    os.close(write_fd)
+    print(f"Supervisor (pid {os.getpid()}) started {num_workers} workers on {server_ip}:{server_port}")
+    
+    totals = {}  # worker_id -> (flows, bytes)
+    try:
+        with os.fdopen(read_fd) as stats:
+            for line in stats:
+                fields = dict(field.split('=', 1) for field in line.split())
+                totals[fields['worker']] = (int(fields['flows']), int(fields['bytes']))
+                total_flows = sum(flows for flows, _ in totals.values())
+                total_mb = sum(nbytes for _, nbytes in totals.values()) / 1_000_000
+                print(f"[stats] {line.strip()} | all workers: flows={total_flows} MB={total_mb:.1f}")
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        print("\nSupervisor shutting down")
+    finally:
+        for pid in worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in worker_pids:
+            os.waitpid(pid, 0)
+
+def parse_options(args):
+    """Parse trailing --flag / --name=value options into a dict"""
+    options = {}
+    for arg in args:
+        if not arg.startswith('--'):
+            raise ValueError(f"unexpected argument {arg}")
+        name, _, value = arg[2:].partition('=')
+        options[name] = value if value else True
+    return options
+
+USAGE = ("Usage: python3 p2_server.py <SERVER_IP> <SERVER_PORT> [--gso] [--workers=N]\n"
+         "       [--pacing[=GAIN]] [--pacing-offload] [--cc=" + "|".join(CONGESTION_CONTROLLERS) + "] [--rack]\n"
+         "       [--rto-min=SECONDS] [--rto-max=SECONDS] [--fec]")
+
 def main():
-    if len(sys.argv) != 3:
-        # Changed SWS to INITIAL_CWND
-        print("Usage: python3 p1_server.py <SERVER_IP> <SERVER_PORT>")
+    try:
+        options = parse_options(sys.argv[3:])
+        num_workers = int(options.pop('workers', 1))
+        gso = options.pop('gso', False)
+        pacing = options.pop('pacing', None)
+        pacing_gain = PACING_GAIN if pacing is True else (float(pacing) if pacing else None)
+        pacing_offload = options.pop('pacing-offload', False)
+        congestion_control = options.pop('cc', 'cubic')
+        if congestion_control not in CONGESTION_CONTROLLERS:
+            raise ValueError(f"unknown congestion control {congestion_control}")
+        rack = options.pop('rack', False)
+        min_rto = float(options.pop('rto-min', MIN_RTO))
+        max_rto = float(options.pop('rto-max', MAX_RTO))
+        if not 0 < min_rto <= max_rto:
+            raise ValueError("RTO bounds out of order")
+        fec = options.pop('fec', False)
+        if len(sys.argv) < 3 or options or (pacing_offload and pacing_gain is None):
+            raise ValueError(f"unknown options {options}")
+    except ValueError:
+        print(USAGE)
         sys.exit(1)
     
     server_ip = sys.argv[1]
     server_port = int(sys.argv[2])
     
+    if num_workers > 1:
+        run_workers(server_ip, server_port, num_workers, gso=gso,
+                    pacing_gain=pacing_gain, pacing_offload=pacing_offload,
+                    congestion_control=congestion_control, rack=rack,
+                    min_rto=min_rto, max_rto=max_rto, fec=fec)
+        return
+    
     # Pass initial_cwnd instead of sws
-    server = ReliableUDPServer(server_ip, server_port)
+    server = ReliableUDPServer(server_ip, server_port, gso=gso,
+                               pacing_gain=pacing_gain, pacing_offload=pacing_offload,
+                               congestion_control=congestion_control, rack=rack,
+                               min_rto=min_rto, max_rto=max_rto, fec=fec)
     server.run()
 
 if __name__ == "__main__":